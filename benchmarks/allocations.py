@@ -0,0 +1,98 @@
+# coding: utf-8
+
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+"""Report memory allocated by diff_notebooks and merge_notebooks.
+
+Runs each operation on the largest test notebooks under tracemalloc,
+and prints the peak number of bytes allocated during the call and the
+number of bytes still held by its result. Compare the output before and
+after a change to see allocation regressions in the diff and merge paths:
+
+    python benchmarks/allocations.py
+    python benchmarks/allocations.py base.ipynb local.ipynb remote.ipynb
+"""
+
+from __future__ import print_function, unicode_literals
+
+import argparse
+import glob
+import logging
+import os
+import sys
+import tracemalloc
+
+import nbformat
+
+from nbdime import diff_notebooks, merge_notebooks
+from nbdime.log import set_nbdime_log_level
+
+
+here = os.path.dirname(os.path.abspath(__file__))
+files = os.path.join(here, os.pardir, "nbdime", "tests", "files")
+
+# Use the triplets with the largest total size by default
+DEFAULT_COUNT = 3
+
+
+def default_triplets(count=DEFAULT_COUNT):
+    "Return the largest '<name>--{1,2,3}.ipynb' test notebook triplets."
+    triplets = []
+    for fn in glob.glob(os.path.join(files, "*--1.ipynb")):
+        names = [fn[:-len("1.ipynb")] + "%d.ipynb" % i for i in (1, 2, 3)]
+        if all(os.path.exists(n) for n in names):
+            triplets.append(names)
+    triplets.sort(key=lambda t: sum(os.path.getsize(n) for n in t), reverse=True)
+    return triplets[:count]
+
+
+def measure(func, *args):
+    "Return peak bytes allocated while calling func, and bytes held by its result."
+    tracemalloc.start()
+    try:
+        result = func(*args)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return peak, current
+
+
+def run(triplets, repeat):
+    print("{:<40} {:>8} {:>14} {:>14}".format("notebooks", "op", "peak bytes", "result bytes"))
+    for names in triplets:
+        base, local, remote = [nbformat.read(n, as_version=4) for n in names]
+        label = os.path.basename(names[0])
+        for op, func, args in [
+                ("diff", diff_notebooks, (base, local)),
+                ("merge", merge_notebooks, (base, local, remote)),
+                ]:
+            # Use the smallest of repeated measurements, to ignore one time
+            # allocations such as caches and imports
+            peak, current = min(measure(func, *args) for _ in range(repeat))
+            print("{:<40} {:>8} {:>14,} {:>14,}".format(label, op, peak, current))
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("notebooks", nargs="*",
+                        help="base, local and remote notebooks to measure, "
+                             "defaults to the largest test notebooks")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="number of measurements per operation")
+    opts = parser.parse_args(args)
+    # Keep autoresolve warnings out of the report
+    set_nbdime_log_level(logging.ERROR)
+    if opts.notebooks:
+        if len(opts.notebooks) != 3:
+            parser.error("expected three notebooks: base, local and remote")
+        triplets = [opts.notebooks]
+    else:
+        triplets = default_triplets()
+    run(triplets, opts.repeat)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -36,9 +36,13 @@ import {
 } from './common';
 
 import {
-  RenderableOutputView
+  RenderableOutputView, LazyOutputView
 } from './output';
 
+import {
+  hasBlobRefs
+} from '../../request';
+
 import {
   CellDiffModel, IDiffModel, StringDiffModel, OutputDiffModel,
   ImmutableDiffModel
@@ -171,6 +175,41 @@ class CellDiffWidget extends Panel {
     return container;
   }
 
+  /**
+   * Create the view of an output.
+   */
+  static
+  createOutputView(model: OutputDiffModel, editorClasses: string[],
+                   rendermime: IRenderMime): Widget {
+    let view: Widget | null = null;
+    // Take one of three actions, depending on output types
+    // 1) Text-type output: Show a MergeView with text diff.
+    // 2) Renderable types: Side-by-side comparison.
+    // 3) Unknown types: Stringified JSON diff.
+    // If the model is one-sided or unchanged, option 2) is preferred to 1)
+    let renderable = RenderableOutputView.canRenderUntrusted(model);
+    for (let mt of rendermime.order) {
+      let key = model.hasMimeType(mt);
+      if (key) {
+        if (!renderable ||
+            !(model.added || model.deleted || model.unchanged) &&
+            valueIn(mt, stringDiffMimeTypes)) {
+          // 1.
+          view = createNbdimeMergeView(model.stringify(key));
+        } else if (renderable) {
+          // 2.
+          view = new RenderableOutputView(model, editorClasses, rendermime);
+        }
+        break;
+      }
+    }
+    if (!view) {
+      // 3.
+      view = createNbdimeMergeView(model.stringify());
+    }
+    return view;
+  }
+
   /**
    * Create a new sub-view.
    */
@@ -185,30 +224,13 @@ class CellDiffWidget extends Panel {
         view = createNbdimeMergeView(model);
       }
     } else if (model instanceof OutputDiffModel) {
-      // Take one of three actions, depending on output types
-      // 1) Text-type output: Show a MergeView with text diff.
-      // 2) Renderable types: Side-by-side comparison.
-      // 3) Unknown types: Stringified JSON diff.
-      // If the model is one-sided or unchanged, option 2) is preferred to 1)
-      let renderable = RenderableOutputView.canRenderUntrusted(model);
-      for (let mt of rendermime.order) {
-        let key = model.hasMimeType(mt);
-        if (key) {
-          if (!renderable ||
-              !(model.added || model.deleted || model.unchanged) &&
-              valueIn(mt, stringDiffMimeTypes)) {
-            // 1.
-            view = createNbdimeMergeView(model.stringify(key));
-          } else if (renderable) {
-            // 2.
-            view = new RenderableOutputView(model, editorClasses, rendermime);
-          }
-          break;
-        }
-      }
-      if (!view) {
-        // 3.
-        view = createNbdimeMergeView(model.stringify());
+      if (hasBlobRefs([model.base, model.remote, model.diff])) {
+        // Fetch large values of the output only when displayed
+        view = new LazyOutputView(model, (resolved: OutputDiffModel) => {
+          return CellDiffWidget.createOutputView(resolved, editorClasses, rendermime);
+        });
+      } else {
+        view = CellDiffWidget.createOutputView(model, editorClasses, rendermime);
       }
     } else {
       throw new Error('Unrecognized model type.');
@@ -14,18 +14,30 @@ import {
   nbformat
 } from 'jupyterlab/lib/notebook/notebook/nbformat';
 
+import {
+  Message
+} from 'phosphor/lib/core/messaging';
+
 import {
   Widget
 } from 'phosphor/lib/ui/widget';
 
 import {
-  PanelLayout
+  Panel, PanelLayout
 } from 'phosphor/lib/ui/panel';
 
 import {
   valueIn
 } from '../../common/util';
 
+import {
+  patch
+} from '../../patch';
+
+import {
+  resolveBlobs
+} from '../../request';
+
 import {
    OutputDiffModel
 } from '../model';
@@ -33,6 +45,8 @@ import {
 
 const RENDERED_OUTPUT_CLASS = 'jp-Diff-renderedOuput';
 
+const LAZY_OUTPUT_CLASS = 'jp-Diff-lazyOutput';
+
 /**
  * A list of outputs considered safe.
  */
@@ -132,4 +146,56 @@ class RenderableOutputView extends Widget {
 
   _sanitized: boolean;
   _rendermime: IRenderMime;
-}
\ No newline at end of file
+}
+
+
+/**
+ * Widget for outputs holding blob references.
+ *
+ * The blobs are fetched when the widget is attached, after which the
+ * view of the output is created by `createView` from the resolved model.
+ */
+export
+class LazyOutputView extends Panel {
+  constructor(model: OutputDiffModel, createView: (model: OutputDiffModel) => Widget) {
+    super();
+    this.addClass(LAZY_OUTPUT_CLASS);
+    this._model = model;
+    this._createView = createView;
+    this._placeholder = new Widget();
+    this._placeholder.node.textContent = 'Loading output...';
+    this.addWidget(this._placeholder);
+  }
+
+  /**
+   * A message handler invoked on an `'after-attach'` message.
+   */
+  protected onAfterAttach(msg: Message): void {
+    super.onAfterAttach(msg);
+    if (this._requested) {
+      return;
+    }
+    this._requested = true;
+    let model = this._model;
+    let value = {base: model.base, remote: model.remote, diff: model.diff};
+    resolveBlobs(value, (resolved: any) => {
+      model.base = resolved.base;
+      model.diff = resolved.diff;
+      if (model.base && model.diff) {
+        // The remote output was patched before the blobs were resolved
+        model.remote = patch(model.base, model.diff);
+      } else {
+        model.remote = resolved.remote;
+      }
+      this._placeholder.dispose();
+      this.addWidget(this._createView(model));
+    }, (error: any) => {
+      this._placeholder.node.textContent = 'Failed to load output: ' + error;
+    });
+  }
+
+  protected _model: OutputDiffModel;
+  protected _createView: (model: OutputDiffModel) => Widget;
+  protected _placeholder: Widget;
+  protected _requested = false;
+}
@@ -28,8 +28,171 @@ function requestJson(url: string, argument: any, callback: (result: any) => void
   xhttp.send(JSON.stringify(argument));
 }
 
+/**
+ * Reference to a large value stored once on the server, as written by
+ * the server when a diff is requested with `blobs: true`.
+ */
+export
+interface IBlobRef {
+  $blob: string;
+  size: number;
+}
+
+
+/**
+ * Check whether a value is a blob reference.
+ */
+export
+function isBlobRef(value: any): value is IBlobRef {
+  return value !== null && typeof value === 'object' &&
+    !Array.isArray(value) && typeof value.$blob === 'string' &&
+    Object.keys(value).length === 2 && 'size' in value;
+}
+
+
+/**
+ * Values of blobs fetched so far, by key. Blobs are content addressed,
+ * so a cached value never goes stale.
+ */
+const blobCache: {[key: string]: any} = {};
+
+
+/**
+ * Fetch the value of a blob from the server, at most once per key.
+ */
+export
+function requestBlob(key: string, callback: (result: any) => void, onError: (result: any) => void) {
+  if (blobCache.hasOwnProperty(key)) {
+    callback(blobCache[key]);
+    return;
+  }
+  let xhttp = new XMLHttpRequest();
+  xhttp.onreadystatechange = function() {
+    if (xhttp.readyState === 4) {
+      if (xhttp.status === 200) {
+        let value = JSON.parse(xhttp.responseText);
+        blobCache[key] = value;
+        callback(value);
+      } else {
+        onError(xhttp.responseText);
+      }
+    }
+  };
+  xhttp.open('GET', '/api/blob/' + key, true);
+  xhttp.send();
+}
+
+
+/**
+ * Check whether value is the outputs of a cell or a diff entry changing
+ * them, given the key of value in its parent object.
+ */
+function isOutputs(value: any, key: string): boolean {
+  return key === 'outputs' || (
+    value !== null && typeof value === 'object' &&
+    typeof value.op === 'string' && value.key === 'outputs');
+}
+
+
+/**
+ * Collect the keys of all blob references in value, except within
+ * outputs if skipOutputs is true.
+ */
+function collectBlobKeys(value: any, keys: {[key: string]: boolean}, skipOutputs: boolean) {
+  if (isBlobRef(value)) {
+    keys[value.$blob] = true;
+  } else if (Array.isArray(value)) {
+    for (let v of value) {
+      if (!skipOutputs || !isOutputs(v, '')) {
+        collectBlobKeys(v, keys, skipOutputs);
+      }
+    }
+  } else if (value !== null && typeof value === 'object') {
+    for (let k of Object.keys(value)) {
+      if (!skipOutputs || !isOutputs(value[k], k)) {
+        collectBlobKeys(value[k], keys, skipOutputs);
+      }
+    }
+  }
+}
+
+
+/**
+ * Replace blob references in value with cached blob values, in place,
+ * except within outputs if skipOutputs is true.
+ */
+function substituteBlobs(value: any, skipOutputs: boolean): any {
+  if (isBlobRef(value)) {
+    return blobCache[value.$blob];
+  } else if (Array.isArray(value)) {
+    for (let i = 0; i < value.length; ++i) {
+      if (!skipOutputs || !isOutputs(value[i], '')) {
+        value[i] = substituteBlobs(value[i], skipOutputs);
+      }
+    }
+  } else if (value !== null && typeof value === 'object') {
+    for (let k of Object.keys(value)) {
+      if (!skipOutputs || !isOutputs(value[k], k)) {
+        value[k] = substituteBlobs(value[k], skipOutputs);
+      }
+    }
+  }
+  return value;
+}
+
+
+/**
+ * Check whether value holds any blob references.
+ */
+export
+function hasBlobRefs(value: any): boolean {
+  let keySet: {[key: string]: boolean} = {};
+  collectBlobKeys(value, keySet, false);
+  return Object.keys(keySet).length > 0;
+}
+
+
+/**
+ * Resolve the blob references in a value, fetching each distinct
+ * blob only once. Calls callback with the resolved value.
+ *
+ * If skipOutputs is true, references within cell outputs are left
+ * for the output views to resolve when they are displayed.
+ */
+export
+function resolveBlobs(value: any, callback: (result: any) => void, onError: (result: any) => void,
+                      skipOutputs = false) {
+  let keySet: {[key: string]: boolean} = {};
+  collectBlobKeys(value, keySet, skipOutputs);
+  let keys = Object.keys(keySet);
+  let remaining = keys.length;
+  let failed = false;
+  if (remaining === 0) {
+    callback(value);
+    return;
+  }
+  for (let key of keys) {
+    requestBlob(key, () => {
+      remaining -= 1;
+      if (remaining === 0 && !failed) {
+        callback(substituteBlobs(value, skipOutputs));
+      }
+    }, (error: any) => {
+      if (!failed) {
+        failed = true;
+        onError(error);
+      }
+    });
+  }
+}
+
+
 /**
  * Make a diff request for the given base/remote specifiers (filenames)
+ *
+ * Large values in the diff are transferred as blob references. Those
+ * within cell outputs are resolved by the output views when displayed,
+ * see LazyOutputView, and the others before onComplete is called.
  */
 export
 function requestDiff(
@@ -37,8 +200,10 @@ function requestDiff(
     onComplete: (result: any) => void,
     onFail: (result: any) => void) {
   requestJson('/api/diff',
-              {base, remote},
-              onComplete,
+              {base, remote, blobs: true},
+              (result: any) => {
+                resolveBlobs(result, onComplete, onFail, true);
+              },
               onFail);
 }
 
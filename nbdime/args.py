@@ -76,6 +76,70 @@ def add_diff_args(parser):
     pass
 
 
+def cell_range(value):
+    """Parses a range of cells on the form 'START:STOP', where either may be omitted.
+    """
+    parts = value.split(":")
+    try:
+        if len(parts) != 2:
+            raise ValueError
+        start, stop = [int(p) if p.strip() else None for p in parts]
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            "invalid cell range %r, expected START:STOP" % value)
+    return start, stop
+
+
+def add_diff_filter_args(parser):
+    """Adds arguments for selecting the parts of notebooks to diff.
+    """
+    parser.add_argument(
+        '--cells',
+        default=None,
+        type=cell_range,
+        metavar="START:STOP",
+        help="only diff the base cells START to STOP (exclusive) "
+             "with the aligned cells of the other notebook.")
+    parser.add_argument(
+        '--include',
+        action="append",
+        default=[],
+        metavar="PATH",
+        help="only diff the values at paths matching PATH, e.g. "
+             "'/cells/*/source'. Can be given multiple times.")
+    parser.add_argument(
+        '--exclude',
+        action="append",
+        default=[],
+        metavar="PATH",
+        help="skip the values at paths matching PATH, e.g. "
+             "'/cells/*/outputs'. Can be given multiple times.")
+
+
+def diff_filters_from_args(args):
+    """Returns the path filters for diff_notebooks given by the filter arguments.
+    """
+    return list(args.include) + ["!" + path for path in args.exclude]
+
+
+def add_diff_summary_args(parser):
+    """Adds arguments for commands that can summarize diffs instead of showing them.
+    """
+    summary = parser.add_mutually_exclusive_group()
+    summary.add_argument(
+        '-q', '--quiet',
+        action="store_true",
+        default=False,
+        help="only report whether the notebooks differ, with an "
+             "exit code of 1 if they do and 0 if not.")
+    summary.add_argument(
+        '--stat',
+        action="store_true",
+        default=False,
+        help="print the number of added, removed and modified cells "
+             "and of added and removed source and output lines.")
+
+
 def add_merge_args(parser):
     """Adds a set of arguments for commands that perform merges.
     """
@@ -104,6 +168,13 @@ def add_merge_args(parser):
         default=True,
         help="Disallow deletion of transient data such as outputs and "
              "execution counts in order to resolve conflicts.")
+    parser.add_argument(
+        '--rerere',
+        action="store_true",
+        default=False,
+        help="Reuse recorded resolutions of conflicts, and record the "
+             "decisions and resolutions of merges in the .git directory "
+             "of the current repository.")
 
 
 def add_filename_args(parser, names):
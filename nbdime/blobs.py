@@ -0,0 +1,229 @@
+# coding: utf-8
+
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+"""Content-addressed storage of large values in diffs.
+
+Diffs of notebooks with rich outputs are dominated by large string
+payloads (base64 images, html, widget state) carried inline by add,
+replace and addrange entries. `externalize_blobs` replaces each such
+string by a reference on the form
+
+    {"$blob": <sha256 hex digest>, "size": <number of bytes>}
+
+and stores the value once in a blob store, so that repeated values are
+stored and transferred only once. `resolve_blobs` and the `blobs`
+argument to `patch` turn references back into values.
+"""
+
+from __future__ import unicode_literals
+
+import errno
+import hashlib
+import io
+import json
+import os
+import tempfile
+from collections import OrderedDict
+
+from six import string_types
+
+from .diff_format import DiffOp, DiffEntry
+
+
+__all__ = ["MemoryBlobStore", "DirectoryBlobStore",
+           "externalize_blobs", "resolve_blobs", "resolve_diff_blobs",
+           "is_blob_ref"]
+
+
+# Key identifying a blob reference object
+BLOB_KEY = "$blob"
+
+# Strings of at least this many characters are externalized by default
+DEFAULT_BLOB_THRESHOLD = 4096
+
+
+def is_blob_ref(value):
+    "Return True if value is a blob reference."
+    return (isinstance(value, dict) and len(value) == 2 and
+            BLOB_KEY in value and "size" in value)
+
+
+def encode_blob(value):
+    "Encode a json-compatible value as canonical utf8 bytes."
+    return json.dumps(value, sort_keys=True, separators=(",", ":")).encode("utf8")
+
+
+class BlobStore(object):
+    """Base class for blob stores.
+
+    Subclasses implement _store, _load and __contains__ on blob keys,
+    which are sha256 hex digests of the encoded value.
+    """
+
+    def put(self, value):
+        "Store value if not already present, and return a reference to it."
+        data = encode_blob(value)
+        key = hashlib.sha256(data).hexdigest()
+        if key not in self:
+            self._store(key, data)
+        return {BLOB_KEY: key, "size": len(data)}
+
+    def get(self, key):
+        "Return the value stored for key, raising KeyError if missing."
+        if isinstance(key, dict):
+            key = key[BLOB_KEY]
+        return json.loads(self._load(key).decode("utf8"))
+
+    def _store(self, key, data):
+        raise NotImplementedError
+
+    def _load(self, key):
+        raise NotImplementedError
+
+    def __contains__(self, key):
+        raise NotImplementedError
+
+
+class MemoryBlobStore(BlobStore):
+    """Blob store keeping encoded values in memory.
+
+    If max_bytes is given, the least recently stored or used blobs are
+    dropped when the encoded values together exceed max_bytes. A blob
+    larger than max_bytes is kept until the next blob is stored.
+    """
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes
+        self._blobs = OrderedDict()
+        self._nbytes = 0
+
+    def put(self, value):
+        ref = BlobStore.put(self, value)
+        self._touch(ref[BLOB_KEY])
+        return ref
+
+    def _touch(self, key):
+        # Keep the most recently used last, the first are dropped first
+        self._blobs[key] = self._blobs.pop(key)
+
+    def _store(self, key, data):
+        if self.max_bytes is not None:
+            while self._blobs and self._nbytes + len(data) > self.max_bytes:
+                _, dropped = self._blobs.popitem(last=False)
+                self._nbytes -= len(dropped)
+        self._blobs[key] = data
+        self._nbytes += len(data)
+
+    def _load(self, key):
+        self._touch(key)
+        return self._blobs[key]
+
+    def __contains__(self, key):
+        return key in self._blobs
+
+    def __len__(self):
+        return len(self._blobs)
+
+
+class DirectoryBlobStore(BlobStore):
+    """Blob store keeping each encoded value in a file in a directory.
+
+    Files are named by their key, sharded on the first two characters
+    like git objects.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def _filename(self, key):
+        return os.path.join(self.path, key[:2], key[2:])
+
+    def _store(self, key, data):
+        fn = self._filename(key)
+        dirname = os.path.dirname(fn)
+        try:
+            os.makedirs(dirname)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        # Write to a temporary file first so readers never see partial blobs
+        fd, tmp = tempfile.mkstemp(dir=dirname)
+        with io.open(fd, "wb") as f:
+            f.write(data)
+        os.rename(tmp, fn)
+
+    def _load(self, key):
+        try:
+            with io.open(self._filename(key), "rb") as f:
+                return f.read()
+        except IOError:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return os.path.exists(self._filename(key))
+
+
+def _externalize_value(value, store, threshold):
+    if isinstance(value, string_types):
+        if len(value) >= threshold:
+            return store.put(value)
+        return value
+    elif isinstance(value, dict):
+        return {k: _externalize_value(v, store, threshold) for k, v in value.items()}
+    elif isinstance(value, list):
+        return [_externalize_value(v, store, threshold) for v in value]
+    else:
+        return value
+
+
+def externalize_blobs(diff, store, threshold=DEFAULT_BLOB_THRESHOLD):
+    """Return a copy of diff with large strings replaced by blob references.
+
+    Strings of at least threshold characters within values added or
+    replaced by the diff are put in store. The diff entries themselves
+    and unchanged values are kept as they are, and the input diff is not
+    modified.
+    """
+    newdiff = []
+    for e in diff:
+        op = e.op
+        if op == DiffOp.PATCH:
+            e = DiffEntry(e, diff=externalize_blobs(e.diff, store, threshold))
+        elif op in (DiffOp.ADD, DiffOp.REPLACE):
+            e = DiffEntry(e, value=_externalize_value(e.value, store, threshold))
+        elif op == DiffOp.ADDRANGE and isinstance(e.valuelist, list):
+            # Character based addranges carry a string valuelist
+            # which is kept inline
+            e = DiffEntry(e, valuelist=_externalize_value(e.valuelist, store, threshold))
+        newdiff.append(e)
+    return newdiff
+
+
+def resolve_blobs(value, store):
+    "Return value with all blob references replaced by their stored values."
+    if isinstance(value, dict):
+        if is_blob_ref(value):
+            return store.get(value[BLOB_KEY])
+        return value.__class__(
+            (k, resolve_blobs(v, store)) for k, v in value.items())
+    elif isinstance(value, list):
+        return [resolve_blobs(v, store) for v in value]
+    else:
+        return value
+
+
+def resolve_diff_blobs(diff, store):
+    "Return a copy of diff with all blob references resolved."
+    newdiff = []
+    for e in diff:
+        op = e.op
+        if op == DiffOp.PATCH:
+            e = DiffEntry(e, diff=resolve_diff_blobs(e.diff, store))
+        elif op in (DiffOp.ADD, DiffOp.REPLACE):
+            e = DiffEntry(e, value=resolve_blobs(e.value, store))
+        elif op == DiffOp.ADDRANGE:
+            e = DiffEntry(e, valuelist=resolve_blobs(e.valuelist, store))
+        newdiff.append(e)
+    return newdiff
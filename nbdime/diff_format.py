@@ -8,7 +8,6 @@ from __future__ import unicode_literals
 from six import string_types
 from six.moves import xrange as range
 import itertools
-import copy
 
 from .log import NBDiffFormatError
 
@@ -33,9 +32,8 @@ class DiffEntry(dict):
 
 def offset_op(e, n):
     "Recreate sequence diff entry with offset added to key."
-    e = DiffEntry(e)
-    e.key += n
-    return e
+    # Shallow: the new entry shares values and nested diffs with e
+    return DiffEntry(e, key=e.key + n)
 
 
 class DiffOp:
@@ -47,10 +45,12 @@ class DiffOp:
     REMOVERANGE = "removerange"
     PATCH = "patch"
 
+    # Extended format, see expand_moves for converting to the basic format
+    MOVE = "move"
+
     # For future consideration
     #KEEP = "keep"
     #KEEPRANGE = "keeprange"
-    #MOVE = "move"
     #MOVERANGE = "moverange"
 
 
@@ -86,6 +86,10 @@ def op_patch(key, diff):
     "Create a diff entry to patch value at key with diff."
     return DiffEntry(op=DiffOp.PATCH, key=key, diff=diff)
 
+def op_move(key, source, diff):
+    "Create a diff entry to insert the value at source, patched with diff, before key."
+    return DiffEntry(op=DiffOp.MOVE, key=key, source=source, diff=diff)
+
 
 class SequenceDiffBuilder(object):
 
@@ -95,6 +99,7 @@ class SequenceDiffBuilder(object):
         DiffOp.REMOVERANGE,
         #DiffOp.KEEPRANGE,
         DiffOp.PATCH,
+        DiffOp.MOVE,
         )
 
     def __init__(self):
@@ -121,7 +126,7 @@ class SequenceDiffBuilder(object):
         # Insert new entry at sorted position
         n = len(self._diff)
         pos = n
-        if entry.op == DiffOp.ADDRANGE:
+        if entry.op in (DiffOp.ADDRANGE, DiffOp.MOVE):
             # Insert addrange before removerange or patch
             while pos > 0 and self._diff[pos-1].key >= entry.key:
                 pos -= 1
@@ -238,6 +243,11 @@ def validate_diff_entry(e, deep=False):
             # (the "deep" argument is here to avoid recursion and potential O(>n) performance pitfalls)
             if deep:
                 validate_diff(e.diff, deep=deep)
+        elif op == DiffOp.MOVE:
+            if not isinstance(e.source, int):
+                raise NBDiffFormatError("move expects an index to move the value from, not '{}'.".format(e.source))
+            if deep:
+                validate_diff(e.diff, deep=deep)
         else:
             raise NBDiffFormatError("Unknown diff op '{}'.".format(op))
     elif isinstance(key, string_types) and op in MappingDiffBuilder.OPS:
@@ -273,6 +283,8 @@ def count_consumed_symbols(e):
         return (e.length, 0)
     elif op == DiffOp.PATCH:
         return (1, 1)
+    elif op == DiffOp.MOVE:
+        return (0, 1)
     else:
         raise NBDiffFormatError("Invalid op '{}'".format(op))
 
@@ -329,17 +341,17 @@ def _combine_ops(existing, new):
     if new.op in _addops:
         if existing.op == DiffOp.ADD:
             # Convert to range for compatibility
-            d = op_addrange(existing.key, [existing.value])
+            valuelist = [existing.value]
         else:
-            d = copy.deepcopy(existing)
+            valuelist = existing.valuelist
         if new.op == DiffOp.ADDRANGE:
-            d.valuelist += new.valuelist
+            added = new.valuelist
+        elif isinstance(valuelist, string_types):
+            added = new.value
         else:
-            if isinstance(d.valuelist, string_types):
-                d.valuelist += new.value
-            else:
-                d.valuelist.append(new.value)
-        return d
+            added = [new.value]
+        # Concatenation builds a new valuelist, leaving both ops unchanged
+        return op_addrange(existing.key, valuelist + added)
     elif new.op == DiffOp.REMOVERANGE:
         assert existing.op == DiffOp.REMOVERANGE
         return op_removerange(existing.key, existing.length + new.length)
@@ -362,9 +374,7 @@ def flatten_list_of_string_diff(a, linebased_diff):
             # and will have keys (=char indices) relative to line start,
             # so we simply need to offset each key with line offset
             for p in e.diff:
-                d = copy.deepcopy(p)
-                d.key += line_offset
-                charbased_diff.append(d)
+                charbased_diff.append(offset_op(p, line_offset))
         else:
             # Other ops simply have keys which refer to lines
             if op == DiffOp.ADDRANGE:
@@ -375,8 +385,7 @@ def flatten_list_of_string_diff(a, linebased_diff):
             else:
                 # Other ops simply need to adjust key as add/replace's value
                 # will already be a string
-                d = copy.deepcopy(e)
-                d.key = line_offset
+                d = DiffEntry(e, key=line_offset)
             charbased_diff.append(d)
 
     # Combine overlapping diffs
@@ -0,0 +1,129 @@
+# coding: utf-8
+
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+"""Random access to the entries of a diff by path.
+
+A diff is a tree of entries, where the entries of a patch op describe
+changes to the value at the key of the patch. Finding the changes to
+e.g. the outputs of one cell means walking down that tree. A DiffIndex
+records the location of every entry once, so that the changes at a path
+can be looked up directly and the changes under a path iterated over
+without visiting the rest of the diff.
+"""
+
+from __future__ import unicode_literals
+
+from six import string_types
+
+from .diff_format import DiffOp
+from .utils import split_path, r_is_int
+
+
+__all__ = ["DiffIndex"]
+
+
+def as_path_tuple(path):
+    """Convert a path to a tuple of keys.
+
+    Accepts strings on the form '/cells/3/source', where integer parts are
+    taken as sequence indices, or sequences of keys like ('cells', 3).
+    """
+    if isinstance(path, string_types):
+        return tuple(int(p) if r_is_int.match(p) else p
+                     for p in split_path(path))
+    return tuple(path)
+
+
+class DiffIndex(object):
+    """Index of the entries of a diff by path.
+
+    Built once from a diff, after which
+
+    - diff_at(path) returns the diff to apply to the value at path
+    - entries_at(path) returns the entries with key path[-1] in the
+      diff of the parent of path, i.e. the entries adding, removing or
+      patching the value at path
+    - iter_entries(prefix) yields all entries at or below prefix, which
+      may contain '*' to match any key, e.g. '/cells/*/source'
+
+    in time proportional to the depth of path and the size of the result.
+    Paths are strings like '/cells/3/outputs' or tuples like
+    ('cells', 3, 'outputs').
+    """
+
+    def __init__(self, diff):
+        self.diff = diff
+        # Diff applying to the value at each patched path
+        self._diffs = {}
+        # Patched child paths of each patched path, in diff order
+        self._children = {}
+        # Entries by the path of the value they change
+        self._entries = {}
+        self._add(diff, ())
+
+    def _add(self, diff, path):
+        self._diffs[path] = diff
+        children = self._children[path] = []
+        for e in diff:
+            p = path + (e.key,)
+            self._entries.setdefault(p, []).append(e)
+            if e.op == DiffOp.PATCH:
+                children.append(p)
+                self._add(e.diff, p)
+
+    def diff_at(self, path):
+        "Return the diff to apply to the value at path, empty if unchanged."
+        return self._diffs.get(as_path_tuple(path), [])
+
+    def entries_at(self, path):
+        "Return the entries changing the value at path."
+        return self._entries.get(as_path_tuple(path), [])
+
+    def __contains__(self, path):
+        "Return True if the value at path is changed by the diff."
+        return as_path_tuple(path) in self._entries
+
+    def _match(self, pattern):
+        "Return patched paths matching pattern, where '*' matches any key."
+        paths = [()]
+        for k in pattern:
+            if k == "*":
+                paths = [c for p in paths for c in self._children[p]]
+            else:
+                paths = [p + (k,) for p in paths if p + (k,) in self._diffs]
+        return paths
+
+    def _iter_below(self, path):
+        for e in self._diffs[path]:
+            p = path + (e.key,)
+            yield p, e
+            if e.op == DiffOp.PATCH:
+                for item in self._iter_below(p):
+                    yield item
+
+    def iter_entries(self, prefix=()):
+        """Iterate over (path, entry) for the entries at or below prefix.
+
+        The path of an entry is the path of the value it changes, the path
+        of its diff followed by its key. Entries are yielded depth first,
+        in diff order.
+        """
+        prefix = as_path_tuple(prefix)
+        if not prefix:
+            for item in self._iter_below(()):
+                yield item
+            return
+        key = prefix[-1]
+        for parent in self._match(prefix[:-1]):
+            if key == "*":
+                entries = self._diffs[parent]
+            else:
+                entries = self._entries.get(parent + (key,), [])
+            for e in entries:
+                p = parent + (e.key,)
+                yield p, e
+                if e.op == DiffOp.PATCH:
+                    for item in self._iter_below(p):
+                        yield item
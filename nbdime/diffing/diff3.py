@@ -0,0 +1,783 @@
+# coding: utf-8
+
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+"""Line based two- and three-way merging of text, in process.
+
+This follows the algorithms of the xdiff library used by git, such that
+merge_text produces the same output as 'git merge-file -p', and
+line_changes the same changes as 'git diff', without writing files or
+spawning processes. Among the many alignments
+of equal length, git picks one by the details of its implementation of
+Myers' algorithm, which is therefore reproduced here instead of using
+the sequence diff of nbdime.
+"""
+
+from __future__ import unicode_literals
+
+import re
+import sys
+
+from six.moves import xrange as range
+
+__all__ = ["split_lines", "line_changes", "merge_text"]
+
+
+# Conflict markers are this many characters wide, like in git
+marker_size = 7
+
+_re_alnum = re.compile(r"[A-Za-z0-9]")
+
+
+def split_lines(text):
+    """Split text into lines on newlines only, keeping the line endings."""
+    parts = text.split("\n")
+    lines = [p + "\n" for p in parts[:-1]]
+    if parts[-1]:
+        lines.append(parts[-1])
+    return lines
+
+
+class _Lines(object):
+    """Lines of a file, with a flag for each line changed by a diff.
+
+    The flags list has an extra unchanged entry at the end, which is also
+    found at index -1, so that the groups of changed lines can be scanned
+    without bounds checks, like in xdiff.
+    """
+    def __init__(self, lines):
+        self.lines = lines
+        self.n = len(lines)
+        self.changed = [0] * (self.n + 1)
+
+
+class _Group(object):
+    "A group [start, end) of changed lines, empty between unchanged lines."
+    def __init__(self, f):
+        self.start = self.end = 0
+        while f.changed[self.end]:
+            self.end += 1
+
+    def next(self, f):
+        if self.end == f.n:
+            return False
+        self.start = self.end + 1
+        self.end = self.start
+        while f.changed[self.end]:
+            self.end += 1
+        return True
+
+    def previous(self, f):
+        if self.start == 0:
+            return False
+        self.end = self.start - 1
+        self.start = self.end
+        while f.changed[self.start - 1]:
+            self.start -= 1
+        return True
+
+    def slide_down(self, f):
+        if self.end < f.n and f.lines[self.start] == f.lines[self.end]:
+            f.changed[self.start] = 0
+            f.changed[self.end] = 1
+            self.start += 1
+            self.end += 1
+            while f.changed[self.end]:
+                self.end += 1
+            return True
+        return False
+
+    def slide_up(self, f):
+        if self.start > 0 and f.lines[self.start - 1] == f.lines[self.end - 1]:
+            self.start -= 1
+            self.end -= 1
+            f.changed[self.start] = 1
+            f.changed[self.end] = 0
+            while f.changed[self.start - 1]:
+                self.start -= 1
+            return True
+        return False
+
+
+# Parameters of the indent heuristic of git diff
+_max_indent = 200
+_max_blanks = 20
+_start_of_file_penalty = 1
+_end_of_file_penalty = 21
+_total_blank_weight = -30
+_post_blank_weight = 6
+_relative_indent_penalty = -4
+_relative_indent_with_blank_penalty = 10
+_relative_outdent_penalty = 24
+_relative_outdent_with_blank_penalty = 17
+_relative_dedent_penalty = 23
+_relative_dedent_with_blank_penalty = 17
+_indent_weight = 60
+_indent_heuristic_max_sliding = 100
+
+_whitespace = " \t\n\v\f\r"
+
+
+def _get_indent(line):
+    "Return the indentation width of a line, or -1 for blank lines."
+    ret = 0
+    for c in line:
+        if c not in _whitespace:
+            return ret
+        elif c == " ":
+            ret += 1
+        elif c == "\t":
+            ret += 8 - ret % 8
+        if ret >= _max_indent:
+            return _max_indent
+    return -1
+
+
+def _split_score(lines, split):
+    """Score splitting lines before lines[split] between changed and
+    unchanged lines, returning (effective indent, penalty)."""
+    n = len(lines)
+    if split >= n:
+        end_of_file = True
+        indent = -1
+    else:
+        end_of_file = False
+        indent = _get_indent(lines[split])
+
+    pre_blank = 0
+    pre_indent = -1
+    for i in range(split - 1, -1, -1):
+        pre_indent = _get_indent(lines[i])
+        if pre_indent != -1:
+            break
+        pre_blank += 1
+        if pre_blank == _max_blanks:
+            pre_indent = 0
+            break
+
+    post_blank = 0
+    post_indent = -1
+    for i in range(split + 1, n):
+        post_indent = _get_indent(lines[i])
+        if post_indent != -1:
+            break
+        post_blank += 1
+        if post_blank == _max_blanks:
+            post_indent = 0
+            break
+
+    penalty = 0
+    if pre_indent == -1 and pre_blank == 0:
+        penalty += _start_of_file_penalty
+    if end_of_file:
+        penalty += _end_of_file_penalty
+
+    post_blank = 1 + post_blank if indent == -1 else 0
+    total_blank = pre_blank + post_blank
+    penalty += _total_blank_weight * total_blank
+    penalty += _post_blank_weight * post_blank
+
+    if indent == -1:
+        indent = post_indent
+    any_blanks = total_blank != 0
+
+    if indent == -1 or pre_indent == -1 or indent == pre_indent:
+        pass
+    elif indent > pre_indent:
+        penalty += (_relative_indent_with_blank_penalty if any_blanks
+                    else _relative_indent_penalty)
+    elif post_indent != -1 and post_indent > indent:
+        penalty += (_relative_outdent_with_blank_penalty if any_blanks
+                    else _relative_outdent_penalty)
+    else:
+        penalty += (_relative_dedent_with_blank_penalty if any_blanks
+                    else _relative_dedent_penalty)
+    return indent, penalty
+
+
+def _score_cmp(s1, s2):
+    cmp_indents = (s1[0] > s2[0]) - (s1[0] < s2[0])
+    return _indent_weight * cmp_indents + (s1[1] - s2[1])
+
+
+def _compact(f, other, indent_heuristic=False):
+    """Shift groups of changed lines in f to a canonical position.
+
+    Groups are merged with neighbouring groups they can be shifted into,
+    and placed as far down as possible, unless they can be aligned with a
+    group of changes in the other file, or placed where the indentation
+    of the lines suggests with indent_heuristic. This is
+    xdl_change_compact.
+    """
+    g = _Group(f)
+    go = _Group(other)
+    while True:
+        if g.end != g.start:
+            while True:
+                groupsize = g.end - g.start
+                end_matching_other = -1
+
+                # Shift the group up as far as possible
+                while g.slide_up(f):
+                    assert go.previous(other)
+                earliest_end = g.end
+                if go.end > go.start:
+                    end_matching_other = g.end
+
+                # Then shift it down as far as possible
+                while g.slide_down(f):
+                    assert go.next(other)
+                    if go.end > go.start:
+                        end_matching_other = g.end
+
+                if groupsize == g.end - g.start:
+                    break
+
+            if g.end == earliest_end:
+                # No shifting was possible
+                pass
+            elif end_matching_other != -1:
+                # Align with the last group of changes in the other file
+                while go.end == go.start:
+                    assert g.slide_up(f)
+                    assert go.previous(other)
+            elif indent_heuristic:
+                # Pick the shift with the best scores for the splits
+                # before and after the group
+                shift = max(earliest_end, g.end - groupsize - 1,
+                            g.end - _indent_heuristic_max_sliding)
+                best_shift = -1
+                best_score = None
+                while shift <= g.end:
+                    indent1, penalty1 = _split_score(f.lines, shift)
+                    indent2, penalty2 = _split_score(f.lines, shift - groupsize)
+                    score = (indent1 + indent2, penalty1 + penalty2)
+                    if best_shift == -1 or _score_cmp(score, best_score) <= 0:
+                        best_score = score
+                        best_shift = shift
+                    shift += 1
+                while g.end > best_shift:
+                    assert g.slide_up(f)
+                    assert go.previous(other)
+
+        if not g.next(f):
+            break
+        assert go.next(other)
+
+
+# Parameters of the xdiff implementation of Myers' algorithm
+_max_cost_min = 256
+_heur_min_cost = 256
+_snake_cnt = 20
+_k_heur = 4
+_simscan_window = 100
+_kpdis_run = 4
+_max_eqlimit = 1024
+_line_max = sys.maxsize
+
+
+def _bogosqrt(n):
+    "Approximate square root, as used for the xdiff cost limits."
+    i = 1
+    while n > 0:
+        i <<= 1
+        n >>= 2
+    return i
+
+
+def _clean_mmatch(dis, i, s, e):
+    """Whether to discard a line with many matches, found within a run of
+    lines without matches."""
+    s = max(s, i - _simscan_window)
+    e = min(e, i + _simscan_window)
+    rdis0 = 0
+    rpdis0 = 1
+    r = 1
+    while i - r >= s:
+        if not dis[i - r]:
+            rdis0 += 1
+        elif dis[i - r] == 2:
+            rpdis0 += 1
+        else:
+            break
+        r += 1
+    if rdis0 == 0:
+        return False
+    rdis1 = 0
+    rpdis1 = 1
+    r = 1
+    while i + r <= e:
+        if not dis[i + r]:
+            rdis1 += 1
+        elif dis[i + r] == 2:
+            rpdis1 += 1
+        else:
+            break
+        r += 1
+    if rdis1 == 0:
+        return False
+    rdis1 += rdis0
+    rpdis1 += rpdis0
+    return rpdis1 * _kpdis_run < rpdis1 + rdis1
+
+
+def _cleanup_records(f, ha, counts, dstart, dend):
+    """Flag the lines of f without matches in the other file as changed.
+
+    Returns the indices and hashes of the remaining lines to diff.
+    """
+    mlim = min(_bogosqrt(f.n), _max_eqlimit)
+    dis = [0] * (f.n + 1)
+    for i in range(dstart, dend + 1):
+        nm = counts.get(ha[i], 0)
+        dis[i] = 0 if nm == 0 else 2 if nm >= mlim else 1
+    rindex = []
+    rha = []
+    for i in range(dstart, dend + 1):
+        if dis[i] == 1 or (dis[i] == 2 and not _clean_mmatch(dis, i, dstart, dend)):
+            rindex.append(i)
+            rha.append(ha[i])
+        else:
+            f.changed[i] = 1
+    return rindex, rha
+
+
+def _split(ha1, off1, lim1, ha2, off2, lim2, kvdf, kvdb, need_min, mxcost):
+    """Find the middle snake of the box, or a good enough split point
+    if the cost gets too high.
+
+    Returns (i1, i2, min_lo, min_hi), with min_lo and min_hi telling
+    whether the halves must be diffed minimally.
+    """
+    dmin = off1 - lim2
+    dmax = lim1 - off2
+    fmid = off1 - off2
+    bmid = lim1 - lim2
+    odd = (fmid - bmid) & 1
+    fmin = fmax = fmid
+    bmin = bmax = bmid
+    kvdf[fmid] = off1
+    kvdb[bmid] = lim1
+
+    ec = 0
+    while True:
+        ec += 1
+        got_snake = False
+
+        # Extend the forward diagonals by one
+        if fmin > dmin:
+            fmin -= 1
+            kvdf[fmin - 1] = -1
+        else:
+            fmin += 1
+        if fmax < dmax:
+            fmax += 1
+            kvdf[fmax + 1] = -1
+        else:
+            fmax -= 1
+
+        for d in range(fmax, fmin - 1, -2):
+            if kvdf[d - 1] >= kvdf[d + 1]:
+                i1 = kvdf[d - 1] + 1
+            else:
+                i1 = kvdf[d + 1]
+            prev1 = i1
+            i2 = i1 - d
+            while i1 < lim1 and i2 < lim2 and ha1[i1] == ha2[i2]:
+                i1 += 1
+                i2 += 1
+            if i1 - prev1 > _snake_cnt:
+                got_snake = True
+            kvdf[d] = i1
+            if odd and bmin <= d <= bmax and kvdb[d] <= i1:
+                return i1, i2, True, True
+
+        # Extend the backward diagonals by one
+        if bmin > dmin:
+            bmin -= 1
+            kvdb[bmin - 1] = _line_max
+        else:
+            bmin += 1
+        if bmax < dmax:
+            bmax += 1
+            kvdb[bmax + 1] = _line_max
+        else:
+            bmax -= 1
+
+        for d in range(bmax, bmin - 1, -2):
+            if kvdb[d - 1] < kvdb[d + 1]:
+                i1 = kvdb[d - 1]
+            else:
+                i1 = kvdb[d + 1] - 1
+            prev1 = i1
+            i2 = i1 - d
+            while i1 > off1 and i2 > off2 and ha1[i1 - 1] == ha2[i2 - 1]:
+                i1 -= 1
+                i2 -= 1
+            if prev1 - i1 > _snake_cnt:
+                got_snake = True
+            kvdb[d] = i1
+            if not odd and fmin <= d <= fmax and i1 <= kvdf[d]:
+                return i1, i2, True, True
+
+        if need_min:
+            continue
+
+        # Past the heuristic trigger, split at a diagonal reaching far
+        # into the box through a long snake
+        if got_snake and ec > _heur_min_cost:
+            best = 0
+            for d in range(fmax, fmin - 1, -2):
+                dd = abs(d - fmid)
+                i1 = kvdf[d]
+                i2 = i1 - d
+                v = (i1 - off1) + (i2 - off2) - dd
+                if (v > _k_heur * ec and v > best and
+                        off1 + _snake_cnt <= i1 < lim1 and
+                        off2 + _snake_cnt <= i2 < lim2):
+                    k = 1
+                    while ha1[i1 - k] == ha2[i2 - k]:
+                        if k == _snake_cnt:
+                            best = v
+                            split = i1, i2
+                            break
+                        k += 1
+            if best > 0:
+                return split + (True, False)
+
+            best = 0
+            for d in range(bmax, bmin - 1, -2):
+                dd = abs(d - bmid)
+                i1 = kvdb[d]
+                i2 = i1 - d
+                v = (lim1 - i1) + (lim2 - i2) - dd
+                if (v > _k_heur * ec and v > best and
+                        off1 < i1 <= lim1 - _snake_cnt and
+                        off2 < i2 <= lim2 - _snake_cnt):
+                    k = 0
+                    while ha1[i1 + k] == ha2[i2 + k]:
+                        if k == _snake_cnt - 1:
+                            best = v
+                            split = i1, i2
+                            break
+                        k += 1
+            if best > 0:
+                return split + (False, True)
+
+        # Too expensive, split at the furthest reaching path
+        if ec >= mxcost:
+            fbest = fbest1 = -1
+            for d in range(fmax, fmin - 1, -2):
+                i1 = min(kvdf[d], lim1)
+                i2 = i1 - d
+                if lim2 < i2:
+                    i1 = lim2 + d
+                    i2 = lim2
+                if fbest < i1 + i2:
+                    fbest = i1 + i2
+                    fbest1 = i1
+
+            bbest = bbest1 = _line_max
+            for d in range(bmax, bmin - 1, -2):
+                i1 = max(off1, kvdb[d])
+                i2 = i1 - d
+                if i2 < off2:
+                    i1 = off2 + d
+                    i2 = off2
+                if i1 + i2 < bbest:
+                    bbest = i1 + i2
+                    bbest1 = i1
+
+            if (lim1 + lim2) - bbest < fbest - (off1 + off2):
+                return fbest1, fbest - fbest1, True, False
+            return bbest1, bbest - bbest1, False, True
+
+
+def _diff_records(fa, fb, rindex1, ha1, rindex2, ha2):
+    "Flag the changed lines among the records to diff, by divide and conquer."
+    n1 = len(ha1)
+    n2 = len(ha2)
+    # Diagonals range from -n2 - 1 to n1 + 1
+    ndiags = n1 + n2 + 3
+    kvdf = _Diagonals(ndiags, n2 + 1)
+    kvdb = _Diagonals(ndiags, n2 + 1)
+    mxcost = max(_bogosqrt(ndiags), _max_cost_min)
+
+    boxes = [(0, n1, 0, n2, False)]
+    while boxes:
+        off1, lim1, off2, lim2, need_min = boxes.pop()
+        # Shrink the box by the snakes at both ends
+        while off1 < lim1 and off2 < lim2 and ha1[off1] == ha2[off2]:
+            off1 += 1
+            off2 += 1
+        while off1 < lim1 and off2 < lim2 and ha1[lim1 - 1] == ha2[lim2 - 1]:
+            lim1 -= 1
+            lim2 -= 1
+
+        if off1 == lim1:
+            for i in range(off2, lim2):
+                fb.changed[rindex2[i]] = 1
+        elif off2 == lim2:
+            for i in range(off1, lim1):
+                fa.changed[rindex1[i]] = 1
+        else:
+            i1, i2, min_lo, min_hi = _split(
+                ha1, off1, lim1, ha2, off2, lim2, kvdf, kvdb, need_min, mxcost)
+            boxes.append((i1, lim1, i2, lim2, min_hi))
+            boxes.append((off1, i1, off2, i2, min_lo))
+
+
+class _Diagonals(list):
+    "A list indexed by diagonals, which may be negative."
+    __slots__ = ("offset",)
+
+    def __init__(self, size, offset):
+        super(_Diagonals, self).__init__([0] * size)
+        self.offset = offset
+
+    def __getitem__(self, d):
+        return list.__getitem__(self, d + self.offset)
+
+    def __setitem__(self, d, value):
+        list.__setitem__(self, d + self.offset, value)
+
+
+def line_changes(a, b, indent_heuristic=False):
+    """Compute the changes between two lists of lines.
+
+    Returns a list of changes (i, j, n, m), in order, each replacing the
+    n lines a[i:i+n] with the m lines b[j:j+m]. Changes are shifted by
+    the indent heuristic of git diff if indent_heuristic is true, which
+    git merge-file does not do.
+    """
+    fa = _Lines(a)
+    fb = _Lines(b)
+    na = len(a)
+    nb = len(b)
+
+    # Number lines by their content
+    classes = {}
+    ha = [classes.setdefault(line, len(classes)) for line in a]
+    hb = [classes.setdefault(line, len(classes)) for line in b]
+    counts_a = {}
+    for h in ha:
+        counts_a[h] = counts_a.get(h, 0) + 1
+    counts_b = {}
+    for h in hb:
+        counts_b[h] = counts_b.get(h, 0) + 1
+
+    # Trim common lines at both ends
+    lim = min(na, nb)
+    start = 0
+    while start < lim and ha[start] == hb[start]:
+        start += 1
+    stop = 0
+    while stop < lim - start and ha[na - stop - 1] == hb[nb - stop - 1]:
+        stop += 1
+
+    # Lines without matches are changed, the rest are diffed
+    rindex1, rha1 = _cleanup_records(fa, ha, counts_b, start, na - stop - 1)
+    rindex2, rha2 = _cleanup_records(fb, hb, counts_a, start, nb - stop - 1)
+    _diff_records(fa, fb, rindex1, rha1, rindex2, rha2)
+
+    _compact(fa, fb, indent_heuristic)
+    _compact(fb, fa, indent_heuristic)
+
+    # Collect the groups of changes
+    changes = []
+    i = j = 0
+    while i < na or j < nb:
+        if fa.changed[i] or fb.changed[j]:
+            i0 = i
+            j0 = j
+            while fa.changed[i]:
+                i += 1
+            while fb.changed[j]:
+                j += 1
+            changes.append((i0, j0, i - i0, j - j0))
+        else:
+            i += 1
+            j += 1
+    return changes
+
+
+class _Merge(object):
+    """A region of a three-way merge.
+
+    The region spans base[i0:i0+chg0], local[i1:i1+chg1] and
+    remote[i2:i2+chg2]. The mode is 1 for changes in local only, 2 for
+    changes in remote only, 0 for conflicts and 4 for equal changes.
+    """
+    __slots__ = ("mode", "i0", "chg0", "i1", "chg1", "i2", "chg2")
+
+    def __init__(self, mode, i0, chg0, i1, chg1, i2, chg2):
+        self.mode = mode
+        self.i0 = i0
+        self.chg0 = chg0
+        self.i1 = i1
+        self.chg1 = chg1
+        self.i2 = i2
+        self.chg2 = chg2
+
+
+def _append_merge(merges, mode, i0, chg0, i1, chg1, i2, chg2):
+    "Append a region, joining it with the last region if they overlap."
+    m = merges[-1] if merges else None
+    if m is not None and (i1 <= m.i1 + m.chg1 or i2 <= m.i2 + m.chg2):
+        if mode != m.mode:
+            m.mode = 0
+        m.chg0 = i0 + chg0 - m.i0
+        m.chg1 = i1 + chg1 - m.i1
+        m.chg2 = i2 + chg2 - m.i2
+    else:
+        merges.append(_Merge(mode, i0, chg0, i1, chg1, i2, chg2))
+
+
+def _merge_regions(local_changes, remote_changes, nbase, local, remote):
+    "Combine the changes from base to local and remote into merge regions."
+    merges = []
+    x1 = list(local_changes)
+    x2 = list(remote_changes)
+    k1 = k2 = 0
+    while k1 < len(x1) and k2 < len(x2):
+        a1, b1, n1, m1 = x1[k1]
+        a2, b2, n2, m2 = x2[k2]
+        if a1 + n1 < a2:
+            _append_merge(merges, 1, a1, n1, b1, m1, b2 - a2 + a1, n1)
+            k1 += 1
+            continue
+        if a2 + n2 < a1:
+            _append_merge(merges, 2, a2, n2, b1 - a1 + a2, n2, b2, m2)
+            k2 += 1
+            continue
+        if (a1 != a2 or n1 != n2 or m1 != m2 or
+                local[b1:b1 + m1] != remote[b2:b2 + m2]):
+            # Conflict
+            off = a1 - a2
+            ffo = off + n1 - n2
+            i0 = a1
+            i1 = b1
+            i2 = b2
+            if off > 0:
+                i0 -= off
+                i1 -= off
+            else:
+                i2 += off
+            chg0 = a1 + n1 - i0
+            chg1 = b1 + m1 - i1
+            chg2 = b2 + m2 - i2
+            if ffo < 0:
+                chg0 -= ffo
+                chg1 -= ffo
+            else:
+                chg2 += ffo
+            _append_merge(merges, 0, i0, chg0, i1, chg1, i2, chg2)
+
+        end1 = a1 + n1
+        end2 = a2 + n2
+        if end1 >= end2:
+            k2 += 1
+        if end2 >= end1:
+            k1 += 1
+    for a1, b1, n1, m1 in x1[k1:]:
+        _append_merge(merges, 1, a1, n1, b1, m1, a1 + len(remote) - nbase, n1)
+    for a2, b2, n2, m2 in x2[k2:]:
+        _append_merge(merges, 2, a2, n2, a2 + len(local) - nbase, n2, b2, m2)
+    return merges
+
+
+def _refine_conflicts(merges, local, remote):
+    """Split conflicts on the lines equal in local and remote.
+
+    Conflicts with equal changes on both sides are marked with mode 4.
+    """
+    refined = []
+    for m in merges:
+        if m.mode or m.chg1 == 0 or m.chg2 == 0:
+            refined.append(m)
+            continue
+        changes = line_changes(local[m.i1:m.i1 + m.chg1], remote[m.i2:m.i2 + m.chg2])
+        if not changes:
+            m.mode = 4
+            refined.append(m)
+            continue
+        for j1, j2, n1, n2 in changes:
+            refined.append(_Merge(0, m.i0, m.chg0, m.i1 + j1, n1, m.i2 + j2, n2))
+    return refined
+
+
+def _simplify_non_conflicts(merges, local):
+    """Join conflicts separated by at most three lines, or by lines
+    without any alphanumeric characters."""
+    simplified = merges[:1]
+    for m in merges[1:]:
+        prev = simplified[-1]
+        begin = prev.i1 + prev.chg1
+        end = m.i1
+        if (prev.mode != 0 or m.mode != 0 or
+                (end - begin > 3 and
+                 any(_re_alnum.search(line) for line in local[begin:end]))):
+            simplified.append(m)
+        else:
+            prev.chg1 = m.i1 + m.chg1 - prev.i1
+            prev.chg2 = m.i2 + m.chg2 - prev.i2
+    return simplified
+
+
+def _copy_lines(out, lines, add_newline=False):
+    out.extend(lines)
+    if add_newline and lines and not lines[-1].endswith("\n"):
+        out.append("\n")
+
+
+def merge_text(base, local, remote, favor=None,
+               local_title="local", remote_title="remote"):
+    """Three-way merge of the lines of strings, like 'git merge-file -p'.
+
+    Conflicting lines are enclosed in conflict markers, unless favor is
+    given as 'local', 'remote' or 'union', picking the lines of local,
+    remote or both in conflicts instead.
+
+    Returns the merged string.
+    """
+    base_lines = split_lines(base)
+    local_lines = split_lines(local)
+    remote_lines = split_lines(remote)
+    local_changes = line_changes(base_lines, local_lines)
+    if not local_changes:
+        return remote
+    remote_changes = line_changes(base_lines, remote_lines)
+    if not remote_changes:
+        return local
+
+    local = local_lines
+    remote = remote_lines
+    merges = _merge_regions(local_changes, remote_changes, len(base_lines), local, remote)
+    merges = _refine_conflicts(merges, local, remote)
+    merges = _simplify_non_conflicts(merges, local)
+
+    favor_mode = {None: 0, "local": 1, "remote": 2, "union": 3}[favor]
+    out = []
+    i = 0
+    for m in merges:
+        mode = m.mode or favor_mode
+        if mode == 4:
+            # Equal changes, copied from local with the following lines
+            continue
+        # Lines before the region
+        _copy_lines(out, local[i:m.i1])
+        if mode == 0:
+            out.append("%s %s\n" % ("<" * marker_size, local_title))
+            _copy_lines(out, local[m.i1:m.i1 + m.chg1], True)
+            out.append("%s\n" % ("=" * marker_size,))
+            _copy_lines(out, remote[m.i2:m.i2 + m.chg2], True)
+            out.append("%s %s\n" % (">" * marker_size, remote_title))
+        else:
+            if mode & 1:
+                _copy_lines(out, local[m.i1:m.i1 + m.chg1], mode & 2)
+            if mode & 2:
+                _copy_lines(out, remote[m.i2:m.i2 + m.chg2])
+        i = m.i1 + m.chg1
+    _copy_lines(out, local[i:])
+    return "".join(out)
@@ -0,0 +1,109 @@
+# coding: utf-8
+
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+"""Selection of the parts of notebooks to diff by path filters.
+
+A filter is a path like '/cells/*/source', selecting the values at
+matching paths for diffing, or a path prefixed with '!' like
+'!/cells/*/outputs', excluding them. If no including filters are given,
+everything not excluded is selected. '*' matches any key or index.
+
+Filtering happens before diffing, by pruning unselected values from
+both notebooks, so that they are never visited by the alignment
+heuristics or the recursive diff.
+"""
+
+from __future__ import unicode_literals
+
+from six import string_types
+
+from ..utils import split_path
+
+__all__ = ["parse_filters", "filter_notebook"]
+
+
+# Keys kept in filtered dicts regardless of the filters, as the
+# heuristics aligning cells and outputs depend on them
+always_kept_keys = ("cell_type", "output_type")
+
+
+def parse_filters(filters):
+    """Parse a list of filter strings into lists of included and excluded paths.
+
+    Each path is a tuple of keys, where '*' matches any key.
+    """
+    if isinstance(filters, string_types):
+        filters = [filters]
+    includes = []
+    excludes = []
+    for f in filters:
+        if f.startswith("!"):
+            excludes.append(tuple(split_path(f[1:])))
+        else:
+            includes.append(tuple(split_path(f)))
+    if () in excludes:
+        raise ValueError("Cannot exclude the whole notebook.")
+    return includes, excludes
+
+
+def _matching(patterns, key):
+    "Return the remainders of the patterns whose first key matches key."
+    key = str(key)
+    return [p[1:] for p in patterns if p[0] == "*" or p[0] == key]
+
+
+def _prune(value, includes, excludes):
+    """Return value with unselected dict items removed.
+
+    includes is None if all of value is included. Containers on the
+    pruned paths are copied, all other values are shared with value.
+    """
+    if () in excludes:
+        # An excluded list item, reduced to its type keys
+        includes = []
+        excludes = [p for p in excludes if p]
+    elif includes is not None and () in includes:
+        includes = None
+    if includes is None and not excludes:
+        return value
+
+    if isinstance(value, dict):
+        result = {}
+        for k, v in value.items():
+            kexcludes = _matching(excludes, k)
+            if includes is None:
+                kincludes = None
+            else:
+                kincludes = _matching(includes, k)
+                if not kincludes and k not in always_kept_keys:
+                    # Not on the path to any included value
+                    continue
+            if () in kexcludes:
+                continue
+            result[k] = _prune(v, kincludes, kexcludes)
+        return type(value)(result)
+    elif isinstance(value, list):
+        # Items are never removed from lists, to keep their indices
+        # valid, but items may have their own items removed
+        result = []
+        for i, v in enumerate(value):
+            iincludes = None if includes is None else _matching(includes, i)
+            result.append(_prune(v, iincludes, _matching(excludes, i)))
+        return result
+    else:
+        return value
+
+
+def filter_notebook(nb, filters):
+    """Return a copy of nb with only the values selected by filters.
+
+    Values are only removed from dicts, so indices into lists of e.g.
+    cells and outputs are the same in the filtered notebook. The type
+    keys of cells and outputs are always kept.
+    """
+    includes, excludes = parse_filters(filters)
+    if not includes:
+        includes = None
+    return _prune(nb, includes, excludes)
@@ -8,7 +8,8 @@ from __future__ import unicode_literals
 from six import string_types
 from six.moves import xrange as range
 import operator
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
+from contextlib import contextmanager
 import difflib
 
 from ..diff_format import validate_diff, count_consumed_symbols
@@ -33,6 +34,39 @@ def default_differs():
     return defaultdict(lambda: diff)
 
 
+# SequenceMatchers preprocessed for strings of the base side of diffs,
+# by string, while enabled with shared_base_matchers. The least recently
+# used are dropped beyond max_base_matchers strings.
+_base_matchers = None
+
+# Number of base strings whose preprocessing is kept by shared_base_matchers
+max_base_matchers = 1000
+
+
+@contextmanager
+def shared_base_matchers():
+    """Share the preprocessing of base strings between approximate comparisons.
+
+    Within this context, compare_strings_approximate keeps the difflib
+    preprocessing of the strings x it is called with, such that comparing
+    a base string with many other strings, in one diff or in several diffs
+    with the same base, only preprocesses the base string once. The
+    preprocessing of the last max_base_matchers strings used is kept.
+
+    The cache lives in the current process. Diffs computed in worker
+    processes, as by the parallel diffs of nbdime.merging.notebooks,
+    start with an empty cache and share nothing with this process.
+    """
+    global _base_matchers
+    outer = _base_matchers
+    if outer is None:
+        _base_matchers = OrderedDict()
+    try:
+        yield
+    finally:
+        _base_matchers = outer
+
+
 def compare_strings_approximate(x, y, threshold=0.7):
     "Compare to strings with approximate heuristics."
     # TODO: Add configuration framework
@@ -57,7 +91,22 @@ def compare_strings_approximate(x, y, threshold=0.7):
     # and the (real_)quick_ratio cutoffs will speed up those.
     # So the heavy ratio function is only used for close calls.
     # s = difflib.SequenceMatcher(lambda c: c in (" ", "\t"), x, y, autojunk=False)
-    s = difflib.SequenceMatcher(None, x, y, autojunk=False)
+    # Note that x, from the base side of the diff, is the second sequence,
+    # which is the sequence preprocessed by SequenceMatcher. As the ratio
+    # is not quite symmetric in the two sequences, they are in this order
+    # whether or not the preprocessing is shared.
+    if _base_matchers is None or not isinstance(x, string_types):
+        s = difflib.SequenceMatcher(None, y, x, autojunk=False)
+    else:
+        s = _base_matchers.pop(x, None)
+        if s is None:
+            s = difflib.SequenceMatcher(None, autojunk=False)
+            s.set_seq2(x)
+            while len(_base_matchers) >= max_base_matchers:
+                _base_matchers.popitem(last=False)
+        # Keep the most recently used last
+        _base_matchers[x] = s
+        s.set_seq1(y)
     if s.real_quick_ratio() < threshold:
         return False
     if s.quick_ratio() < threshold:
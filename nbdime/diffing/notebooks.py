@@ -14,17 +14,21 @@ Up- and down-conversion is handled by nbformat.
 
 import operator
 import re
-import copy
 from collections import defaultdict
 from six import string_types
-from six.moves import zip
+from six.moves import zip, xrange as range
 
-from ..diff_format import source_as_string, MappingDiffBuilder, DiffOp
+from ..diff_format import (
+    source_as_string, MappingDiffBuilder, DiffOp, offset_op, op_addrange, op_move,
+    op_patch)
 
 from .generic import (diff, diff_sequence_multilevel,
-                      compare_strings_approximate)
+                      compare_strings_approximate, shared_base_matchers)
+from .filters import filter_notebook
+from .summary import hash_cell, aligned_cell_range
+from .tables import diff_mime_table, compare_mime_tables
 
-__all__ = ["diff_notebooks"]
+__all__ = ["diff_notebooks", "diff_cell_range", "diff_cell_windows"]
 
 # A regexp matching base64 encoded data
 _base64 = re.compile(r'^(?:[A-Za-z0-9+/]{4})*(?:[A-Za-z0-9+/]{2}==|[A-Za-z0-9+/]{3}=)?$', re.MULTILINE | re.UNICODE)
@@ -45,6 +49,13 @@ _split_mimes = (
     )
 
 
+# Mimes which may hold tables, compared and diffed by rows
+_table_mimes = (
+    'text/html',
+    'text/plain',
+    )
+
+
 # TODO: Maybe cleaner to make the split between strict/approximate
 #       an argument instead of separate functions.
 
@@ -95,7 +106,7 @@ def compare_base64_strict(x, y):
     return x == y
 
 
-def _compare_mimedata(mimetype, x, y, comp_text, comp_base64):
+def _compare_mimedata(mimetype, x, y, comp_text, comp_base64, table_threshold):
     mimetype = mimetype.lower()
 
     # TODO: Test this. Match repr-style oneliners with random pointer
@@ -107,6 +118,12 @@ def _compare_mimedata(mimetype, x, y, comp_text, comp_base64):
             if xsplit == ysplit:
                 return True
 
+    if mimetype in _table_mimes and isinstance(x, string_types) and isinstance(y, string_types):
+        # Compare tables by rows rather than by characters
+        similar = compare_mime_tables(mimetype, x, y, table_threshold)
+        if similar is not None:
+            return similar
+
     if mimetype.startswith("text/"):
         return comp_text(x, y)
 
@@ -126,15 +143,15 @@ def _compare_mimedata(mimetype, x, y, comp_text, comp_base64):
 
 def compare_mimedata_approximate(mimetype, x, y):
     return _compare_mimedata(mimetype, x, y,
-        compare_text_approximate, compare_base64_approximate)
+        compare_text_approximate, compare_base64_approximate, 0.7)
 
 
 def compare_mimedata_strict(mimetype, x, y):
     return _compare_mimedata(mimetype, x, y,
-        compare_text_strict, compare_base64_strict)
+        compare_text_strict, compare_base64_strict, 0.95)
 
 
-def compare_mimebundle_approximate(x, y):
+def _compare_mimebundle(x, y, compare_mimedata):
     # Get the simple and cheap stuff out of the way
     if x is None and y is None:
         return True
@@ -145,41 +162,30 @@ def compare_mimebundle_approximate(x, y):
     if set(x.keys()) != set(y.keys()):
         return False
 
-    dd = diff_mime_bundle(x, y)
-    # Fail comparison for adds and removes
-    if any(e.op != DiffOp.PATCH for e in dd):
-        return False
-    for e in dd:
+    for key in sorted(x):
+        xv = x[key]
+        yv = y[key]
+        if xv == yv:
+            continue
+        # Fail comparison for values that would be replaced by a diff,
+        # without computing the diffs of values that would be patched
+        mimetype = key.lower()
+        if not any(mimetype.startswith(tm) for tm in _split_mimes):
+            return False
         # Delegate to mimetype specific comparison
-        if not compare_mimedata_approximate(e.key, x[e.key], y[e.key]):
+        if not compare_mimedata(key, xv, yv):
             return False
 
     # Didn't fail up to here it must be equal
     return True
 
 
-def compare_mimebundle_strict(x, y):
-    # Get the simple and cheap stuff out of the way
-    if x is None and y is None:
-        return True
-    if x is None or y is None:
-        return False
-
-    # This only checks that the same mime types are present
-    if set(x.keys()) != set(y.keys()):
-        return False
+def compare_mimebundle_approximate(x, y):
+    return _compare_mimebundle(x, y, compare_mimedata_approximate)
 
-    dd = diff_mime_bundle(x, y)
-    # Fail comparison for adds and removes
-    if any(e.op != DiffOp.PATCH for e in dd):
-        return False
-    for e in dd:
-        # Delegate to mimetype specific comparison
-        if not compare_mimedata_strict(e.key, x[e.key], y[e.key]):
-            return False
 
-    # Didn't fail up to here it must be equal
-    return True
+def compare_mimebundle_strict(x, y):
+    return _compare_mimebundle(x, y, compare_mimedata_strict)
 
 
 def compare_tracebacks(xt, yt):
@@ -210,29 +216,29 @@ def compare_output_approximate(x, y):
     handled = set(("output_type", "metadata", "execution_count"))
 
     if ot == "stream":
-        if x["name"] != y["name"]:
+        if x.get("name") != y.get("name"):
             return False
-        if not compare_strings_approximate(x["text"], y["text"]):
+        if not compare_strings_approximate(x.get("text", ""), y.get("text", "")):
             return False
         handled.update(("name", "text"))
 
     elif ot == "error":
-        if x["ename"] != y["ename"]:
+        if x.get("ename") != y.get("ename"):
             return False
-        if x["evalue"] != y["evalue"]:
+        if x.get("evalue") != y.get("evalue"):
             return False
 
         # Compare tracebacks
-        xt = x["traceback"]
-        yt = y["traceback"]
+        xt = x.get("traceback", ())
+        yt = y.get("traceback", ())
         if not compare_tracebacks(xt, yt):
             return False
 
         handled.update(("ename", "evalue", "traceback"))
 
     elif ot == "display_data" or ot == "execute_result":
-        xd = x["data"]
-        yd = y["data"]
+        xd = x.get("data")
+        yd = y.get("data")
         if not compare_mimebundle_approximate(xd, yd):
             return False
         handled.update(("data",))
@@ -280,7 +286,7 @@ def compare_cell_approximate(x, y):
         return False
 
     # Compare sources
-    if not compare_text_approximate(x["source"], y["source"]):
+    if not compare_text_approximate(x.get("source", ""), y.get("source", "")):
         return False
 
     # NB! Ignoring metadata, execution_count, outputs
@@ -308,13 +314,13 @@ def compare_cell_moderate(x, y):
         return False
 
     # Compare sources
-    if not compare_text_approximate(x["source"], y["source"]):
+    if not compare_text_approximate(x.get("source", ""), y.get("source", "")):
         return False
 
     # Compare outputs for code cells
     if x["cell_type"] == "code":
-        xop = x["outputs"] or ()
-        yop = y["outputs"] or ()
+        xop = x.get("outputs") or ()
+        yop = y.get("outputs") or ()
         if bool(xop) != bool(yop):
             return False
         return compare_outputs_approximate(xop, yop)
@@ -334,13 +340,13 @@ def compare_cell_strict(x, y):
         return False
 
     # Compare sources
-    if not compare_text_strict(x["source"], y["source"]):
+    if not compare_text_strict(x.get("source", ""), y.get("source", "")):
         return False
 
     # Compare outputs for code cells
     if x["cell_type"] == "code":
-        xop = x["outputs"] or ()
-        yop = y["outputs"] or ()
+        xop = x.get("outputs") or ()
+        yop = y.get("outputs") or ()
         # Be strict on number of outputs
         if len(xop) != len(yop):
             return False
@@ -362,16 +368,16 @@ def diff_single_outputs(a, b, path="/cells/*/outputs/*",
     if a.output_type in ("execute_result", "display_data"):
         di = MappingDiffBuilder()
 
-        a_conj = copy.deepcopy(a)
-        del a_conj['data']
-        b_conj = copy.deepcopy(b)
-        del b_conj['data']
+        # Diff all keys but data, sharing the values with the outputs
+        a_conj = {k: v for k, v in a.items() if k != 'data'}
+        b_conj = {k: v for k, v in b.items() if k != 'data'}
         dd_conj = diff(a_conj, b_conj)
         if dd_conj:
             for e in dd_conj:
                 di.append(e)
 
-        dd = diff_mime_bundle(a.data, b.data, path=path+"/data")
+        dd = diff_mime_bundle(a.get("data", {}), b.get("data", {}), path=path+"/data",
+                              predicates=predicates, differs=differs)
         if dd:
             di.patch("data", dd)
 
@@ -380,13 +386,23 @@ def diff_single_outputs(a, b, path="/cells/*/outputs/*",
         return diff(a, b)
 
 
-def add_mime_diff(key, avalue, bvalue, diffbuilder):
+def add_mime_diff(key, avalue, bvalue, diffbuilder, path=None,
+                  predicates=None, differs=None):
     # TODO: Handle output diffing with plugins?
     # I.e. image diff, svg diff, json diff, etc.
 
     mimetype = key.lower()
     if any(mimetype.startswith(tm) for tm in _split_mimes):
-        dd = diff(avalue, bvalue)
+        # Use a mimetype specific differ if one is registered for the path
+        diffit = diff
+        if path is not None and differs is not None:
+            subpath = "/".join((path, mimetype))
+            diffit = differs.get(subpath, diff)
+        if diffit is diff:
+            dd = diff(avalue, bvalue)
+        else:
+            dd = diffit(avalue, bvalue, path=subpath,
+                        predicates=predicates, differs=differs)
         if dd:
             diffbuilder.patch(key, dd)
     elif avalue != bvalue:
@@ -445,7 +461,8 @@ def diff_mime_bundle(a, b, path=None,
     for key in sorted(akeys & bkeys):
         avalue = a[key]
         bvalue = b[key]
-        add_mime_diff(key, avalue, bvalue, di)
+        add_mime_diff(key, avalue, bvalue, di, path=path,
+                      predicates=predicates, differs=differs)
 
     for key in sorted(bkeys - akeys):
         di.add(key, b[key])
@@ -476,9 +493,91 @@ notebook_differs = defaultdict(lambda: diff, {
     "/cells/*/outputs": diff_sequence_multilevel,
     "/cells/*/outputs/*": diff_single_outputs,
     "/cells/*/attachments": diff_attachments,
+    "/cells/*/outputs/*/data/text/html": diff_mime_table,
+    "/cells/*/outputs/*/data/text/plain": diff_mime_table,
     })
 
 
+# Added and removed cells are compared pairwise with compare_cell_strict
+# only if the number of pairs is at most this, cells with equal contents
+# are always detected as moved
+max_move_comparisons = 10000
+
+
+def detect_cell_moves(a, di, path="/cells", predicates=None, differs=None):
+    """Replace added cells in a diff of the cells a with moves where possible.
+
+    Added cells equal to a removed cell, or matching one under
+    compare_cell_strict, are encoded as move entries referring to the
+    removed cell, with a nested diff for any changes, instead of
+    embedding the whole cell with its outputs in an addrange entry.
+    The removal of moved cells is left in place, so a diff with moves
+    differs from the input diff only in its addrange entries.
+    """
+    if predicates is None:
+        predicates = notebook_predicates
+    if differs is None:
+        differs = notebook_differs
+
+    removed = [i for e in di if e.op == DiffOp.REMOVERANGE
+               for i in range(e.key, e.key + e.length)]
+    added = [cell for e in di if e.op == DiffOp.ADDRANGE for cell in e.valuelist]
+    if not removed or not added:
+        return di
+
+    # Match cells with equal contents by hash, in order
+    candidates = defaultdict(list)
+    for i in removed:
+        candidates[hash_cell(a[i])].append(i)
+    sources = []
+    for cell in added:
+        indices = candidates.get(hash_cell(cell))
+        sources.append(indices.pop(0) if indices else None)
+
+    # Match remaining cells with small changes
+    unmatched = sorted(set(removed) - set(i for i in sources if i is not None))
+    nunmatched = sources.count(None)
+    if unmatched and nunmatched and len(unmatched) * nunmatched <= max_move_comparisons:
+        for k, cell in enumerate(added):
+            if sources[k] is not None:
+                continue
+            for i in unmatched:
+                if compare_cell_strict(a[i], cell):
+                    sources[k] = i
+                    unmatched.remove(i)
+                    break
+
+    if all(i is None for i in sources):
+        return di
+
+    # Split addrange entries into moves and remaining additions
+    subpath = path + "/*"
+    celldiff = differs[subpath]
+    newdiff = []
+    sources = iter(sources)
+    for e in di:
+        if e.op != DiffOp.ADDRANGE:
+            newdiff.append(e)
+            continue
+        valuelist = []
+        for cell in e.valuelist:
+            i = next(sources)
+            if i is None:
+                valuelist.append(cell)
+                continue
+            if valuelist:
+                newdiff.append(op_addrange(e.key, valuelist))
+                valuelist = []
+            if a[i] == cell:
+                d = []
+            else:
+                d = celldiff(a[i], cell, path=subpath, predicates=predicates, differs=differs)
+            newdiff.append(op_move(e.key, i, d))
+        if valuelist:
+            newdiff.append(op_addrange(e.key, valuelist))
+    return newdiff
+
+
 def diff_cells(a, b):
     "This is currently just used by some tests."
     path = "/cells"
@@ -489,6 +588,76 @@ def diff_item_at_path(a, b, path):
     return notebook_differs[path](a, b, path=path, predicates=notebook_predicates, differs=notebook_differs)
 
 
-def diff_notebooks(a, b):
-    """Compute the diff of two notebooks using customized heuristics and diff rules."""
-    return diff(a, b, path="", predicates=notebook_predicates, differs=notebook_differs)
+def diff_notebooks(a, b, detect_moves=False, filters=None):
+    """Compute the diff of two notebooks using customized heuristics and diff rules.
+
+    If filters is given, as a list of paths to include like '/cells/*/source'
+    or to exclude like '!/cells/*/outputs', only the selected parts of the
+    notebooks are diffed, see nbdime.diffing.filters. Values added by the
+    diff then also only hold their selected parts.
+
+    If detect_moves is True, cells moved within the notebook are encoded
+    as move entries in the /cells diff, see detect_cell_moves. This is an
+    extension of the diff format, convert the result with
+    nbdime.patching.expand_moves for consumers of the basic format.
+    """
+    if filters:
+        a = filter_notebook(a, filters)
+        b = filter_notebook(b, filters)
+    # Strings of a are compared with many strings of b, share their preprocessing
+    with shared_base_matchers():
+        di = diff(a, b, path="", predicates=notebook_predicates, differs=notebook_differs)
+        if detect_moves:
+            for k, e in enumerate(di):
+                if e.key == "cells" and e.op == DiffOp.PATCH:
+                    di[k] = op_patch("cells", detect_cell_moves(a["cells"], e.diff))
+    return di
+
+
+def diff_cell_windows(acells, bcells, windows):
+    """Compute the diff of two lists of cells, diffing only the given windows.
+
+    windows is a list of ranges (start, stop, bstart, bstop), in order,
+    such that the cells of acells and bcells outside the windows are equal
+    and aligned. Each range [start, stop) of acells is diffed with the range
+    [bstart, bstop) of bcells using the heuristics of diff_notebooks.
+
+    Returns the diff of the cell lists, valid for acells.
+    """
+    path = "/cells"
+    differ = notebook_differs[path]
+    di = []
+    with shared_base_matchers():
+        for start, stop, bstart, bstop in windows:
+            d = differ(acells[start:stop], bcells[bstart:bstop], path=path,
+                       predicates=notebook_predicates, differs=notebook_differs)
+            di.extend(offset_op(e, start) for e in d)
+    return di
+
+
+def diff_cell_range(a, b, start, stop, filters=None):
+    """Compute the diff of a range of cells in notebook a with notebook b.
+
+    Cells are first aligned on equal content hashes, which is cheap, and
+    the cells [start, stop) of a are then diffed with the aligned cells of
+    b using the heuristics of diff_notebooks. The cost of the full diff
+    thus depends on the size of the range, not of the notebooks.
+
+    Returns a notebook diff patching only the given range of cells, valid
+    for a. See diff_notebooks for filters.
+    """
+    acells = a["cells"]
+    bcells = b["cells"]
+    start, stop, bstart, bstop = aligned_cell_range(acells, bcells, start, stop)
+
+    awindow = {"cells": acells[start:stop]}
+    bwindow = {"cells": bcells[bstart:bstop]}
+    if filters:
+        awindow = filter_notebook(awindow, filters)
+        bwindow = filter_notebook(bwindow, filters)
+    path = "/cells"
+    di = notebook_differs[path](awindow["cells"], bwindow["cells"], path=path,
+                                predicates=notebook_predicates, differs=notebook_differs)
+    if not di:
+        return []
+    return [op_patch("cells", [offset_op(e, start) for e in di])]
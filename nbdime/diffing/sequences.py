@@ -6,20 +6,34 @@
 from __future__ import unicode_literals
 
 import operator
+import re
+from difflib import SequenceMatcher
 from six import string_types
 from collections import defaultdict
 
+from ..diff_format import SequenceDiffBuilder
 from .seq_difflib import diff_sequence_difflib
 from .seq_bruteforce import diff_sequence_bruteforce
 from .seq_myers import diff_sequence_myers
 
-__all__ = ["diff_strings_by_char", "diff_sequence", "diff_strings_linewise"]
+__all__ = ["diff_strings_by_char", "diff_sequence", "diff_strings_linewise",
+           "diff_strings_by_token"]
 
 
 # TODO: Configuration framework?
 # legal_diff_sequence_algorithms = ["bruteforce", "difflib", "myers"]
 diff_sequence_algorithm = "bruteforce"
 
+# Lines longer than this many characters are diffed by tokens (words,
+# whitespace runs and single punctuation characters) instead of by
+# characters, as difflib is quadratic in the worst case
+intraline_char_limit = 2000
+
+# Lines with more tokens than this are replaced as a whole
+intraline_token_limit = 5000
+
+_token_re = re.compile(r"\w+|\s+|[^\w\s]", re.UNICODE)
+
 
 def diff_sequence(a, b, compare=operator.__eq__):
     """Compute a shallow diff of two sequences.
@@ -40,15 +54,78 @@ def diff_sequence(a, b, compare=operator.__eq__):
         raise RuntimeError("Unknown diff_sequence_algorithm {}.".format(diff_sequence_algorithm))
 
 
+def tokenize(s):
+    "Split a string into words, whitespace runs and punctuation characters."
+    return _token_re.findall(s)
+
+
+def diff_strings_by_token(a, b, token_limit=None):
+    """Compute char-based diff of two strings by aligning tokens.
+
+    The diff entries are keyed by character like those of
+    diff_strings_by_char, but only whole tokens are added or removed.
+    If either string has more than token_limit tokens, the diff replaces
+    all of a with b.
+    """
+    assert isinstance(a, string_types) and isinstance(b, string_types)
+    if token_limit is None:
+        token_limit = intraline_token_limit
+    if a == b:
+        return []
+    ta = tokenize(a)
+    tb = tokenize(b)
+    di = SequenceDiffBuilder()
+    if len(ta) > token_limit or len(tb) > token_limit:
+        di.addrange(0, b)
+        di.removerange(0, len(a))
+        return di.validated()
+
+    # Character offset of the start of each token in a, and of the end
+    offsets = [0]
+    for t in ta:
+        offsets.append(offsets[-1] + len(t))
+    s = SequenceMatcher(None, ta, tb, autojunk=False)
+    for action, abegin, aend, bbegin, bend in s.get_opcodes():
+        if action in ("replace", "insert"):
+            di.addrange(offsets[abegin], "".join(tb[bbegin:bend]))
+        if action in ("replace", "delete"):
+            di.removerange(offsets[abegin], offsets[aend] - offsets[abegin])
+    return di.validated()
+
+
 def diff_strings_by_char(a, b, path="", predicates=None, differs=None):
-    "Compute char-based diff of two strings."
+    """Compute char-based diff of two strings.
+
+    Strings longer than intraline_char_limit are diffed by tokens with
+    diff_strings_by_token, bounding the time spent on long lines such as
+    minified code or data.
+    """
     assert isinstance(a, string_types) and isinstance(b, string_types)
     if a == b:
         return []
+    elif max(len(a), len(b)) > intraline_char_limit:
+        return diff_strings_by_token(a, b)
     else:
         return diff_sequence_difflib(a, b)
 
 
+def compare_lines_approximate(x, y):
+    """Compare two lines with approximate heuristics.
+
+    Lines longer than intraline_char_limit are compared by tokens, and
+    lines with more tokens than intraline_token_limit only for equality.
+    """
+    from .generic import compare_strings_approximate
+    if x == y:
+        return True
+    if max(len(x), len(y)) > intraline_char_limit:
+        x = tokenize(x)
+        y = tokenize(y)
+        if max(len(x), len(y)) > intraline_token_limit:
+            return False
+    return compare_strings_approximate(x, y)
+
+
 def diff_strings_linewise(a, b):
     """Do a line-wise diff of two strings
     """
@@ -56,9 +133,9 @@ def diff_strings_linewise(a, b):
     lines_a = a.splitlines(True)
     lines_b = b.splitlines(True)
 
-    from .generic import diff_lists, compare_strings_approximate
+    from .generic import diff_lists
     predicates = defaultdict(lambda: [
-        compare_strings_approximate,
+        compare_lines_approximate,
         operator.__eq__])
     differs = defaultdict(lambda: diff_strings_by_char)
     return diff_lists(lines_a, lines_b, predicates=predicates, differs=differs)
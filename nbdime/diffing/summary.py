@@ -0,0 +1,175 @@
+# coding: utf-8
+
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+"""Fast summaries of the differences between notebooks.
+
+Answering whether two notebooks differ, or how many cells and lines
+changed, does not need the full heuristic diff of diff_notebooks. Here
+cells are compared by content hashes, and aligned by exact matches only,
+at a cost close to that of reading the notebooks.
+"""
+
+from __future__ import unicode_literals
+
+import hashlib
+from difflib import SequenceMatcher
+
+from six import string_types
+from six.moves import zip, xrange as range
+
+from ..blobs import encode_blob
+from ..utils import as_text
+
+__all__ = ["hash_cell", "notebooks_differ", "align_cells_by_hash",
+           "aligned_cell_range", "diff_stat"]
+
+
+def hash_cell(cell):
+    "Return a hash of the full contents of a cell."
+    return hashlib.sha1(encode_blob(cell)).hexdigest()
+
+
+def notebooks_differ(a, b):
+    """Return True if notebooks a and b differ.
+
+    Cells are hashed pairwise, stopping at the first difference.
+    """
+    if len(a["cells"]) != len(b["cells"]):
+        return True
+    for x, y in zip(a["cells"], b["cells"]):
+        if hash_cell(x) != hash_cell(y):
+            return True
+    keys = set(a) | set(b)
+    keys.discard("cells")
+    return any(a.get(k) != b.get(k) for k in keys)
+
+
+def _output_lines(output):
+    "Return the lines of text in an output, one per line of each value."
+    lines = []
+    if "text" in output:
+        lines.extend(as_text(output["text"]).splitlines())
+    if "traceback" in output:
+        lines.extend(output["traceback"])
+    for mimetype, value in sorted(output.get("data", {}).items()):
+        if isinstance(value, (string_types, list)):
+            lines.extend(as_text(value).splitlines())
+        else:
+            # Json data
+            lines.append(encode_blob(value).decode("utf8"))
+    return lines
+
+
+def _cell_lines(cell):
+    "Return the source lines and the output lines of a cell."
+    source = as_text(cell.get("source", "")).splitlines()
+    outputs = [line for output in cell.get("outputs", ()) for line in _output_lines(output)]
+    return source, outputs
+
+
+def _count_lines(a, b):
+    "Return the number of lines added and removed from a to b."
+    added = removed = 0
+    s = SequenceMatcher(None, a, b, autojunk=False)
+    for action, i0, i1, j0, j1 in s.get_opcodes():
+        if action != "equal":
+            removed += i1 - i0
+            added += j1 - j0
+    return added, removed
+
+
+def align_cells_by_hash(acells, bcells):
+    """Align two lists of cells on equal content hashes.
+
+    Returns the opcodes of a difflib.SequenceMatcher, a list of tuples
+    (tag, i0, i1, j0, j1) where tag is 'equal' for runs of equal cells.
+    """
+    s = SequenceMatcher(None, [hash_cell(c) for c in acells],
+                        [hash_cell(c) for c in bcells], autojunk=False)
+    return s.get_opcodes()
+
+
+def _aligned_position(opcodes, i, n, m):
+    """Return the position in b aligned with the position i in a.
+
+    Positions within equal runs map to their equal counterparts, and
+    positions within changed runs are mapped in order, such that the
+    windows [start, stop) of a map to windows of b partitioning b.
+    Cells inserted at the end of a belong to the window ending there.
+    """
+    if i >= n:
+        return m
+    for tag, i0, i1, j0, j1 in opcodes:
+        if i == i0:
+            return j0
+        if i0 < i < i1:
+            return j0 + min(i - i0, j1 - j0)
+    return m
+
+
+def aligned_cell_range(acells, bcells, start, stop):
+    """Return the range of bcells aligned with the range [start, stop) of acells.
+
+    Cells are aligned with align_cells_by_hash. Returns the normalized
+    range of acells as start, stop followed by the aligned range of bcells.
+    The ranges of bcells aligned with consecutive ranges of acells are
+    consecutive, so windows covering acells map to windows covering bcells.
+    """
+    n = len(acells)
+    m = len(bcells)
+    start, stop, _ = slice(start, stop).indices(n)
+    stop = max(start, stop)
+    opcodes = align_cells_by_hash(acells, bcells)
+    return (start, stop,
+            _aligned_position(opcodes, start, n, m),
+            _aligned_position(opcodes, stop, n, m))
+
+
+def diff_stat(a, b):
+    """Summarize the differences between notebooks a and b.
+
+    Cells are aligned on equal content hashes. Changed cells between
+    aligned cells are paired in order as modified cells, with any
+    remaining cells added or removed. Returns a dict with the number of
+    added, removed and modified cells, the number of source and output
+    lines added and removed, and whether the notebook metadata changed.
+    """
+    stat = {
+        "cells_added": 0,
+        "cells_removed": 0,
+        "cells_modified": 0,
+        "source_lines_added": 0,
+        "source_lines_removed": 0,
+        "output_lines_added": 0,
+        "output_lines_removed": 0,
+        "metadata_changed": a.get("metadata") != b.get("metadata"),
+        }
+
+    def count(x, y):
+        xsource, xoutputs = _cell_lines(x) if x is not None else ((), ())
+        ysource, youtputs = _cell_lines(y) if y is not None else ((), ())
+        added, removed = _count_lines(xsource, ysource)
+        stat["source_lines_added"] += added
+        stat["source_lines_removed"] += removed
+        added, removed = _count_lines(xoutputs, youtputs)
+        stat["output_lines_added"] += added
+        stat["output_lines_removed"] += removed
+
+    acells = a["cells"]
+    bcells = b["cells"]
+    for action, i0, i1, j0, j1 in align_cells_by_hash(acells, bcells):
+        if action == "equal":
+            continue
+        n = min(i1 - i0, j1 - j0)
+        stat["cells_modified"] += n
+        stat["cells_removed"] += (i1 - i0) - n
+        stat["cells_added"] += (j1 - j0) - n
+        for k in range(n):
+            count(acells[i0 + k], bcells[j0 + k])
+        for i in range(i0 + n, i1):
+            count(acells[i], None)
+        for j in range(j0 + n, j1):
+            count(None, bcells[j])
+    return stat
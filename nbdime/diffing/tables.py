@@ -0,0 +1,255 @@
+# coding: utf-8
+
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+"""Row based diffing of tabular text outputs.
+
+Table outputs, such as the html and plain text representations of pandas
+DataFrames, are large and mostly change by whole rows. Diffing them as
+plain multiline strings compares lines with approximate difflib ratios,
+at a cost quadratic in the number of rows. Here, rows are instead
+aligned by their index key or their contents in close to linear time,
+and the result is the usual line based diff of the string, with inserted
+and deleted rows as line ranges and changed rows patched.
+"""
+
+from __future__ import unicode_literals
+
+import bisect
+import re
+from collections import Counter
+from difflib import SequenceMatcher
+
+from six import string_types
+from six.moves import xrange as range
+
+from ..diff_format import (
+    DiffOp, SequenceDiffBuilder, offset_op, op_addrange, op_patch)
+from .generic import diff
+from .sequences import diff_strings_by_char, diff_strings_linewise
+
+__all__ = ["diff_mime_table", "compare_mime_tables"]
+
+
+# Tables with fewer rows than this are diffed as plain strings
+min_table_rows = 3
+
+_re_html_table = re.compile(r"<table\b", re.IGNORECASE)
+_re_tr_start = re.compile(r"<tr\b", re.IGNORECASE)
+_re_tr_end = re.compile(r"</tr\s*>", re.IGNORECASE)
+_re_first_cell = re.compile(r"<t[hd]\b[^>]*>(.*?)</t[hd]\s*>", re.IGNORECASE | re.DOTALL)
+
+
+class _Row(object):
+    "A row of a table, spanning the lines [start, stop) of its string."
+    __slots__ = ("start", "stop", "text", "key")
+
+    def __init__(self, start, stop, text, key):
+        self.start = start
+        self.stop = stop
+        self.text = text
+        self.key = key
+
+
+def split_html_rows(lines):
+    """Split the lines of an html table into rows.
+
+    Each <tr> element spanning one or more lines forms a row keyed by the
+    contents of its first cell, and each line outside <tr> elements forms
+    a row with no key. Returns None if the lines are not an html table.
+    """
+    if not any(_re_html_table.search(line) for line in lines):
+        return None
+    rows = []
+    ntr = 0
+    i = 0
+    n = len(lines)
+    while i < n:
+        start = i
+        if _re_tr_start.search(lines[i]):
+            while i < n and not _re_tr_end.search(lines[i]):
+                i += 1
+            i = min(i + 1, n)
+            text = "".join(lines[start:i])
+            m = _re_first_cell.search(text)
+            key = m.group(1).strip() if m else None
+            ntr += 1
+        else:
+            i += 1
+            text = lines[start]
+            key = None
+        rows.append(_Row(start, i, text, key))
+    if ntr < min_table_rows:
+        return None
+    return rows
+
+
+def split_text_rows(lines):
+    """Split the lines of a plain text table into rows.
+
+    Each line is a row keyed by its first column. Returns None unless
+    the majority of lines have the same number of whitespace separated
+    columns, such that header and footer lines can differ.
+    """
+    ncols = [len(line.split()) for line in lines]
+    counts = Counter(c for c in ncols if c > 1)
+    if not counts:
+        return None
+    ncol, count = counts.most_common(1)[0]
+    if count < min_table_rows or 2 * count <= len([c for c in ncols if c]):
+        return None
+    rows = []
+    for i, line in enumerate(lines):
+        parts = line.split(None, 1)
+        key = parts[0] if ncols[i] == ncol else None
+        rows.append(_Row(i, i + 1, line, key))
+    return rows
+
+
+def _increasing_pairs(pairs):
+    """Return the longest subsequence of pairs with increasing second items.
+
+    The pairs must be sorted on their (unique) first items.
+    """
+    # Patience sorting: tails[k] is the index in pairs of the smallest
+    # second item ending an increasing subsequence of length k+1
+    tails = []
+    tail_values = []
+    previous = [None] * len(pairs)
+    for i, (_, j) in enumerate(pairs):
+        k = bisect.bisect_left(tail_values, j)
+        if k > 0:
+            previous[i] = tails[k - 1]
+        if k == len(tails):
+            tails.append(i)
+            tail_values.append(j)
+        else:
+            tails[k] = i
+            tail_values[k] = j
+    result = []
+    i = tails[-1] if tails else None
+    while i is not None:
+        result.append(pairs[i])
+        i = previous[i]
+    result.reverse()
+    return result
+
+
+def align_rows(arows, brows):
+    """Align two lists of rows.
+
+    Rows with a key occurring once in each table are aligned first, keeping
+    the largest set of such pairs in the same order in both tables. Rows
+    between these are aligned on equal contents. Returns a list of pairs
+    (i, j) of indices of aligned rows in arows and brows, in order.
+    """
+    acount = Counter(r.key for r in arows if r.key is not None)
+    bcount = Counter(r.key for r in brows if r.key is not None)
+    bindex = {r.key: j for j, r in enumerate(brows)
+              if r.key is not None and bcount[r.key] == 1}
+    candidates = [(i, bindex[r.key]) for i, r in enumerate(arows)
+                  if r.key in bindex and acount[r.key] == 1]
+    anchors = _increasing_pairs(candidates)
+
+    aligned = []
+    i0 = j0 = 0
+    for i1, j1 in anchors + [(len(arows), len(brows))]:
+        # Align rows with equal contents between anchors
+        if i1 > i0 and j1 > j0:
+            s = SequenceMatcher(None, [r.text for r in arows[i0:i1]],
+                                [r.text for r in brows[j0:j1]], autojunk=False)
+            for action, ai, aj, bi, bj in s.get_opcodes():
+                if action == "equal" or (action == "replace" and aj - ai == bj - bi and
+                                         all(arows[i0 + k].key == brows[j0 + bi - ai + k].key
+                                             for k in range(ai, aj))):
+                    # Equal rows, or changed rows with matching keys
+                    aligned.extend((i0 + k, j0 + bi - ai + k) for k in range(ai, aj))
+        if i1 < len(arows):
+            aligned.append((i1, j1))
+        i0 = i1 + 1
+        j0 = j1 + 1
+    return aligned
+
+
+def _diff_row(arow, brow):
+    "Diff two aligned rows, with line numbers relative to the row start."
+    if arow.stop - arow.start == 1 and brow.stop - brow.start == 1:
+        return [op_patch(0, diff_strings_by_char(arow.text, brow.text))]
+    return diff_strings_linewise(arow.text, brow.text)
+
+
+def diff_table_rows(alines, blines, arows, brows):
+    "Compute the line based diff of two tables split into rows."
+    di = SequenceDiffBuilder()
+    nalines = len(alines)
+
+    def line_of(i):
+        return arows[i].start if i < len(arows) else nalines
+
+    i0 = j0 = 0
+    for i1, j1 in align_rows(arows, brows) + [(len(arows), len(brows))]:
+        # Rows between aligned pairs are added and removed
+        added = blines[brows[j0].start:brows[j1 - 1].stop] if j1 > j0 else []
+        rowdiff = []
+        if i1 < len(arows):
+            arow = arows[i1]
+            brow = brows[j1]
+            if arow.text != brow.text:
+                rowdiff = [offset_op(e, arow.start) for e in _diff_row(arow, brow)]
+        if added and i1 == i0 and rowdiff and rowdiff[0].op == DiffOp.ADDRANGE:
+            # The added rows and the lines added at the start of the
+            # changed row go in at the same line, join them in order
+            rowdiff[0] = op_addrange(rowdiff[0].key, added + rowdiff[0].valuelist)
+            added = []
+        if added:
+            di.addrange(line_of(i0), added)
+        if i1 > i0:
+            di.removerange(arows[i0].start, arows[i1 - 1].stop - arows[i0].start)
+        for e in rowdiff:
+            di.append(e)
+        i0 = i1 + 1
+        j0 = j1 + 1
+    return di.validated()
+
+
+def _split_table(mimetype, s):
+    lines = s.splitlines(True)
+    if mimetype.endswith("html"):
+        return split_html_rows(lines)
+    return split_text_rows(lines)
+
+
+def compare_mime_tables(mimetype, x, y, threshold):
+    """Compare two table-like html or plain text mime values by rows.
+
+    Returns True if the fraction of rows found in both tables exceeds
+    threshold, computed in linear time like difflib's quick_ratio but on
+    rows instead of characters, or None if either value is not a table.
+    """
+    xrows = _split_table(mimetype, x)
+    if xrows is None:
+        return None
+    yrows = _split_table(mimetype, y)
+    if yrows is None:
+        return None
+    common = Counter(r.text for r in xrows) & Counter(r.text for r in yrows)
+    ratio = 2.0 * sum(common.values()) / (len(xrows) + len(yrows))
+    return ratio > threshold
+
+
+def diff_mime_table(a, b, path="", predicates=None, differs=None):
+    """Diff two table-like html or plain text mime values by rows.
+
+    Values which do not look like tables are diffed as plain strings.
+    """
+    if not (isinstance(a, string_types) and isinstance(b, string_types)):
+        return diff(a, b)
+    if a == b:
+        return []
+    mimetype = path.lower()
+    arows = _split_table(mimetype, a)
+    brows = _split_table(mimetype, b) if arows is not None else None
+    if brows is None:
+        return diff(a, b)
+    return diff_table_rows(a.splitlines(True), b.splitlines(True), arows, brows)
@@ -14,6 +14,12 @@ Enable in your global git config with:
 Use with:
 
     git diff [<commit> [<commit>]]
+
+To only summarize the changes to notebooks, or to only list the notebooks
+with changes to their contents, configure the driver command as
+`git-nbdiffdriver diff --stat` or `git-nbdiffdriver diff --quiet`.
+Likewise, `--include` and `--exclude` select the parts of notebooks to
+diff, e.g. `git-nbdiffdriver diff --exclude /cells/*/outputs`.
 """
 
 from __future__ import print_function
@@ -24,6 +30,7 @@ import sys
 from subprocess import check_call, check_output, CalledProcessError
 
 from . import nbdiffapp
+from .args import add_diff_filter_args, add_diff_summary_args
 from .utils import locate_gitattributes
 
 def enable(global_=False):
@@ -82,6 +89,8 @@ def main(args=None):
     diff_parser.add_argument('b_sha1', nargs='?', default=None)
     diff_parser.add_argument('b_mode', nargs='?', default=None)
     diff_parser.add_argument('rename_to', nargs='?', default=None)
+    add_diff_filter_args(diff_parser)
+    add_diff_summary_args(diff_parser)
 
     # TODO: From git docs: "For a path that is unmerged, GIT_EXTERNAL_DIFF is called with 1 parameter, <path>."
 
@@ -101,7 +110,23 @@ def main(args=None):
     )
     opts = parser.parse_args(args)
     if opts.subcommand == 'diff':
-        return nbdiffapp.main([opts.a, opts.b])
+        diff_args = [opts.a, opts.b]
+        for path in opts.include:
+            diff_args.append('--include=' + path)
+        for path in opts.exclude:
+            diff_args.append('--exclude=' + path)
+        if opts.cells:
+            diff_args.append('--cells=%s:%s' % tuple(
+                '' if i is None else i for i in opts.cells))
+        if opts.quiet:
+            # Git treats a nonzero exit code from the driver as an error,
+            # so report differing notebooks by path instead
+            if nbdiffapp.main(diff_args + ['--quiet']):
+                print(opts.path)
+            return 0
+        if opts.stat:
+            return nbdiffapp.main(diff_args + ['--stat'])
+        return nbdiffapp.main(diff_args)
     elif opts.subcommand == 'config':
         opts.config_func(opts.global_)
         return 0
@@ -26,16 +26,20 @@ from subprocess import check_call, check_output, CalledProcessError
 
 import nbdime.log
 from . import nbmergeapp
+from .merging.rerere import MergeCache
 from .args import add_generic_args, add_diff_args, add_merge_args, add_filename_args
 from .utils import locate_gitattributes
 
-def enable(global_=False):
+def enable(global_=False, rerere=False):
     """Enable nbdime git merge driver"""
     cmd = ['git', 'config']
     if global_:
         cmd.append('--global')
 
-    check_call(cmd + ['merge.jupyternotebook.driver', 'git-nbmergedriver merge %O %A %B %L %P'])
+    driver = 'git-nbmergedriver merge %O %A %B %L %P'
+    if rerere:
+        driver = 'git-nbmergedriver merge --rerere %O %A %B %L %P'
+    check_call(cmd + ['merge.jupyternotebook.driver', driver])
     check_call(cmd + ['merge.jupyternotebook.name', 'jupyter notebook merge driver'])
 
     gitattributes = locate_gitattributes(global_)
@@ -65,6 +69,17 @@ def disable(global_=False):
         pass
 
 
+def rerere_gc():
+    """Remove expired records of reused merges, see MergeCache.gc"""
+    cache = MergeCache.in_repository()
+    if cache is None:
+        print("Not in a git repository", file=sys.stderr)
+        return 1
+    removed = cache.gc()
+    nbdime.log.info("Removed %d expired records from %s", removed, cache.path)
+    return 0
+
+
 def main(args=None):
     if args is None:
         args = sys.argv[1:]
@@ -95,6 +110,9 @@ def main(args=None):
     config.add_argument('--global', action='store_true', dest='global_',
         help="configure your global git config instead of the current repo"
     )
+    config.add_argument('--rerere', action='store_true',
+        help="reuse recorded resolutions of notebook conflicts"
+    )
     enable_disable = config.add_mutually_exclusive_group(required=True)
     enable_disable.add_argument('--enable', action='store_const',
         dest='config_func', const=enable,
@@ -104,6 +122,10 @@ def main(args=None):
         dest='config_func', const=disable,
         help="disable nbdime merge driver via git config"
     )
+
+    subparsers.add_parser('rerere-gc',
+        description="Remove records of notebook merges and resolutions "
+                    "not used recently, like `git rerere gc`")
     opts = parser.parse_args(args)
     nbdime.log.init_logging(level=opts.log_level)
     if opts.subcommand == 'merge':
@@ -115,8 +137,13 @@ def main(args=None):
         opts.decisions = False
         return nbmergeapp.main_merge(opts)
     elif opts.subcommand == 'config':
-        opts.config_func(opts.global_)
+        if opts.config_func is enable:
+            enable(opts.global_, opts.rerere)
+        else:
+            disable(opts.global_)
         return 0
+    elif opts.subcommand == 'rerere-gc':
+        return rerere_gc()
     else:
         parser.print_help()
         return 1
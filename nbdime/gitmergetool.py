@@ -19,14 +19,17 @@ from .webapp import nbmergetool
 from .args import add_filename_args, add_generic_args
 
 
-def enable(global_=False, set_default=False):
+def enable(global_=False, set_default=False, rerere=False):
     """Enable nbdime git mergetool"""
     cmd = ['git', 'config']
     if global_:
         cmd.append('--global')
 
     # Register CLI tool
-    check_call(cmd + ['mergetool.nbdime.cmd', 'git-nbmergetool merge "$BASE" "$LOCAL" "$REMOTE" "$MERGED"'])
+    tool = 'git-nbmergetool merge "$BASE" "$LOCAL" "$REMOTE" "$MERGED"'
+    if rerere:
+        tool = 'git-nbmergetool merge --rerere "$BASE" "$LOCAL" "$REMOTE" "$MERGED"'
+    check_call(cmd + ['mergetool.nbdime.cmd', tool])
 
     # Common setting:
     check_call(cmd + ['mergetool.prompt', 'false'])
@@ -36,7 +39,7 @@ def enable(global_=False, set_default=False):
         check_call(cmd + ['merge.tool', 'nbdime'])
 
 
-def disable(global_=False, *args):
+def disable(global_=False):
     """Disable nbdime git mergetool"""
     cmd = ['git', 'config']
     if global_:
@@ -71,6 +74,9 @@ def main(args=None):
     config.add_argument('--set-default', action='store_true', dest='set_default',
         help="set nbdime as default mergetool"
     )
+    config.add_argument('--rerere', action='store_true',
+        help="record resolutions of notebook conflicts for reuse"
+    )
     enable_disable = config.add_mutually_exclusive_group(required=True)
     enable_disable.add_argument('--enable', action='store_const',
         dest='config_func', const=enable,
@@ -85,7 +91,10 @@ def main(args=None):
     if opts.subcommand == 'merge':
         return nbmergetool.main_parsed(opts)
     elif opts.subcommand == 'config':
-        opts.config_func(opts.global_, opts.set_default)
+        if opts.config_func is enable:
+            enable(opts.global_, opts.set_default, opts.rerere)
+        else:
+            disable(opts.global_)
         return 0
     else:
         parser.print_help()
@@ -0,0 +1,138 @@
+# coding: utf-8
+
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+"""Incremental JSON encoding of diffs, merge decisions and notebooks.
+
+The functions here produce the same text as `json.dumps` with the same
+arguments, but yield it in bounded chunks while walking the object tree,
+so that large documents can be written to a file or socket without
+building the full JSON string in memory first.
+"""
+
+from __future__ import unicode_literals
+
+import json
+from six import string_types, integer_types
+
+
+__all__ = ["iter_json", "dump_json"]
+
+
+# Approximate number of characters to collect before yielding a chunk
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+
+def _encode_key(key):
+    "Encode a dict key the same way json does, as a JSON string."
+    if not isinstance(key, string_types):
+        if key is None or isinstance(key, (bool, float) + integer_types):
+            key = json.dumps(key)
+        else:
+            raise TypeError("keys must be str, int, float, bool or None, "
+                            "not {}".format(type(key).__name__))
+    return json.dumps(key)
+
+
+def _iter_tokens(obj, indent, item_separator, key_separator, level):
+    "Generate JSON tokens for obj, recursing into dicts and lists."
+    if isinstance(obj, dict):
+        if not obj:
+            yield "{}"
+            return
+        yield "{"
+        if indent is not None:
+            level += 1
+            newline_indent = "\n" + indent * level
+            separator = item_separator + newline_indent
+            yield newline_indent
+        else:
+            separator = item_separator
+        first = True
+        for key, value in obj.items():
+            if first:
+                first = False
+            else:
+                yield separator
+            yield _encode_key(key)
+            yield key_separator
+            for token in _iter_tokens(value, indent, item_separator,
+                                      key_separator, level):
+                yield token
+        if indent is not None:
+            level -= 1
+            yield "\n" + indent * level
+        yield "}"
+    elif isinstance(obj, (list, tuple)):
+        if not obj:
+            yield "[]"
+            return
+        yield "["
+        if indent is not None:
+            level += 1
+            newline_indent = "\n" + indent * level
+            separator = item_separator + newline_indent
+            yield newline_indent
+        else:
+            separator = item_separator
+        first = True
+        for value in obj:
+            if first:
+                first = False
+            else:
+                yield separator
+            for token in _iter_tokens(value, indent, item_separator,
+                                      key_separator, level):
+                yield token
+        if indent is not None:
+            level -= 1
+            yield "\n" + indent * level
+        yield "]"
+    else:
+        # Leaf values are encoded by the (C accelerated) json module
+        yield json.dumps(obj)
+
+
+def iter_json(obj, indent=None, separators=None,
+              chunk_size=DEFAULT_CHUNK_SIZE):
+    """Iterate over the JSON encoding of obj in chunks.
+
+    The concatenation of all chunks equals `json.dumps(obj, indent=indent,
+    separators=separators)`. Dict subclasses such as DiffEntry,
+    MergeDecision and NotebookNode are encoded as plain objects.
+
+    Each chunk holds roughly chunk_size characters, except when a single
+    leaf value (e.g. a long string) is larger than that.
+    """
+    if isinstance(indent, integer_types):
+        indent = " " * indent
+    if separators is not None:
+        item_separator, key_separator = separators
+    elif indent is not None:
+        item_separator, key_separator = ",", ": "
+    else:
+        item_separator, key_separator = ", ", ": "
+
+    buf = []
+    size = 0
+    for token in _iter_tokens(obj, indent, item_separator, key_separator, 0):
+        buf.append(token)
+        size += len(token)
+        if size >= chunk_size:
+            yield "".join(buf)
+            buf = []
+            size = 0
+    if buf:
+        yield "".join(buf)
+
+
+def dump_json(obj, fp, indent=None, separators=None,
+              chunk_size=DEFAULT_CHUNK_SIZE):
+    """Write the JSON encoding of obj to the file-like object fp in chunks.
+
+    Accepts the same formatting arguments as iter_json.
+    """
+    for chunk in iter_json(obj, indent=indent, separators=separators,
+                           chunk_size=chunk_size):
+        fp.write(chunk)
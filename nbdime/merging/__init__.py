@@ -7,6 +7,7 @@ from __future__ import unicode_literals
 
 from .generic import decide_merge
 from .decisions import apply_decisions
-from .notebooks import merge_notebooks
+from .notebooks import merge_notebooks, merge_notebooks_nway
 
-__all__ = ["decide_merge", "merge_notebooks", "apply_decisions"]
+__all__ = ["decide_merge", "merge_notebooks", "merge_notebooks_nway",
+           "apply_decisions"]
@@ -8,6 +8,7 @@ from __future__ import print_function, unicode_literals
 from six import string_types
 import copy
 import logging
+from collections import OrderedDict
 from itertools import chain
 
 import nbformat
@@ -19,7 +20,7 @@ from .chunks import make_merge_chunks
 from ..utils import join_path, split_path, star_path, is_prefix_array, resolve_path
 from .decisions import (pop_patch_decision, push_patch_decision, MergeDecision,
                         pop_all_patch_decisions, _sort_key,
-                        filter_decisions, build_diffs,
+                        DecisionIndex, build_diffs,
                         )
 from ..prettyprint import merge_render
 
@@ -28,6 +29,11 @@ import nbdime.log
 _logger = logging.getLogger(__name__)
 
 
+# Conflicts in at least this many cells are autoresolved in a pool of
+# worker processes, set to None to always autoresolve in one process
+parallel_autoresolve_min_cells = 200
+
+
 def add_conflicts_record(value, le, re):
     """Add an item 'nbdime-conflicts' to a metadata dict.
 
@@ -396,7 +402,7 @@ def autoresolve_decision_on_list(dec, base, sub, strategies):
     rd = dec.remote_diff
 
     # Query how to handle conflicts in this part of the document
-    strategy = strategies.get(join_path(dec.common_path + ('*',)))
+    strategy = strategies.get(dec.common_path + ('*',))
 
     # Cutting off handling of strategies of subitems if there's a strategy for these list items
     if strategy:
@@ -518,7 +524,7 @@ def autoresolve_decision_on_dict(dec, base, sub, strategies):
     # Query how to handle conflicts in this part of the document
     key = ld[0].key
     subpath = join_path(dec.common_path + (key,))
-    strategy = strategies.get(subpath)
+    strategy = strategies.get(dec.common_path + (key,))
 
     # Get value and conflicts
     le, = ld
@@ -574,7 +580,7 @@ def autoresolve_decision(base, dec, strategies):
 
     for key in dec.common_path:
         subpath = subpath + (key,)
-        strategy = strategies.get(join_path(subpath))
+        strategy = strategies.get(subpath)
         if strategy is not None:
             # Strategy found for intermediate path
             # Bring decision up to same level as strategy:
@@ -810,32 +816,119 @@ def autoresolve_cells(base, decisions, strategies):
     return autoresolve_generic(base, decisions, strategies)
 
 
-def bundle_decisions(base, decisions, pattern, callback):
-    indices = filter_decisions(pattern, decisions)
-    index_set = set(indices)
-    # all the decisions I'm not bundling:
-    other_decisions = [decisions[i] for i in range(len(decisions)) if i not in index_set]
+def bundle_decisions(base, decisions, pattern, callback, index=None):
+    """Bundle the decisions matching pattern on each matching prefix.
 
-    # group decisions on any given source
-    decision_groups = {}
-    for i in indices:
-        dec = decisions[i]
-        level = len(split_path(pattern))
-        prefix = dec.common_path[:level]
-        if prefix not in decision_groups:
-            decision_groups[prefix] = []
-        dec._level = level
-        decision_groups[prefix].append(dec)
+    index is a DecisionIndex of decisions, built if not given.
+    """
+    return bundle_all_decisions(base, decisions, [(pattern, callback)], index)
+
+
+def bundle_all_decisions(base, decisions, bundles, index=None):
+    """Bundle decisions for a list of (pattern, callback) pairs.
 
-    # create bundles for each unique prefix
+    The patterns must match disjoint sets of decisions, as the decisions
+    are looked up once in a shared DecisionIndex.
+    """
+    if index is None:
+        index = DecisionIndex(decisions)
+    index_set = set()
     affected_decisions = []
-    for prefix, dec_group in decision_groups.items():
-        affected_decisions.extend(make_bundled_decisions(
-            base, prefix, dec_group, callback))
+    for pattern, callback in bundles:
+        indices = index.filter(pattern)
+        index_set.update(indices)
+
+        # group decisions on any given source
+        level = len(split_path(pattern))
+        decision_groups = {}
+        for i in indices:
+            dec = decisions[i]
+            prefix = dec.common_path[:level]
+            if prefix not in decision_groups:
+                decision_groups[prefix] = []
+            dec._level = level
+            decision_groups[prefix].append(dec)
+
+        # create bundles for each unique prefix
+        for prefix, dec_group in decision_groups.items():
+            affected_decisions.extend(make_bundled_decisions(
+                base, prefix, dec_group, callback))
 
+    # all the decisions I'm not bundling:
+    other_decisions = [decisions[i] for i in range(len(decisions)) if i not in index_set]
     return other_decisions + affected_decisions
 
 
+def group_decisions_by_cell(decisions):
+    """Group cell decisions by the cell they change.
+
+    Decisions on the list of cells itself form one group. The groups are
+    in order of their first decision, and keep the order of decisions.
+    """
+    groups = OrderedDict()
+    for dec in decisions:
+        groups.setdefault(tuple(dec.common_path[:2]), []).append(dec)
+    return list(groups.values())
+
+
+def autoresolve_cell_group(base, decisions, strategies, bundles):
+    "Autoresolve a group of cell decisions, after bundling them."
+    if bundles:
+        decisions = bundle_all_decisions(base, decisions, bundles)
+    return autoresolve_cells(base, decisions, strategies)
+
+
+# The arguments shared by the tasks of a worker process
+_worker_args = None
+
+
+def _init_autoresolve_worker(base, strategies, bundles):
+    global _worker_args
+    _worker_args = (base, strategies, bundles)
+
+
+def _autoresolve_cell_group_in_worker(decisions):
+    base, strategies, bundles = _worker_args
+    return autoresolve_cell_group(base, decisions, strategies, bundles)
+
+
+def autoresolve_cells_parallel(base, groups, strategies, bundles):
+    """Autoresolve groups of decisions on separate cells in worker processes.
+
+    The groups with conflicts are resolved in a pool of worker processes,
+    and the results joined in the order of the groups, as if resolved one
+    by one. Returns None if no pool can be started, or if there is only
+    one processor to run it on.
+    """
+    try:
+        import multiprocessing
+        if multiprocessing.cpu_count() < 2:
+            return None
+        pool = multiprocessing.Pool(initializer=_init_autoresolve_worker,
+                                    initargs=(base, strategies, bundles))
+    except (ImportError, NotImplementedError, OSError) as e:
+        nbdime.log.debug("Autoresolving in a single process: %s", e)
+        return None
+
+    conflicted = [g for g in groups if any(dec.conflict for dec in g)]
+    try:
+        # Send the groups in chunks, a few per worker
+        chunksize = max(1, len(conflicted) // (4 * multiprocessing.cpu_count()))
+        resolved = iter(pool.map(_autoresolve_cell_group_in_worker, conflicted,
+                                 chunksize))
+    finally:
+        pool.terminate()
+        pool.join()
+
+    decisions = []
+    for group in groups:
+        if any(dec.conflict for dec in group):
+            decisions.extend(next(resolved))
+        else:
+            decisions.extend(group)
+    return decisions
+
+
 def autoresolve(base, decisions, strategies):
     """Autoresolve a list of decisions with given strategy configuration.
 
@@ -843,27 +936,33 @@ def autoresolve(base, decisions, strategies):
     """
     generic_decisions, cell_decisions = split_decisions_by_cell(decisions)
 
+    bundles = []
     if strategies.get('/cells/*/source') == 'inline-source':
-        cell_decisions = bundle_decisions(
-            base, cell_decisions, "/cells/*/source", make_inline_source_decision)
+        bundles.append(("/cells/*/source", make_inline_source_decision))
 
     if strategies.get('/cells/*/outputs') == 'remove':
-        cell_decisions = bundle_decisions(
-            base, cell_decisions, "/cells/*/outputs", make_remove_decision)
+        bundles.append(("/cells/*/outputs", make_remove_decision))
     elif strategies.get('/cells/*/outputs') == 'clear-all':
-        cell_decisions = bundle_decisions(
-            base, cell_decisions, '/cells/*/outputs', make_clear_all_decision)
+        bundles.append(('/cells/*/outputs', make_clear_all_decision))
     elif strategies.get('/cells/*/outputs') == 'inline-outputs':
-        cell_decisions = bundle_decisions(
-            base, cell_decisions, '/cells/*/outputs', make_inline_outputs_decision)
+        bundles.append(('/cells/*/outputs', make_inline_outputs_decision))
 
     if strategies.get('/cells/*/attachments') == 'inline-attachments':
-        cell_decisions = bundle_decisions(
-            base, cell_decisions, '/cells/*/attachments', make_inline_attachments_decision)
+        bundles.append(('/cells/*/attachments', make_inline_attachments_decision))
+
+    # Decisions on separate cells are independent, and can be resolved
+    # in parallel when conflicts span many cells
+    resolved = None
+    if parallel_autoresolve_min_cells is not None:
+        groups = group_decisions_by_cell(cell_decisions)
+        nconflicted = sum(any(dec.conflict for dec in g) for g in groups)
+        if nconflicted >= parallel_autoresolve_min_cells:
+            resolved = autoresolve_cells_parallel(base, groups, strategies, bundles)
+    if resolved is None:
+        resolved = autoresolve_cell_group(base, cell_decisions, strategies, bundles)
+    cell_decisions = resolved
 
     generic_decisions = autoresolve_generic(base, generic_decisions, strategies)
 
-    cell_decisions = autoresolve_cells(base, cell_decisions, strategies)
-
     decisions = generic_decisions + cell_decisions
     return sorted(decisions, key=_sort_key, reverse=True)
@@ -9,13 +9,16 @@ from six import string_types, text_type
 from six.moves import xrange as range
 
 import copy
+import itertools
 import nbformat
+from nbformat import NotebookNode
 
 from ..diff_format import (
     DiffOp, op_removerange, op_remove, op_patch, op_replace)
 from ..patching import patch
 from ..utils import (
-    r_is_int, star_path, join_path, is_prefix_array, find_shared_prefix)
+    r_is_int, star_key, split_path, join_path, resolve_path,
+    is_prefix_array, find_shared_prefix)
 
 
 class MergeDecision(dict):
@@ -23,10 +26,16 @@ class MergeDecision(dict):
 
     Minimal class providing attribute access to merge decision keys.
 
-    Tip: If performance dictates, we can easily replace this
-    with a namedtuple during processing of diffs and convert
-    to dicts before any json conversions.
+    The decision is its own json representation, while the sort key of
+    its common path is computed on first use and kept until the common
+    path is changed. The standard keys are read through properties, other
+    keys through __getattr__.
     """
+    __slots__ = ("_path_key",)
+
+    def __init__(self, *args, **kwargs):
+        super(MergeDecision, self).__init__(*args, **kwargs)
+        object.__setattr__(self, "_path_key", None)
 
     def __getattr__(self, name):
         if name.startswith("__") and name.endswith("__"):
@@ -36,11 +45,47 @@ class MergeDecision(dict):
     def __setattr__(self, name, value):
         self[name] = value
 
+    def __setitem__(self, key, value):
+        if key == "common_path":
+            object.__setattr__(self, "_path_key", None)
+        super(MergeDecision, self).__setitem__(key, value)
+
+    def __copy__(self):
+        return MergeDecision(self)
+
+    def __reduce__(self):
+        return (MergeDecision, (dict(self),))
+
+    common_path = property(lambda self: self["common_path"])
+    action = property(lambda self: self["action"])
+    conflict = property(lambda self: self["conflict"])
+    local_diff = property(lambda self: self["local_diff"])
+    remote_diff = property(lambda self: self["remote_diff"])
+    custom_diff = property(lambda self: self["custom_diff"])
+
+    @property
+    def sort_key(self):
+        "The key sorting decisions in the order of application, see _sort_key."
+        key = self._path_key
+        if key is None:
+            key = _path_sort_key(self["common_path"])
+            object.__setattr__(self, "_path_key", key)
+        return key
+
     def local_path(self):
         level = self.get('_level', 0)
         return (self.common_path or ())[level:]
 
 
+def _as_diff_list(diff):
+    "Return diff, a diff entry or a sequence of them, as a list or None."
+    if diff is None or isinstance(diff, list):
+        return diff
+    if isinstance(diff, tuple):
+        return list(diff)
+    return [diff]
+
+
 class MergeDecisionBuilder(object):
     """A helper class for building a series of decisions to describe a merge.
     """
@@ -68,22 +113,9 @@ class MergeDecisionBuilder(object):
         else:
             assert isinstance(path, tuple)
         # Ensure diffs are lists
-        if local_diff is not None:
-            if isinstance(local_diff, tuple):
-                local_diff = list(local_diff)
-            elif not isinstance(local_diff, list):
-                local_diff = [local_diff]
-        if remote_diff is not None:
-            if isinstance(remote_diff, tuple):
-                remote_diff = list(remote_diff)
-            elif not isinstance(remote_diff, list):
-                remote_diff = [remote_diff]
-        custom_diff = kwargs.pop("custom_diff", None)
-        if custom_diff is not None:
-            if isinstance(custom_diff, tuple):
-                custom_diff = list(custom_diff)
-            elif not isinstance(custom_diff, list):
-                custom_diff = [custom_diff]
+        local_diff = _as_diff_list(local_diff)
+        remote_diff = _as_diff_list(remote_diff)
+        custom_diff = _as_diff_list(kwargs.pop("custom_diff", None))
         # Ensure paths are pushed out as far in tree as possible
         path, (local_diff, remote_diff, custom_diff) = \
             ensure_common_path(path, [local_diff, remote_diff, custom_diff])
@@ -290,7 +322,7 @@ def push_patch_decision(decision, prefix):
     return dec
 
 
-def _sort_key(k):
+def _path_sort_key(path):
     """Sort key for common paths. Ensures the correct order for processing,
     without having to care about offsetting indices.
 
@@ -317,7 +349,7 @@ def _sort_key(k):
     SOFTWARE.
     """
     ret = []
-    for s in k.common_path:
+    for s in path:
         if not isinstance(s, (int, text_type)):
             s = s.decode("utf8")
         if isinstance(s, text_type) and r_is_int.match(s):
@@ -326,7 +358,42 @@ def _sort_key(k):
             ret.append(('', -s))
         else:
             ret.append((s,))
-    return ret
+    return tuple(ret)
+
+
+def _sort_key(k):
+    """Sort key for decisions. Ensures the correct order for processing,
+    without having to care about offsetting indices.
+    """
+    return k.sort_key
+
+
+def _position_key(md):
+    "Sort key for the position in the value at its path of the first change of a decision."
+    keys = []
+    for dkey in ("local_diff", "remote_diff", "custom_diff"):
+        diff = md.get(dkey)
+        if diff:
+            # Insertions come before other entries at the same key
+            keys.append((diff[0].key, diff[0].op != DiffOp.ADDRANGE))
+    return min(keys) if keys else ()
+
+
+def _sorted_decisions(items, decision=None):
+    """Sort decisions in the order of application, see _sort_key.
+
+    The diffs of decisions on the same path are applied together, in the
+    order of the decisions, so these are ordered by the position of their
+    changes. items are decisions, or values mapped to decisions by the
+    function decision.
+    """
+    if decision is None:
+        decision = lambda md: md
+    items = sorted(items, key=lambda x: _sort_key(decision(x)), reverse=True)
+    result = []
+    for _, group in itertools.groupby(items, key=lambda x: _sort_key(decision(x))):
+        result.extend(sorted(group, key=lambda x: _position_key(decision(x))))
+    return result
 
 
 def split_string_path(base, path):
@@ -363,19 +430,61 @@ def make_cleared_value(value):
         return None
 
 
+def _decision_star_keys(decision):
+    "Return the starred keys of the path of the changes of a decision."
+    path = decision.common_path
+    pop = _pop_path((decision.local_diff, decision.remote_diff, decision.get('custom_diff')))
+    if pop:
+        path = path + (pop["key"],)
+    return [star_key(key) for key in path if key not in ("", "/")]
+
+
+class DecisionIndex(object):
+    """Index of a list of decisions by the starred paths of their changes.
+
+    Decisions are kept in a trie of path keys, such that finding the
+    decisions matching a pattern walks the pattern once, instead of
+    starring the path of every decision for each pattern.
+    """
+
+    def __init__(self, decisions):
+        self.decisions = decisions
+        # Nodes map path keys to child nodes, and None to decision indices
+        self._trie = {}
+        for i, dec in enumerate(decisions):
+            node = self._trie
+            for key in _decision_star_keys(dec):
+                node = node.setdefault(key, {})
+            node.setdefault(None, []).append(i)
+
+    def filter(self, pattern, exact=False):
+        """Return the indices of the decisions matching a starred pattern.
+
+        Decisions match if their path starts with the pattern, or equals
+        the pattern if exact is True. The indices are in increasing order.
+        """
+        node = self._trie
+        for key in split_path(pattern):
+            node = node.get(key)
+            if node is None:
+                return []
+        if exact:
+            return list(node.get(None, ()))
+        indices = []
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            for key, value in node.items():
+                if key is None:
+                    indices.extend(value)
+                else:
+                    stack.append(value)
+        return sorted(indices)
+
+
 def filter_decisions(pattern, decisions, exact=False):
-    ret = []
-    cutoff = len(pattern)
-    for i, md in enumerate(decisions):
-        path = md.common_path[:]
-        pop = _pop_path((md.local_diff, md.remote_diff, md.get('custom_diff')))
-        if pop:
-            path = path + (pop["key"],)
-        starred_path = star_path(path)
-        if (exact and starred_path == pattern or
-                starred_path[:cutoff] == pattern):
-            ret.append(i)
-    return ret
+    "Return the indices of the decisions matching a starred pattern, see DecisionIndex."
+    return DecisionIndex(decisions).filter(pattern, exact)
 
 
 # =============================================================================
@@ -385,15 +494,20 @@ def filter_decisions(pattern, decisions, exact=False):
 # =============================================================================
 
 def resolve_action(base, decision):
+    """Return the diff resolving decision, to be applied to base.
+
+    The returned list may be a diff of the decision itself, and must not
+    be modified.
+    """
     a = decision.action
     if a == "base":
         return []   # no-op
     elif a in ("local", "either"):
-        return copy.copy(decision.local_diff)
+        return decision.local_diff
     elif a == "remote":
-        return copy.copy(decision.remote_diff)
+        return decision.remote_diff
     elif a == "custom":
-        return copy.copy(decision.custom_diff)
+        return decision.custom_diff
     elif a == "local_then_remote":
         return decision.local_diff + decision.remote_diff
     elif a == "remote_then_local":
@@ -421,10 +535,40 @@ def resolve_action(base, decision):
         raise NotImplementedError("The action \"%s\" is not defined" % a)
 
 
+def _shallow_copy(value):
+    "Copy a container, sharing its items."
+    if isinstance(value, dict):
+        return NotebookNode(value)
+    return list(value)
+
+
 def apply_decisions(base, decisions):
     """Apply a list of merge decisions to base.
+
+    The merged result is built copy-on-write: only the containers on the
+    paths of the decisions are copied, and all other values are shared
+    with base. Neither base nor the result should be modified in place
+    afterwards. If base is a NotebookNode, as returned by nbformat.read,
+    the result is a NotebookNode without converting it as a whole.
     """
-    merged = copy.deepcopy(base)
+    # Containers created for the merged result, which may be modified in
+    # place. Keeping references to them keeps their ids unique.
+    owned = {}
+
+    def own(value):
+        if id(value) not in owned:
+            value = _shallow_copy(value)
+            owned[id(value)] = value
+        return value
+
+    def apply(resolved, diffs):
+        value = patch(resolved, diffs, share=True)
+        if isinstance(value, (dict, list)):
+            # The patched container is new, the values in it may be shared
+            owned[id(value)] = value
+        return value
+
+    merged = own(base)
     prev_path = None
     parent = None
     last_key = None
@@ -458,35 +602,46 @@ def apply_decisions(base, decisions):
                 # First, apply previous diffs
                 if parent is None:
                     # Operations on root create new merged object
-                    merged = patch(resolved, diffs)
+                    merged = apply(resolved, diffs)
                 else:
-                    # If not, overwrite entry in parent (which is an entry in
-                    # merged). This is ok, as no paths should point to
-                    # subobjects of the patched object
-                    parent[last_key] = patch(resolved, diffs)
+                    # If not, overwrite entry in parent (which is an owned
+                    # container in merged). This is ok, as no paths should
+                    # point to subobjects of the patched object
+                    parent[last_key] = apply(resolved, diffs)
 
             prev_path = path
-            # Resolve path in base and output
+            # Resolve path in merged, copying the containers on the path
+            # which are still shared with base
             resolved = merged
             parent = None
             last_key = None
-            for key in path:
+            for i, key in enumerate(path):
                 parent = resolved
                 resolved = resolved[key]   # Should raise if key missing
                 last_key = key
+                if i < len(path) - 1:
+                    owned_value = own(resolved)
+                    if owned_value is not resolved:
+                        parent[key] = resolved = owned_value
             diffs = resolve_action(resolved, md)
             if line:
                 diffs = push_path(line, diffs)
+            # Copy once, as diffs may be a list owned by a decision,
+            # and extend the copy with the diffs on the same path
+            diffs = list(diffs)
             clear_all_flag = md.action == "clear_all"
     # Apply the last collection of diffs, if present (same as above)
     if prev_path is not None:
         if parent is None:
-            merged = patch(resolved, diffs)
+            merged = apply(resolved, diffs)
         else:
-            parent[last_key] = patch(resolved, diffs)
+            parent[last_key] = apply(resolved, diffs)
 
-    merged = nbformat.from_dict(merged)
-    return merged
+    if isinstance(base, NotebookNode):
+        # Shared values are NotebookNodes already, and patch creates
+        # NotebookNodes for patched and inserted values
+        return merged
+    return nbformat.from_dict(merged)
 
 
 def _merge_tree(tree, sorted_paths):
@@ -527,6 +682,36 @@ def _merge_tree(tree, sorted_paths):
     return trunk
 
 
+def merged_diff(base, decisions):
+    """Return the diff from base to the result of applying decisions.
+
+    The diffs resolving the decisions are nested in patches on their
+    paths, such that patch(base, merged_diff(base, decisions)) equals
+    apply_decisions(base, decisions). The diffs of decisions on the same
+    path are kept in the order given, as apply_decisions patches them in
+    one operation, and each is kept together, as the diff resolving a
+    decision may not be sorted by key.
+    """
+    tree = {}
+    children = {}
+    for md in decisions:
+        path, line = split_string_path(base, md.common_path)
+        ad = resolve_action(resolve_path(base, path), md)
+        path = path + line
+        tree.setdefault(path, []).append(ad)
+        for i in range(len(path)):
+            children.setdefault(path[:i], set()).add(path[i])
+
+    def nest(path):
+        units = [d for d in tree.get(path, ()) if d]
+        for key in children.get(path, ()):
+            units.append([op_patch(key, nest(path + (key,)))])
+        units.sort(key=lambda unit: (unit[0].key, unit[0].op != DiffOp.ADDRANGE))
+        return [e for unit in units for e in unit]
+
+    return nest(())
+
+
 def build_diffs(base, decisions, which):
     """
     Builds a diff for direct application on base. The `which` argument either
@@ -553,23 +738,27 @@ def build_diffs(base, decisions, which):
         str_path = join_path(path)
         if str_path in tree:
             # Existing tree entry, simply add diffs to it
+            entry = tree[str_path]
             if line:
-                match_diff = [d for d in tree[str_path]['diff'] if d.key == line[0]]
+                match_diff = [i for i, d in enumerate(entry['diff']) if d.key == line[0]]
                 if match_diff:
                     assert len(match_diff) == 1
-                    assert match_diff[0].diff
-                    match_diff[0].diff.extend(subdiffs)
+                    i = match_diff[0]
+                    d = entry['diff'][i]
+                    assert d.diff
+                    entry['diff'][i] = op_patch(d.key, d.diff + subdiffs)
                 else:
                     subdiffs = push_path(line, subdiffs)
                     assert len(subdiffs) == 1
-                    tree[str_path]['diff'].extend(subdiffs)
+                    entry['diff'].extend(subdiffs)
             else:
-                tree[str_path]['diff'].extend(subdiffs)
+                entry['diff'].extend(subdiffs)
         else:
             # Make new entry in tree
             if line:
                 subdiffs = push_path(line, subdiffs)
-            tree[str_path] = {'diff': subdiffs, 'path': path}
+            # Copy once, as subdiffs may be a list owned by a decision
+            tree[str_path] = {'diff': list(subdiffs), 'path': path}
             sorted_paths.append(str_path)
 
     if len(tree) == 0:
@@ -5,14 +5,19 @@
 
 from __future__ import unicode_literals
 
+import operator
+from difflib import SequenceMatcher
+
 from six import string_types
 
 from .decisions import MergeDecisionBuilder
 from .chunks import make_merge_chunks
 from ..diffing import diff
 from ..diff_format import (
-    DiffOp, as_dict_based_diff, op_patch, op_addrange, op_removerange)
-from ..diffing.notebooks import notebook_predicates, notebook_differs
+    DiffOp, op_patch, op_addrange, op_removerange)
+from ..diffing.notebooks import notebook_predicates
+from ..diffing.snakes import compute_snakes_multilevel
+from ..diffing.summary import hash_cell
 from ..patching import patch
 from ..utils import star_path
 
@@ -31,16 +36,43 @@ Missing = object()
 # =============================================================================
 
 
+def _sorted_by_key(diff):
+    "Return diff sorted on key, without copying if it already is."
+    if all(diff[i - 1].key < diff[i].key for i in range(1, len(diff))):
+        return diff
+    return sorted(diff, key=lambda e: e.key)
+
+
+def _paired_entries(local_diff, remote_diff):
+    """Iterate over (key, local entry, remote entry) of two mapping diffs.
+
+    The diffs are merge joined in order of key, with None for the entry
+    of the side with no diff for that key.
+    """
+    local_diff = _sorted_by_key(local_diff)
+    remote_diff = _sorted_by_key(remote_diff)
+    i = j = 0
+    nl = len(local_diff)
+    nr = len(remote_diff)
+    while i < nl or j < nr:
+        ld = local_diff[i] if i < nl else None
+        rd = remote_diff[j] if j < nr else None
+        if rd is None or (ld is not None and ld.key < rd.key):
+            yield ld.key, ld, None
+            i += 1
+        elif ld is None or rd.key < ld.key:
+            yield rd.key, None, rd
+            j += 1
+        else:
+            yield ld.key, ld, rd
+            i += 1
+            j += 1
+
+
 def _merge_dicts(base, local_diff, remote_diff, path, decisions):
     """Perform a three-way merge of dicts. See docstring of merge."""
     assert isinstance(base, dict)
 
-    # Converting to dict-based diff format for dicts for convenience
-    # This step will be unnecessary if we change the diff format to work this
-    # way always
-    local_diff = as_dict_based_diff(local_diff)
-    remote_diff = as_dict_based_diff(remote_diff)
-
     # Summary of diff entry cases with (#) references to below code
     # r\l | N/A   -   +   :   !
     # ----|----------------------
@@ -50,28 +82,18 @@ def _merge_dicts(base, local_diff, remote_diff, path, decisions):
     #  :  |  |    |  (5) (7) (5)
     #  !  | (3)  (5) (5  (5) (8)
 
-    # Get diff keys
-    bldkeys = set(local_diff.keys())
-    brdkeys = set(remote_diff.keys())
-    dkeys = bldkeys | brdkeys
-
-    # (1) Use base values for all keys with no change
-    for key in sorted(set(base.keys()) - dkeys):
-        pass
+    # (1) Keys with no change keep their base values, nothing to do
 
     # (2)-(3) Apply one-sided diffs
-    for key in sorted(bldkeys ^ brdkeys):
-        decisions.onesided(path,
-                           local_diff.get(key),
-                           remote_diff.get(key))
+    for key, ld, rd in _paired_entries(local_diff, remote_diff):
+        if ld is None or rd is None:
+            decisions.onesided(path, ld, rd)
 
     # (4) (5) (6) (7) (8)
     # Then we have the potentially conflicting changes
-    for key in sorted(brdkeys & bldkeys):
-        # Get diff entries for this key (we know both sides have an
-        # entry here because all other cases are covered above)
-        ld = local_diff[key]
-        rd = remote_diff[key]
+    for key, ld, rd in _paired_entries(local_diff, remote_diff):
+        if ld is None or rd is None:
+            continue
 
         # Get values (using Missing as a sentinel to allow None as a value)
         bv = base.get(key, Missing)
@@ -111,95 +133,107 @@ def _merge_dicts(base, local_diff, remote_diff, path, decisions):
             raise ValueError("Invalid diff ops {} and {}.".format(lop, rop))
 
 
+def _fingerprint(value):
+    "Return a hashable key of value, equal for equal values."
+    if isinstance(value, string_types):
+        return value
+    return hash_cell(value)
+
+
+def _memoized(compare):
+    "Return compare with its results cached on the identity of the values."
+    cache = {}
+
+    def memoized_compare(x, y):
+        k = (id(x), id(y))
+        result = cache.get(k)
+        if result is None:
+            result = cache[k] = compare(x, y)
+        return result
+    return memoized_compare
+
+
+def _align_inserts(local, remote, local_keys, remote_keys, path):
+    """Align two lists of values inserted at the same position.
+
+    Equal values are aligned first on their fingerprints, and the values
+    in between are aligned with the multilevel notebook predicates for
+    path, each predicate evaluated at most once per pair of values.
+
+    Returns a list of snakes (i, j, n) of aligned values.
+    """
+    # Using get, to not add the path to the predicates defaultdict
+    compares = notebook_predicates.get(star_path(path), [operator.__eq__])
+    compares = [_memoized(compare) for compare in compares]
+    matcher = SequenceMatcher(None, local_keys, remote_keys, autojunk=False)
+    snakes = []
+    i0 = j0 = 0
+    for i, j, n in matcher.get_matching_blocks():
+        if i > i0 and j > j0:
+            snakes.extend(compute_snakes_multilevel(
+                local, remote, compares, (i0, j0, i, j)))
+        if n:
+            snakes.append((i, j, n))
+        i0 = i + n
+        j0 = j + n
+    return snakes
+
+
 def _split_addrange(key, local, remote, path):
     """Compares two addrange value lists, and splits decisions on similarity
 
-    Uses diff of value lists to identify which items to align. Identical,
-    aligned inserts are decided as in agreement, while inserts that are aligned
-    without being identical are treated as conflicts (possibly to be resolved
-    by autoresolve). Non-aligned inserts are treated as conflict free,
-    one-sided inserts.
+    Uses an alignment of the value lists to identify which items to align.
+    Identical, aligned inserts are decided as in agreement, while inserts
+    that are aligned without being identical are treated as conflicts
+    (possibly to be resolved by autoresolve). Non-aligned inserts are
+    treated as conflict free, one-sided inserts.
     """
-    # FIXME: This uses notebook predicates and differs, which
+    # FIXME: This uses notebook predicates, which
     #        doesn't really belong in a generic merge algorithm...
 
-    # First, find diff between local and remote insertion values.
-    # This will align common subsequences according to the similarity
-    # measures defined in notebook predicates.
-    intermediate_diff = diff(local, remote, path=star_path(path),
-                             predicates=notebook_predicates.copy(),
-                             differs=notebook_differs.copy())
+    # First, align common subsequences of the insertion values
+    # according to the similarity measures defined in notebook predicates.
+    local_keys = [_fingerprint(v) for v in local]
+    remote_keys = [_fingerprint(v) for v in remote]
+    snakes = _align_inserts(local, remote, local_keys, remote_keys, path)
 
-    # Next, translate the diff into decisions
+    # Next, translate the alignment into decisions
     decisions = MergeDecisionBuilder()
-    taken = 0
-    offset = 0  # Offset between diff keys (ref local) and remote
-    for i, d in enumerate(intermediate_diff):
-        # This should only occur after (*) marked below:
-        if d.key < taken:
-            continue
-        if taken < d.key:
-            # No diff, which means elements are inserted on both sides
-            overlap = [op_addrange(key, local[taken:d.key])]
-            decisions.agreement(path, overlap, overlap)
-            taken = d.key
-
+    i0 = j0 = 0
+    for i, j, n in snakes + [(len(local), len(remote), 0)]:
         # Either (1) conflicted, (2) local onesided, or (3) remote onesided
-        # First checks whether the next op is a removal on the same key
-        # as the current one (i.e. a range substitution).
-        if (i + 1 < len(intermediate_diff) and
-                intermediate_diff[i+1].op == DiffOp.REMOVERANGE and
-                intermediate_diff[i+1].key == d.key):
-            # This indicates a non-similar sub-sequence, according
-            # to the predicates.
-            # (1) Conflicted addition
-            local_len = intermediate_diff[i+1].length
-            ld = [op_addrange(key, local[d.key:d.key+local_len])]
-            rd = [op_addrange(key, d.valuelist)]
-            decisions.conflict(path, ld, rd)
-            offset += len(d.valuelist) - local_len
-            # (*) Here we treat two ops in one go, which we mark
-            # by setting taken beyond the key of the next op:
-            taken += local_len
-        elif d.op == DiffOp.REPLACE:
-            # Same as above, but length of one, so simpler
-            # (1) Conflict (one element each)
-            ld = [op_addrange(key, [local[d.key]])]
-            rd = [op_addrange(key, [d.value])]
-            decisions.conflict(path, ld, rd)
-            taken += 1
-        elif d.op in (DiffOp.REMOVE, DiffOp.REMOVERANGE):
+        # insertion of values not aligned with the other side
+        if i > i0 and j > j0:
+            # (1) Conflicted addition of non-similar sub-sequences
+            decisions.conflict(path,
+                               [op_addrange(key, local[i0:i])],
+                               [op_addrange(key, remote[j0:j])])
+        elif i > i0:
             # (2) Local onesided
-            if d.op == DiffOp.REMOVE:
-                vl = [local[d.key]]
-            else:
-                vl = local[d.key:d.key + d.length]
-            decisions.onesided(path, [op_addrange(key, vl)], None)
-            offset -= len(vl)
-            taken += len(vl)
-        elif d.op in (DiffOp.ADD, DiffOp.ADDRANGE):
+            decisions.onesided(path, [op_addrange(key, local[i0:i])], None)
+        elif j > j0:
             # (3) Remote onesided
-            if d.op == DiffOp.ADD:
-                vl = [d.value]
+            decisions.onesided(path, None, [op_addrange(key, remote[j0:j])])
+
+        # Aligned values, runs of identical values are inserted on both
+        # sides, while predicates indicate that other values are similar!
+        k = 0
+        while k < n:
+            if local_keys[i + k] == remote_keys[j + k]:
+                start = k
+                while k < n and local_keys[i + k] == remote_keys[j + k]:
+                    k += 1
+                overlap = [op_addrange(key, local[i + start:i + k])]
+                decisions.agreement(path, overlap, overlap)
             else:
-                vl = d.valuelist
-            decisions.onesided(path, None, [op_addrange(key, vl)])
-            offset += len(vl)
-        elif d.op == DiffOp.PATCH:
-            # Predicates indicate that local and remote are similar!
-            # Mark as conflcit, possibly for autoresolve to deal with
-            decisions.conflict(path,
-                               [op_addrange(key, [local[d.key]])],
-                               [op_addrange(key, [remote[d.key + offset]])])
-            taken += 1
-        else:
-            raise ValueError("Invalid diff op: %s" % d.op)
+                # Mark as conflict, possibly for autoresolve to deal with
+                decisions.conflict(path,
+                                   [op_addrange(key, [local[i + k]])],
+                                   [op_addrange(key, [remote[j + k]])])
+                k += 1
+        i0 = i + n
+        j0 = j + n
 
-    # We have made at least one split
-    if taken < len(local):
-        # Have elements that are inserted on both sides
-        overlap = [op_addrange(key, local[taken:])]
-        decisions.agreement(path, overlap, overlap)
     if len(decisions.decisions) > 1 or not decisions.decisions[0].conflict:
         return decisions.decisions
     else:
@@ -370,6 +404,9 @@ def _merge_lists(base, local_diff, remote_diff, path, decisions):
 
                 elif (d0[1:] == d1[1:]):
                     decisions.agreement(path, d0[1:], d1[1:])
+                elif not (d0[1:] and d1[1:]):
+                    # A/AP, the patch is onesided
+                    decisions.onesided(path, d0[1:] or None, d1[1:] or None)
                 else:
                     decisions.conflict(path, d0[1:], d1[1:])
             elif len(d0) < 2 or len(d1) < 2:
@@ -5,20 +5,34 @@
 
 from __future__ import unicode_literals
 
+import atexit
 import sys
 import logging
+from difflib import SequenceMatcher
 from six import StringIO
 
 from .generic import decide_merge_with_diff
-from .decisions import apply_decisions
+from .chunks import make_merge_chunks
+from .decisions import (
+    MergeDecisionBuilder, apply_decisions, merged_diff, push_path,
+    _sorted_decisions)
 from .autoresolve import autoresolve
-from ..diffing.notebooks import diff_notebooks
+from ..diffing.generic import shared_base_matchers
+from ..diffing.notebooks import diff_notebooks, diff_cell_windows
+from ..diffing.summary import hash_cell, align_cells_by_hash
+from ..diff_format import DiffOp, op_patch, op_replace
+from ..patching import patch
 from ..utils import Strategies
 from ..prettyprint import pretty_print_notebook_diff, pretty_print_merge_decisions, pretty_print_notebook
 
 import nbdime.log
 
 
+# Merge diffs spanning at least this many cells in total are computed in
+# two processes, set to None to always diff in one process
+parallel_diff_min_cells = 1000
+
+
 # Strategies for handling conflicts
 generic_conflict_strategies = (
     "clear",            # Replace value with empty in case of conflict
@@ -129,10 +143,212 @@ def autoresolve_notebook_conflicts(base, decisions, args):
     return autoresolve(base, decisions, strategies)
 
 
+def _without_cells(nb):
+    return {k: v for k, v in nb.items() if k != "cells"}
+
+
+def _diff_notebook_windows(base, nb, windows=None):
+    """Compute the diff base->nb, diffing only the given windows of cells.
+
+    See diff_cell_windows for windows. If windows is None, the full
+    notebooks are diffed.
+    """
+    if windows is None:
+        return diff_notebooks(base, nb)
+    di = diff_notebooks(_without_cells(base), _without_cells(nb))
+    cells_diff = diff_cell_windows(base["cells"], nb["cells"], windows)
+    if cells_diff:
+        di = sorted(di + [op_patch("cells", cells_diff)], key=lambda e: e.key)
+    return di
+
+
+def _window_cells(nb, windows):
+    if windows is None:
+        return 2 * len(nb["cells"])
+    return sum(stop - start + bstop - bstart for start, stop, bstart, bstop in windows)
+
+
+# The pool of worker processes for parallel diffs, kept between merges
+_diff_pool = None
+_diff_pool_processes = 0
+
+
+def _get_diff_pool(processes):
+    """Get a pool of at least the given number of worker processes.
+
+    The pool is started on first use and kept for later merges, such that
+    merging many notebooks in one process only starts the workers once.
+    Returns None if no pool can be started, or if there is only one
+    processor to run it on.
+    """
+    global _diff_pool, _diff_pool_processes
+    if _diff_pool is None or _diff_pool_processes < processes:
+        _close_diff_pool()
+        try:
+            import multiprocessing
+            if multiprocessing.cpu_count() < 2:
+                return None
+            _diff_pool = multiprocessing.Pool(processes)
+        except (ImportError, NotImplementedError, OSError) as e:
+            nbdime.log.debug("Diffing in a single process: %s", e)
+            return None
+        _diff_pool_processes = processes
+    return _diff_pool
+
+
+def _close_diff_pool():
+    "Stop the worker processes of the pool for parallel diffs, if started."
+    global _diff_pool, _diff_pool_processes
+    if _diff_pool is not None:
+        _diff_pool.terminate()
+        _diff_pool.join()
+        _diff_pool = None
+        _diff_pool_processes = 0
+
+
+atexit.register(_close_diff_pool)
+
+
+def diff_base_notebooks(base, local, remote, local_windows=None, remote_windows=None):
+    """Compute the diffs base->local and base->remote.
+
+    If windows of cells are given for a side, only those are diffed,
+    see diff_cell_windows. The preprocessing of base strings for
+    approximate comparisons is shared between the two diffs, see
+    shared_base_matchers. If the diffs together span at least
+    parallel_diff_min_cells cells, base->local is instead diffed in a
+    worker process while base->remote is diffed in this process, and the
+    two diffs then each preprocess the base strings. The worker process
+    is kept for later merges.
+    """
+    ncells = _window_cells(local, local_windows) + _window_cells(remote, remote_windows)
+    pool = None
+    if parallel_diff_min_cells is not None and ncells >= parallel_diff_min_cells:
+        pool = _get_diff_pool(1)
+
+    with shared_base_matchers():
+        if pool is None:
+            return (_diff_notebook_windows(base, local, local_windows),
+                    _diff_notebook_windows(base, remote, remote_windows))
+        try:
+            result = pool.apply_async(_diff_notebook_windows, (base, local, local_windows))
+            remote_diffs = _diff_notebook_windows(base, remote, remote_windows)
+            local_diffs = result.get()
+        except BaseException:
+            # Don't keep workers which may still be busy
+            _close_diff_pool()
+            raise
+    return local_diffs, remote_diffs
+
+
+def cell_change_regions(base_cells, local_cells, remote_cells):
+    """Find the regions of base cells changed by local and remote.
+
+    Cells are aligned on equal content hashes. Runs of cells changed on
+    either side, including cells inserted on either side, are joined into
+    regions where they overlap or touch, such that the cells between
+    regions are unchanged on both sides.
+
+    Returns a list of regions (start, stop, local_window, remote_window)
+    in order, where [start, stop) is a range of base cells and the windows
+    are the aligned ranges (start, stop, jstart, jstop) of the side, or None
+    if the side leaves the region unchanged.
+    """
+    return cell_hash_change_regions([hash_cell(c) for c in base_cells],
+                                    [hash_cell(c) for c in local_cells],
+                                    [hash_cell(c) for c in remote_cells])
+
+
+def cell_hash_change_regions(base_hashes, local_hashes, remote_hashes):
+    """Find the regions of base cells changed by local and remote.
+
+    As cell_change_regions, given the lists of hash_cell of the cells.
+    """
+    changes = []
+    for side, hashes in enumerate((local_hashes, remote_hashes)):
+        s = SequenceMatcher(None, base_hashes, hashes, autojunk=False)
+        changes.extend((i0, i1, side, j0, j1)
+                       for tag, i0, i1, j0, j1 in s.get_opcodes() if tag != "equal")
+    changes.sort()
+
+    groups = []
+    for change in changes:
+        if groups and change[0] <= groups[-1][1]:
+            groups[-1][1] = max(groups[-1][1], change[1])
+            groups[-1][2].append(change)
+        else:
+            groups.append([change[0], change[1], [change]])
+
+    # Offsets j - i of the unchanged cells before the current region
+    shifts = [0, 0]
+    regions = []
+    for start, stop, group in groups:
+        windows = [None, None]
+        for side in (0, 1):
+            side_changes = [c for c in group if c[2] == side]
+            if side_changes:
+                i1, j1 = side_changes[-1][1], side_changes[-1][4]
+                windows[side] = (start, stop, start + shifts[side], stop + j1 - i1)
+                shifts[side] = j1 - i1
+        regions.append((start, stop, windows[0], windows[1]))
+    return regions
+
+
+def _split_by_regions(entries, regions):
+    "Split a cells diff into the lists of entries within each region."
+    groups = [[] for r in regions]
+    k = 0
+    for e in entries:
+        while regions[k][1] < e.key:
+            k += 1
+        groups[k].append(e)
+    return groups
+
+
+def _pop_cells_diff(di):
+    "Split a notebook diff into the cells diff and the remaining entries."
+    cells_diff = []
+    rest = []
+    for e in di:
+        if e.key == "cells":
+            cells_diff = e.diff
+        else:
+            rest.append(e)
+    return cells_diff, rest
+
+
+def decide_region_merge(base, local, remote, region, args=None):
+    """Decide the merge of the cells in one region of cell_change_regions.
+
+    Returns the autoresolved decisions for the changes to the cells of the
+    region, as decide_notebook_merge would make them, computed from diffs
+    of the cells of the region only.
+    """
+    start, stop, local_window, remote_window = region
+    local_diff = (diff_cell_windows(base["cells"], local["cells"], [local_window])
+                  if local_window is not None else [])
+    remote_diff = (diff_cell_windows(base["cells"], remote["cells"], [remote_window])
+                   if remote_window is not None else [])
+    if local_window is None or remote_window is None:
+        onesided = MergeDecisionBuilder()
+        if local_diff or remote_diff:
+            onesided.onesided(("cells",), local_diff or None, remote_diff or None)
+        return onesided.decisions
+    decisions = decide_merge_with_diff(
+        base, local, remote,
+        [op_patch("cells", local_diff)] if local_diff else [],
+        [op_patch("cells", remote_diff)] if remote_diff else [])
+    return autoresolve_notebook_conflicts(base, decisions, args)
+
+
 def decide_notebook_merge(base, local, remote, args=None):
-    # Compute notebook specific diffs
-    local_diffs = diff_notebooks(base, local)
-    remote_diffs = diff_notebooks(base, remote)
+    # Find the cells changed on each side by their content hashes, only
+    # diffing those, and decide regions changed on one side only directly
+    regions = cell_change_regions(base["cells"], local["cells"], remote["cells"])
+    local_diffs, remote_diffs = diff_base_notebooks(
+        base, local, remote,
+        [r[2] for r in regions if r[2] is not None],
+        [r[3] for r in regions if r[3] is not None])
 
     if args and args.log_level == "DEBUG":
         nbdime.log.debug("In merge, base-local diff:")
@@ -145,18 +361,41 @@ def decide_notebook_merge(base, local, remote, args=None):
         pretty_print_notebook_diff("<base>", "<remote>", base, remote_diffs, buf)
         nbdime.log.debug(buf.getvalue())
 
-    # Execute a generic merge operation
+    local_cells_diff, local_diffs = _pop_cells_diff(local_diffs)
+    remote_cells_diff, remote_diffs = _pop_cells_diff(remote_diffs)
+    onesided = MergeDecisionBuilder()
+    local_both = []
+    remote_both = []
+    for region, ld, rd in zip(regions,
+                              _split_by_regions(local_cells_diff, regions),
+                              _split_by_regions(remote_cells_diff, regions)):
+        if region[2] is not None and region[3] is not None:
+            # Changed on both sides, merge below
+            local_both.extend(ld)
+            remote_both.extend(rd)
+        elif ld or rd:
+            onesided.onesided(("cells",), ld or None, rd or None)
+    if local_both:
+        local_diffs.append(op_patch("cells", local_both))
+    if remote_both:
+        remote_diffs.append(op_patch("cells", remote_both))
+
+    # Execute a generic merge operation on the rest
     decisions = decide_merge_with_diff(
         base, local, remote, local_diffs, remote_diffs)
 
     if args and args.log_level == "DEBUG":
         nbdime.log.debug("In merge, initial decisions:")
         buf = StringIO()
-        pretty_print_merge_decisions(base, decisions, buf)
+        pretty_print_merge_decisions(
+            base, _sorted_decisions(decisions + onesided.decisions), buf)
         nbdime.log.debug(buf.getvalue())
 
     # Try to resolve conflicts based on behavioural options
     decisions = autoresolve_notebook_conflicts(base, decisions, args)
+    # Decisions of separate regions of cells are on the same path, and
+    # are ordered by the position of their changes
+    decisions = _sorted_decisions(decisions + onesided.decisions)
 
     if args and args.log_level == "DEBUG":
         nbdime.log.debug("In merge, autoresolved decisions:")
@@ -191,3 +430,269 @@ def merge_notebooks(base, local, remote, args=None):
         nbdime.log.debug("End merge")
 
     return merged, decisions
+
+
+def diff_base_branches(base, branches):
+    """Compute the diffs from base to each of the notebooks in branches.
+
+    Only the cells changed on each branch, found by their content hashes,
+    are diffed, and the preprocessing of base strings for approximate
+    comparisons is shared between all diffs, see shared_base_matchers. If
+    the diffs together span at least parallel_diff_min_cells cells, the
+    branches after the first are instead diffed in worker processes, each
+    of which preprocesses the base strings again.
+    """
+    windows = [
+        [(i0, i1, j0, j1) for tag, i0, i1, j0, j1
+         in align_cells_by_hash(base["cells"], nb["cells"]) if tag != "equal"]
+        for nb in branches]
+    ncells = sum(_window_cells(nb, w) for nb, w in zip(branches, windows))
+    pool = None
+    if (parallel_diff_min_cells is not None and len(branches) > 1 and
+            ncells >= parallel_diff_min_cells):
+        try:
+            import multiprocessing
+            processes = min(len(branches) - 1, multiprocessing.cpu_count())
+        except (ImportError, NotImplementedError) as e:
+            nbdime.log.debug("Diffing in a single process: %s", e)
+        else:
+            pool = _get_diff_pool(processes)
+
+    with shared_base_matchers():
+        if pool is None:
+            return [_diff_notebook_windows(base, nb, w) for nb, w in zip(branches, windows)]
+        try:
+            results = [pool.apply_async(_diff_notebook_windows, (base, nb, w))
+                       for nb, w in zip(branches[1:], windows[1:])]
+            diffs = [_diff_notebook_windows(base, branches[0], windows[0])]
+            diffs.extend(result.get() for result in results)
+        except BaseException:
+            # Don't keep workers which may still be busy
+            _close_diff_pool()
+            raise
+    return diffs
+
+
+def _entry_span(e):
+    "The range of keys of a sequence affected by a diff entry."
+    if e.op == DiffOp.ADDRANGE:
+        return e.key, e.key
+    elif e.op == DiffOp.REMOVERANGE:
+        return e.key, e.key + e.length
+    return e.key, e.key + 1
+
+
+def _entries_overlap(a, b):
+    if not isinstance(a.key, int):
+        return a.key == b.key
+    astart, astop = _entry_span(a)
+    bstart, bstop = _entry_span(b)
+    return astart == bstart or max(astart, bstart) < min(astop, bstop)
+
+
+def _diff_touches(diff, path, entries):
+    """Whether diff changes any of the values changed by entries at path.
+
+    diff is a diff of the root, and entries a diff of the value at path.
+    """
+    for key in path:
+        for e in diff:
+            if e.key == key and e.op == DiffOp.PATCH:
+                diff = e.diff
+                break
+        else:
+            # Not patched below key, but key may be replaced or removed
+            return any(e.key == key or (e.op == DiffOp.REMOVERANGE and
+                                        e.key <= key < e.key + e.length)
+                       for e in diff)
+    return bool(_split_overlapping(diff, entries)[0])
+
+
+def _split_overlapping(diff, other):
+    """Split the entries of diff changing values also changed by other.
+
+    diff and other are diffs of the same value, and patches of the same
+    key are split recursively. Returns the overlapping entries and the
+    remaining entries, as two diffs.
+    """
+    overlapping = []
+    rest = []
+    for e in diff:
+        over = [o for o in other if _entries_overlap(e, o)]
+        if not over:
+            rest.append(e)
+        elif e.op == DiffOp.PATCH and all(o.op == DiffOp.PATCH for o in over):
+            sub_overlapping, sub_rest = _split_overlapping(
+                e.diff, [x for o in over for x in o.diff])
+            if sub_overlapping:
+                overlapping.append(op_patch(e.key, sub_overlapping))
+            if sub_rest:
+                rest.append(op_patch(e.key, sub_rest))
+        else:
+            overlapping.append(e)
+    return overlapping, rest
+
+
+def _patch_replaced_values(base, conflicted, decisions):
+    """Patch values replaced by conflicted decisions with the decisions below them.
+
+    Conflicts resolved by recording them, as with the record-conflict
+    strategy, replace a value by a copy with the conflicts recorded, which
+    would override changes to the value merged from later branches. These
+    changes are applied to the replacing value instead. Returns the
+    decisions not applied.
+    """
+    for dec in conflicted:
+        if dec.action != "custom":
+            continue
+        custom_diff = []
+        for e in dec.custom_diff:
+            if e.op == DiffOp.REPLACE:
+                path = tuple(dec.common_path) + (e.key,)
+                below = [d for d in decisions if tuple(d.common_path[:len(path)]) == path]
+                if below:
+                    sub = _split_diff_at(merged_diff(base, below), path)[1]
+                    e = op_replace(e.key, patch(e.value, sub))
+                    decisions = [d for d in decisions if not any(d is x for x in below)]
+            custom_diff.append(e)
+        dec.custom_diff = custom_diff
+    return decisions
+
+
+def _split_diff_at(diff, path):
+    """Split the entries of a diff of the root changing the value at path.
+
+    Returns the path of the split entries, which is path or the prefix of
+    it where the value is replaced or removed, the split entries, and the
+    diff without them.
+    """
+    if not path:
+        return (), diff, []
+    key = path[0]
+    for i, e in enumerate(diff):
+        if e.key == key and e.op == DiffOp.PATCH:
+            subpath, entries, rest = _split_diff_at(e.diff, path[1:])
+            rest = diff[:i] + ([op_patch(key, rest)] if rest else []) + diff[i+1:]
+            return (key,) + subpath, entries, rest
+    split = [e for e in diff if e.key == key or (
+        e.op == DiffOp.REMOVERANGE and e.key <= key < e.key + e.length)]
+    return (), split, [e for e in diff if e not in split]
+
+
+def decide_notebook_merge_nway(base, branches, args=None):
+    """Decide the merge of the changes from base to each of branches.
+
+    Each branch is diffed with base once. Cells are then split into chunks
+    on the boundaries of the changes of all branches, in one pass. Chunks
+    changed by a single branch, or equally by all branches changing them,
+    are decided directly. The other chunks, and the changes outside the
+    cells, are merged branch by branch in order, by merging the diff of
+    the branches merged so far with the diff of the next branch, resolving
+    conflicts like decide_notebook_merge. Conflicted decisions are kept
+    as they are, out of the diff merged with the next branches, and the
+    changes of later branches to their values conflict with them.
+
+    Returns the decisions to apply to base, and a list with the conflicted
+    decisions involving each branch, including conflicts resolved while
+    merging the branches before the last one.
+    """
+    diffs = diff_base_branches(base, branches)
+    cells_diffs = []
+    rest_diffs = []
+    for di in diffs:
+        cells_diff, rest = _pop_cells_diff(di)
+        cells_diffs.append(cells_diff)
+        rest_diffs.append(rest)
+
+    onesided = MergeDecisionBuilder()
+    contested = [[] for nb in branches]
+    if base["cells"]:
+        chunks = make_merge_chunks(base["cells"], *cells_diffs)
+    else:
+        # Without base cells all changes are inserts at 0, in one chunk
+        chunks = [(0, 0) + tuple(cells_diffs)]
+    for chunk in chunks:
+        entries = chunk[2:]
+        sides = [m for m, d in enumerate(entries) if d]
+        if not sides:
+            continue
+        first = list(entries[sides[0]])
+        if all(list(entries[m]) == first for m in sides[1:]):
+            onesided.onesided(("cells",), first, None)
+        else:
+            for m in sides:
+                contested[m].extend(entries[m])
+
+    # Diffs of the branches with the contested cells and everything else
+    side_diffs = []
+    for m in range(len(branches)):
+        di = list(rest_diffs[m])
+        if contested[m]:
+            di = sorted(di + [op_patch("cells", contested[m])], key=lambda e: e.key)
+        side_diffs.append(di)
+
+    conflicts = [[] for nb in branches]
+    merged = None
+    merged_sides = []
+    decisions = []
+    # Conflicted decisions of the branches merged so far
+    conflicted = MergeDecisionBuilder()
+    for m, di in enumerate(side_diffs):
+        if not di:
+            continue
+        if merged is None:
+            merged = di
+            merged_sides.append(m)
+            continue
+
+        # Changes to values with unresolved conflicts conflict with them
+        for dec in list(conflicted.decisions):
+            entries = push_path(dec.common_path, (dec.local_diff or []) + (dec.remote_diff or []))
+            touched, di = _split_overlapping(di, entries)
+            if not touched:
+                continue
+            conflicted.add_decision((), "base", merged_diff(base, [dec]), touched,
+                                    conflict=True)
+            conflicts[m].append(conflicted.decisions[-1])
+            for k in merged_sides:
+                if any(c is dec for c in conflicts[k]):
+                    conflicts[k].append(conflicted.decisions[-1])
+        if not di:
+            merged_sides.append(m)
+            continue
+
+        decisions = decide_merge_with_diff(base, None, None, merged, di)
+        decisions = autoresolve_notebook_conflicts(base, decisions, args)
+        for dec in decisions:
+            if not dec.conflict:
+                continue
+            conflicted.decisions.append(dec)
+            conflicts[m].append(dec)
+            entries = (dec.local_diff or []) + (dec.remote_diff or [])
+            for k in merged_sides:
+                if _diff_touches(side_diffs[k], dec.common_path, entries):
+                    conflicts[k].append(dec)
+        decisions = [dec for dec in decisions if not dec.conflict]
+        merged = merged_diff(base, decisions)
+        merged_sides.append(m)
+    if len(merged_sides) == 1:
+        decisions = decide_merge_with_diff(base, None, None, merged, [])
+    decisions = _patch_replaced_values(base, conflicted.decisions, decisions)
+
+    decisions = _sorted_decisions(decisions + conflicted.decisions + onesided.decisions)
+    return decisions, conflicts
+
+
+def merge_notebooks_nway(base, branches, args=None):
+    """Merge changes introduced by each of the notebooks in branches from a shared ancestor base.
+
+    This merges the branches at once, without repeatedly diffing the
+    growing merge result like a chain of merge_notebooks would do. See
+    decide_notebook_merge_nway.
+
+    Return new (partially) merged notebook, the merge decisions, and a
+    list of the conflicted decisions involving each branch.
+    """
+    decisions, conflicts = decide_notebook_merge_nway(base, branches, args)
+    merged = apply_decisions(base, decisions)
+    return merged, decisions, conflicts
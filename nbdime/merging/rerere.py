@@ -0,0 +1,556 @@
+# coding: utf-8
+
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+"""Reuse of recorded notebook merge decisions and conflict resolutions.
+
+Like `git rerere`, a MergeCache remembers how conflicts were resolved,
+so that a conflict seen again, e.g. for each commit of a rebase, is
+resolved the same way without asking. It keeps two kinds of records in
+a directory, by default under the .git directory of the repository:
+
+- The decisions computed for a merge, keyed by hashes of the base,
+  local and remote notebooks and of the merge arguments, such that
+  merging the same notebooks again skips the diffs, merge and
+  autoresolve entirely.
+
+- The resolutions of conflicts stored from the web mergetool, keyed by
+  hashes of the conflicting parts of the base, local and remote
+  notebooks, such that the same conflict is resolved instantly, wherever
+  it appears in the notebook.
+
+The conflicting part of a sequence (a list, or a string diffed by lines)
+is the range of items touched by the diffs of a conflicted decision, and
+the conflicting part of a dict is the items at the keys touched by them.
+
+Records not used for a while are removed by MergeCache.gc, like
+`git rerere gc` does: decisions after decisions_expiry_days and
+resolutions after resolutions_expiry_days.
+"""
+
+from __future__ import unicode_literals
+
+import argparse
+import errno
+import hashlib
+import io
+import json
+import os
+import tempfile
+import time
+from difflib import SequenceMatcher
+
+from six import string_types
+
+import nbdime.log
+from .._version import __version__
+from ..blobs import encode_blob
+from ..diff_format import (
+    DiffOp, DiffEntry, op_add, op_addrange, op_remove, op_removerange,
+    op_replace)
+from ..diffing.summary import hash_cell
+from ..patching import patch
+from ..utils import locate_gitdir, resolve_path
+from .decisions import (
+    MergeDecision, merged_diff, split_string_path, _sort_key)
+from .notebooks import decide_notebook_merge, _entry_span
+
+__all__ = ["MergeCache"]
+
+
+# Days after their last use that records are removed by MergeCache.gc,
+# as the defaults of gc.rerereUnresolved and gc.rerereResolved in git
+decisions_expiry_days = 15
+resolutions_expiry_days = 60
+
+
+def _hash(value):
+    return hashlib.sha1(encode_blob(value)).hexdigest()
+
+
+_merge_arg_names = None
+
+
+def _merge_args_key(args):
+    "Return the values of the arguments affecting merge decisions."
+    global _merge_arg_names
+    if _merge_arg_names is None:
+        from ..args import add_diff_args, add_merge_args
+        parser = argparse.ArgumentParser(add_help=False)
+        add_diff_args(parser)
+        add_merge_args(parser)
+        _merge_arg_names = sorted(
+            a.dest for a in parser._actions if a.dest != "rerere")
+    return [[name, getattr(args, name, None)] for name in _merge_arg_names]
+
+
+def _load_diff(diff):
+    "Convert a diff loaded from json to diff entries, leaving values as loaded."
+    if diff is None:
+        return None
+    entries = []
+    for e in diff:
+        if e["op"] == DiffOp.PATCH:
+            e = DiffEntry(e, diff=_load_diff(e["diff"]))
+        else:
+            e = DiffEntry(e)
+        entries.append(e)
+    return entries
+
+
+def _load_decision(md):
+    "Convert a merge decision loaded from json to a MergeDecision."
+    md = MergeDecision(md)
+    md.common_path = tuple(md.common_path)
+    for key in ("local_diff", "remote_diff", "custom_diff"):
+        if key in md:
+            md[key] = _load_diff(md[key])
+    return md
+
+
+def _shifted(diff, offset):
+    "Return diff with the keys of its entries shifted by offset."
+    return [DiffEntry(e, key=e.key + offset) for e in diff]
+
+
+class _Conflict(object):
+    """The conflicting part of a value in base, as changed in local and remote.
+
+    A conflict within a field of a cell, like its source or outputs, covers
+    the whole field and all decisions on it, like the inline strategies
+    bundling them into one decision do. Any other conflict covers a single
+    decision on a value. The conflicting part of a sequence (a list, or a
+    string diffed by lines) is then the range of items touched by the
+    diffs of the decision, and of a dict the items at the keys touched by
+    them.
+
+    Raises ValueError if the value is not a dict, list or string.
+    """
+
+    def __init__(self, base, path, decisions, whole):
+        value = resolve_path(base, path)
+        n = len(path)
+        self.local_diff = merged_diff(value, [
+            MergeDecision(md, common_path=md.common_path[n:], action="local")
+            for md in decisions])
+        self.remote_diff = merged_diff(value, [
+            MergeDecision(md, common_path=md.common_path[n:], action="remote")
+            for md in decisions])
+        local_diff = self.local_diff
+        remote_diff = self.remote_diff
+        entries = local_diff + remote_diff
+
+        if isinstance(value, dict):
+            if whole:
+                self.keys = None
+                sub = value
+            else:
+                self.keys = sorted(set(e.key for e in entries))
+                sub = {k: value[k] for k in self.keys if k in value}
+        elif isinstance(value, (list,) + string_types):
+            if whole:
+                self.start, self.stop = 0, len(_items(value))
+            else:
+                spans = [_entry_span(e) for e in entries]
+                self.start = min(s[0] for s in spans)
+                self.stop = max(s[1] for s in spans)
+            sub = _items(value)[self.start:self.stop]
+            if isinstance(value, string_types):
+                sub = "".join(sub)
+            local_diff = _shifted(local_diff, -self.start)
+            remote_diff = _shifted(remote_diff, -self.start)
+        else:
+            raise ValueError("Conflict on a value of type %s" % type(value).__name__)
+
+        self.path = path
+        self.value = value
+        self.whole = whole
+        self.decisions = decisions
+        self.key = _hash([sub, patch(sub, local_diff), patch(sub, remote_diff)])
+
+    def resolution(self, merged_value, decisions):
+        """Return the part of merged_value resolving the conflict, or None.
+
+        decisions are the decisions of the merge, see _patch_marked. The
+        resolution of a conflict on a part of a
+        sequence is found in its place in merged_value, as aligned with
+        the patched value. None is returned if it cannot be told apart
+        from the resolutions of other conflicts or changes around it.
+        """
+        if self.whole:
+            return merged_value
+        if isinstance(self.value, dict):
+            return {k: merged_value[k] for k in self.keys if k in merged_value}
+        items, diff, marked = _patch_marked(self.value, self.path, decisions)
+        plain, positions, _ = _unmarked(self.value, items, len(marked))
+        own = [k for k, md in enumerate(marked) if md is self.decisions[0]][0]
+        p = positions[own]
+
+        merged_items = _items(merged_value)
+        resolution = []
+        for tag, i0, i1, j0, j1 in _opcodes(plain, merged_items):
+            if tag != "equal" and i0 <= p <= i1:
+                # Changed items around the conflict are aligned in order,
+                # and any further items in merged are the resolution
+                extra = (j1 - j0) - (i1 - i0)
+                others = [q for k, q in enumerate(positions)
+                          if k != own and i0 <= q <= i1]
+                if extra < 0 or others:
+                    return None
+                start = j0 + p - i0
+                resolution = merged_items[start:start + extra]
+                break
+        if isinstance(self.value, string_types):
+            resolution = "".join(resolution)
+        return resolution
+
+    def resolved_diff(self, resolution):
+        "Return the diff replacing the conflicting part of the value by resolution."
+        diff = []
+        if isinstance(self.value, dict):
+            keys = self.keys
+            if keys is None:
+                keys = sorted(set(self.value) | set(resolution))
+            for k in keys:
+                if k not in resolution:
+                    if k in self.value:
+                        diff.append(op_remove(k))
+                elif k not in self.value:
+                    diff.append(op_add(k, resolution[k]))
+                elif resolution[k] != self.value[k]:
+                    diff.append(op_replace(k, resolution[k]))
+            return diff
+        resolution = _items(resolution)
+        if resolution:
+            diff.append(op_addrange(self.start, resolution))
+        if self.stop > self.start:
+            diff.append(op_removerange(self.start, self.stop - self.start))
+        return diff
+
+    def resolved_decision(self, resolution):
+        "Return a decision resolving the conflict by resolution."
+        return MergeDecision(
+            self.decisions[0] if not self.whole else {},
+            common_path=self.path, action="custom", conflict=False,
+            local_diff=self.local_diff, remote_diff=self.remote_diff,
+            custom_diff=self.resolved_diff(resolution))
+
+
+def _find_conflicts(base, decisions):
+    """Return the conflicts among decisions, with the indices of their decisions.
+
+    The indices of the decisions of each conflict are sorted.
+    """
+    fields = {}
+    conflicts = []
+    for i, md in enumerate(decisions):
+        path, line = split_string_path(base, md.common_path)
+        if len(path) >= 3 and path[0] == "cells":
+            fields.setdefault(path[:3], []).append(i)
+        elif md.conflict:
+            try:
+                conflicts.append((_Conflict(base, path, [md], False), [i]))
+            except ValueError:
+                pass
+    for path, indices in fields.items():
+        if any(decisions[i].conflict for i in indices):
+            try:
+                c = _Conflict(base, path, [decisions[i] for i in indices], True)
+            except ValueError:
+                continue
+            conflicts.append((c, indices))
+    return conflicts
+
+
+def _kind(value):
+    for kind in (dict, list) + string_types:
+        if isinstance(value, kind):
+            return kind
+    return None
+
+
+def _items(value):
+    "The items of a list, or the lines of a string, as strings are diffed by lines."
+    if isinstance(value, string_types):
+        return value.splitlines(True)
+    return value
+
+
+def _mark(value, k):
+    "Return a mark for the k-th conflicting part of the sequence value."
+    if isinstance(value, string_types):
+        return "\0nbdime-rerere %d\0\n" % k
+    return {"\0nbdime-rerere": k}
+
+
+def _patch_marked(value, path, decisions):
+    """Patch the sequence value at path by decisions, marking the conflicting parts.
+
+    decisions are the decisions on value and its items. The conflicting
+    part of the k-th conflicted decision on value itself is replaced by
+    _mark(value, k), as its resolution is not known. Returns the items of
+    the patched value, the diff, and the marked decisions.
+    """
+    n = len(path)
+    rebased = []
+    marked = []
+    for md in decisions:
+        if tuple(md.common_path[:n]) != path:
+            continue
+        rmd = MergeDecision(md, common_path=md.common_path[n:])
+        if md.conflict and not split_string_path(value, rmd.common_path)[0]:
+            c = _Conflict(value, (), [rmd], False)
+            rmd = MergeDecision(rmd, action="custom", custom_diff=c.resolved_diff(
+                [_mark(value, len(marked))]))
+            marked.append(md)
+        rebased.append(rmd)
+    diff = merged_diff(value, rebased)
+    return _items(patch(value, diff)), diff, marked
+
+
+def _unmarked(value, items, count):
+    """Return items without marks, with the positions of the marks among them.
+
+    Also returns the indices of the items among the unmarked ones, with
+    None for the marks.
+    """
+    marks = [_mark(value, k) for k in range(count)]
+    plain = []
+    positions = [None] * count
+    indices = []
+    for x in items:
+        if x in marks:
+            positions[marks.index(x)] = len(plain)
+            indices.append(None)
+        else:
+            indices.append(len(plain))
+            plain.append(x)
+    return plain, positions, indices
+
+
+def _opcodes(a, b):
+    "Return the opcodes aligning the sequences a and b on equal content hashes."
+    return SequenceMatcher(None, [hash_cell(x) for x in a],
+                           [hash_cell(x) for x in b],
+                           autojunk=False).get_opcodes()
+
+
+def _aligned_index(plain, positions, merged, i):
+    """Return the index of the item in merged aligned with plain[i], or None.
+
+    Changed items are aligned in order. Any further items in merged are
+    the resolutions of the conflicts marked at positions in plain, and
+    are only told apart if these are all before or all after the item.
+    """
+    for tag, i0, i1, j0, j1 in _opcodes(plain, merged):
+        if i0 <= i < i1:
+            if tag == "equal":
+                return j0 + i - i0
+            extra = (j1 - j0) - (i1 - i0)
+            around = [p for p in positions if i0 <= p <= i1]
+            if extra == 0 or (extra > 0 and around and all(p > i for p in around)):
+                return j0 + i - i0
+            if extra > 0 and around and all(p <= i for p in around):
+                return j0 + i - i0 + extra
+            return None
+    return None
+
+
+def _patched_index(diff, i):
+    "Return the index of item i of a sequence patched by diff, or None if removed."
+    j = i
+    for e in diff:
+        if e.key > i:
+            break
+        if e.op == DiffOp.ADDRANGE:
+            j += len(e.valuelist)
+        elif e.op == DiffOp.REMOVERANGE:
+            if e.key + e.length > i:
+                return None
+            j -= e.length
+    return j
+
+
+def _map_path(base, merged, path, decisions):
+    """Return the path in merged of the value at path in base, or None.
+
+    List items are found by their "id" if they have one, like cells.
+    Otherwise the item in the list as patched by the decisions is aligned
+    with the list in merged, see _aligned_index.
+    """
+    mapped = []
+    for n, key in enumerate(path):
+        if isinstance(base, list) and isinstance(merged, list):
+            item_id = base[key].get("id") if isinstance(base[key], dict) else None
+            ids = [x.get("id") if isinstance(x, dict) else None for x in merged]
+            if item_id is not None and ids.count(item_id) == 1:
+                mkey = ids.index(item_id)
+            else:
+                items, diff, marked = _patch_marked(base, path[:n], decisions)
+                i = _patched_index(diff, key)
+                if i is None:
+                    return None
+                plain, positions, indices = _unmarked(base, items, len(marked))
+                mkey = _aligned_index(plain, positions, merged, indices[i])
+                if mkey is None:
+                    return None
+        elif isinstance(base, dict) and isinstance(merged, dict) and key in merged:
+            mkey = key
+        else:
+            return None
+        base = base[key]
+        merged = merged[mkey]
+        mapped.append(mkey)
+    return tuple(mapped)
+
+
+class MergeCache(object):
+    """On-disk cache of merge decisions and conflict resolutions.
+
+    Records are json files in directories under path, named by their key
+    and sharded on its first two characters like git objects.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    @classmethod
+    def in_repository(cls, path=None):
+        """Return the cache in the .git directory of the repository containing path.
+
+        Returns None if path is not in a git repository.
+        """
+        gitdir = locate_gitdir(path)
+        if gitdir is None:
+            return None
+        return cls(os.path.join(gitdir, "nbdime", "rerere"))
+
+    def _filename(self, kind, key):
+        return os.path.join(self.path, kind, key[:2], key[2:])
+
+    def _read(self, kind, key):
+        fn = self._filename(kind, key)
+        try:
+            with io.open(fn, "rb") as f:
+                value = json.loads(f.read().decode("utf8"))
+        except (IOError, ValueError):
+            return None
+        # The modification time records the last use, see gc
+        try:
+            os.utime(fn, None)
+        except OSError:
+            pass
+        return value
+
+    def _write(self, kind, key, value):
+        fn = self._filename(kind, key)
+        dirname = os.path.dirname(fn)
+        try:
+            os.makedirs(dirname)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        # Write to a temporary file first so readers never see partial records
+        fd, tmp = tempfile.mkstemp(dir=dirname)
+        with io.open(fd, "wb") as f:
+            f.write(encode_blob(value))
+        try:
+            os.rename(tmp, fn)
+        except OSError:
+            # Replacing an existing record, on platforms where rename does not
+            os.remove(fn)
+            os.rename(tmp, fn)
+
+    def gc(self, now=None):
+        """Remove the records not used for longer than their expiry.
+
+        Decisions expire after decisions_expiry_days and resolutions after
+        resolutions_expiry_days, counted from when they were last written
+        or read. Returns the number of records removed.
+        """
+        if now is None:
+            now = time.time()
+        removed = 0
+        for kind, days in (("decisions", decisions_expiry_days),
+                           ("resolutions", resolutions_expiry_days)):
+            expired = now - days * 24 * 60 * 60
+            kinddir = os.path.join(self.path, kind)
+            if not os.path.isdir(kinddir):
+                continue
+            for shard in os.listdir(kinddir):
+                sharddir = os.path.join(kinddir, shard)
+                for name in os.listdir(sharddir):
+                    fn = os.path.join(sharddir, name)
+                    if os.path.getmtime(fn) < expired:
+                        os.remove(fn)
+                        removed += 1
+                if not os.listdir(sharddir):
+                    os.rmdir(sharddir)
+        return removed
+
+    def decide_notebook_merge(self, base, local, remote, args=None):
+        """Return the merge decisions of decide_notebook_merge, reusing records.
+
+        The decisions recorded for the same notebooks and merge arguments
+        are reused without computing them, and conflicts with a recorded
+        resolution are resolved by it.
+        """
+        key = _hash([__version__, _merge_args_key(args), base, local, remote])
+        decisions = self._read("decisions", key)
+        if decisions is None:
+            decisions = decide_notebook_merge(base, local, remote, args)
+            self._write("decisions", key, decisions)
+        else:
+            nbdime.log.debug("Reusing recorded merge decisions.")
+            decisions = [_load_decision(md) for md in decisions]
+        return self.resolve_known_conflicts(base, decisions)
+
+    def resolve_known_conflicts(self, base, decisions):
+        """Return decisions with the conflicts with recorded resolutions resolved.
+
+        The decisions of each resolved conflict are replaced by a single
+        non-conflicted decision with a custom diff applying the resolution.
+        """
+        replaced = {}
+        for c, indices in _find_conflicts(base, decisions):
+            resolution = self._read("resolutions", c.key)
+            if resolution is None:
+                continue
+            nbdime.log.info("Resolved conflict at %s as recorded.",
+                            "/" + "/".join(str(k) for k in c.path))
+            replaced[indices[0]] = c.resolved_decision(resolution)
+            for i in indices[1:]:
+                replaced[i] = None
+        if not replaced:
+            return decisions
+        decisions = [replaced.get(i, md) for i, md in enumerate(decisions)]
+        decisions = [md for md in decisions if md is not None]
+        return sorted(decisions, key=_sort_key, reverse=True)
+
+    def record_resolutions(self, base, decisions, merged, unresolved=()):
+        """Record how the conflicts among decisions are resolved in merged.
+
+        merged is the merge result as resolved by the user, and unresolved
+        the common paths of the conflicted decisions left unresolved in it,
+        whose conflicts are not recorded. Returns the number of resolutions
+        recorded.
+        """
+        unresolved = set(tuple(path) for path in unresolved)
+        recorded = 0
+        for c, indices in _find_conflicts(base, decisions):
+            if any(tuple(decisions[i].common_path) in unresolved
+                   for i in indices if decisions[i].conflict):
+                continue
+            path = _map_path(base, merged, c.path, decisions)
+            if path is None:
+                continue
+            merged_value = resolve_path(merged, path)
+            if _kind(merged_value) != _kind(c.value):
+                continue
+            resolution = c.resolution(merged_value, decisions)
+            if resolution is None:
+                continue
+            self._write("resolutions", c.key, resolution)
+            recorded += 1
+        return recorded
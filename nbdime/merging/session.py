@@ -0,0 +1,167 @@
+# coding: utf-8
+
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+"""Incremental merging of notebooks, for interactive merge tools.
+
+A merge session keeps the notebooks being merged and their merge
+decisions. The decisions are computed per region of changed cells, see
+cell_change_regions, and when the user edits cells of the local or remote
+notebook only the decisions of the regions whose cells changed are
+computed again. Updates return the changes to the decisions, by ids
+kept stable for the decisions that do not change.
+"""
+
+from __future__ import unicode_literals
+
+import copy
+import itertools
+
+from ..diffing.notebooks import diff_notebooks
+from ..diffing.summary import hash_cell
+from .decisions import apply_decisions, _sorted_decisions
+from .generic import decide_merge_with_diff
+from .notebooks import (
+    autoresolve_notebook_conflicts, cell_hash_change_regions,
+    decide_region_merge, _without_cells)
+
+__all__ = ["MergeSession"]
+
+
+class MergeSession(object):
+    """The state of an interactive merge of notebooks local and remote.
+
+    base is never modified, so the common paths of decisions stay valid
+    while local and remote are edited. If a MergeCache is given, recorded
+    resolutions are applied to the conflicts of the decisions.
+    """
+
+    def __init__(self, base, local, remote, args=None, cache=None):
+        self.base = base
+        self.local = copy.deepcopy(local)
+        self.remote = copy.deepcopy(remote)
+        self.args = args
+        self.cache = cache
+        self._next_id = itertools.count()
+        self._decisions = {}
+        self._hashes = [[hash_cell(c) for c in nb["cells"]]
+                        for nb in (base, self.local, self.remote)]
+
+        # Changes outside the cells are decided once
+        decisions = decide_merge_with_diff(
+            base, self.local, self.remote,
+            diff_notebooks(_without_cells(base), _without_cells(self.local)),
+            diff_notebooks(_without_cells(base), _without_cells(self.remote)))
+        self._other = self._add(autoresolve_notebook_conflicts(base, decisions, args))
+
+        # Ids of the decisions of each region, by region key, and the
+        # keys of the regions in order
+        self._regions = {}
+        self._keys = []
+        self._update_regions()
+
+    def _add(self, decisions):
+        if self.cache is not None:
+            decisions = self.cache.resolve_known_conflicts(self.base, decisions)
+        ids = []
+        for md in decisions:
+            i = next(self._next_id)
+            self._decisions[i] = md
+            ids.append(i)
+        return ids
+
+    def _region_key(self, region):
+        "A key identifying the cells of region on all sides."
+        start, stop = region[:2]
+        key = [start, stop]
+        for hashes, window in zip(self._hashes[1:], region[2:]):
+            key.append(None if window is None else tuple(hashes[window[2]:window[3]]))
+        return tuple(key)
+
+    def _update_regions(self):
+        """Decide the merge of the regions not seen before.
+
+        Returns the ids of the removed and added decisions.
+        """
+        regions = {}
+        keys = []
+        added = []
+        for region in cell_hash_change_regions(*self._hashes):
+            key = self._region_key(region)
+            keys.append(key)
+            if key in self._regions:
+                regions[key] = self._regions.pop(key)
+            else:
+                regions[key] = self._add(decide_region_merge(
+                    self.base, self.local, self.remote, region, self.args))
+                added.extend(regions[key])
+        removed = []
+        for ids in self._regions.values():
+            for i in ids:
+                del self._decisions[i]
+            removed.extend(ids)
+        self._regions = regions
+        self._keys = keys
+        return sorted(removed), added
+
+    def ids(self):
+        "Return the ids of the decisions, in the order of decisions()."
+        ids = self._other + [i for k in self._keys for i in self._regions[k]]
+        # Decisions of separate regions are on the same path, and are
+        # ordered by the position of their changes
+        return _sorted_decisions(ids, decision=self._decisions.__getitem__)
+
+    def decisions(self):
+        "Return the current merge decisions, sorted like decide_notebook_merge."
+        return [self._decisions[i] for i in self.ids()]
+
+    def decision(self, i):
+        "Return the decision with id i."
+        return self._decisions[i]
+
+    def merged(self):
+        "Return the notebook merged with the current decisions."
+        return apply_decisions(self.base, self.decisions())
+
+    def pick(self, ids, action, custom_diff=None):
+        """Pick the action of the decisions with the given ids.
+
+        Returns a dict with the list of updated decisions as [id, decision]
+        pairs under "updated".
+        """
+        if action == "custom" and custom_diff is None:
+            raise ValueError("A custom action needs a custom diff.")
+        updated = []
+        for i in ids:
+            md = copy.copy(self._decisions[i])
+            md.action = action
+            if action == "custom":
+                md.custom_diff = custom_diff
+            self._decisions[i] = md
+            updated.append([i, md])
+        return {"updated": updated}
+
+    def update_cells(self, side, start, stop, cells):
+        """Replace the cells [start, stop) of side by cells.
+
+        side is "local" or "remote". Cells are edited, inserted or removed
+        by the range and the cells replacing it. Decisions of regions whose
+        cells changed are decided again, dropping the actions picked for
+        them. Returns a dict with the ids of the removed decisions under
+        "removed", and the added decisions as [id, decision] pairs under
+        "added".
+        """
+        if side not in ("local", "remote"):
+            raise ValueError("Invalid side %r, expected local or remote." % (side,))
+        nb = getattr(self, side)
+        hashes = self._hashes[1 if side == "local" else 2]
+        start, stop, _ = slice(start, stop).indices(len(nb["cells"]))
+        stop = max(start, stop)
+        nb["cells"][start:stop] = cells
+        hashes[start:stop] = [hash_cell(c) for c in cells]
+        removed, added = self._update_regions()
+        return {
+            "removed": removed,
+            "added": [[i, self._decisions[i]] for i in added],
+            }
@@ -11,12 +11,17 @@ import os
 import sys
 import argparse
 import nbformat
-import json
 
 import nbdime
-from nbdime.diffing.notebooks import diff_notebooks
-from nbdime.prettyprint import pretty_print_notebook_diff
-from nbdime.args import add_generic_args, add_diff_args, add_filename_args
+from nbdime.diffing.notebooks import diff_notebooks, diff_cell_range
+from nbdime.diffing.filters import filter_notebook
+from nbdime.diffing.summary import notebooks_differ, diff_stat, aligned_cell_range
+from nbdime.jsonstream import dump_json
+from nbdime.blobs import DirectoryBlobStore, externalize_blobs, DEFAULT_BLOB_THRESHOLD
+from nbdime.prettyprint import pretty_print_notebook_diff, pretty_print_diff_stat
+from nbdime.args import (
+    add_generic_args, add_diff_args, add_diff_filter_args, add_diff_summary_args,
+    add_filename_args, diff_filters_from_args)
 
 
 _description = "Compute the difference between two Jupyter notebooks."
@@ -35,21 +40,49 @@ def main_diff(args):
     a = nbformat.read(afn, as_version=4)
     b = nbformat.read(bfn, as_version=4)
 
-    d = diff_notebooks(a, b)
+    # This printer is to keep the unit tests passing,
+    # some tests capture output with capsys which doesn't
+    # pick up on sys.stdout.write()
+    class Printer:
+        def write(self, text):
+            print(text, end="")
+
+    filters = diff_filters_from_args(args)
+
+    if args.quiet or args.stat:
+        if args.cells:
+            # Summarize the range of cells only
+            start, stop, bstart, bstop = aligned_cell_range(
+                a.cells, b.cells, *args.cells)
+            a = nbformat.from_dict({"cells": a.cells[start:stop]})
+            b = nbformat.from_dict({"cells": b.cells[bstart:bstop]})
+        if filters:
+            a = filter_notebook(a, filters)
+            b = filter_notebook(b, filters)
+        if args.quiet:
+            # Only report whether the notebooks differ, like diff -q
+            return 1 if notebooks_differ(a, b) else 0
+        pretty_print_diff_stat(afn, bfn, diff_stat(a, b), Printer())
+        return 0
+
+    if args.cells:
+        start, stop = args.cells
+        d = diff_cell_range(a, b, start, stop, filters=filters)
+    else:
+        d = diff_notebooks(a, b, filters=filters)
 
     if dfn:
+        if args.blobs:
+            # Store large values once in the blob directory
+            # and write references to them in the diff
+            store = DirectoryBlobStore(args.blobs)
+            d = externalize_blobs(d, store, args.blob_threshold)
         with io.open(dfn, "w", encoding="utf8") as df:
             # Compact version:
-            #json.dump(d, df)
+            #dump_json(d, df)
             # Verbose version:
-            json.dump(d, df, indent=2, separators=(",", ": "))
+            dump_json(d, df, indent=2, separators=(",", ": "))
     else:
-        # This printer is to keep the unit tests passing,
-        # some tests capture output with capsys which doesn't
-        # pick up on sys.stdout.write()
-        class Printer:
-            def write(self, text):
-                print(text, end="")
         pretty_print_notebook_diff(afn, bfn, a, d, Printer())
 
     return 0
@@ -63,6 +96,8 @@ def _build_arg_parser():
         )
     add_generic_args(parser)
     add_diff_args(parser)
+    add_diff_filter_args(parser)
+    add_diff_summary_args(parser)
     add_filename_args(parser, ["base", "remote"])
 
     parser.add_argument(
@@ -70,6 +105,18 @@ def _build_arg_parser():
         default=None,
         help="if supplied, the diff is written to this file. "
              "Otherwise it is printed to the terminal.")
+    parser.add_argument(
+        '--blobs',
+        default=None,
+        help="if supplied together with --output, large values in the "
+             "diff are stored once in this directory and referenced "
+             "by content hash in the written diff.")
+    parser.add_argument(
+        '--blob-threshold',
+        default=DEFAULT_BLOB_THRESHOLD,
+        type=int,
+        help="minimal length of strings to store in the blob "
+             "directory. Default is %d." % DEFAULT_BLOB_THRESHOLD)
 
     return parser
 
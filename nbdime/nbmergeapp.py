@@ -17,10 +17,12 @@ import nbdime
 import nbdime.log
 from nbdime.merging import merge_notebooks
 from nbdime.prettyprint import pretty_print_merge_decisions
-from .merging import merge_notebooks
+from .merging import merge_notebooks, merge_notebooks_nway, apply_decisions
+from .merging.rerere import MergeCache
 
 _description = ('Merge two Jupyter notebooks "local" and "remote" with a '
-                'common ancestor "base".')
+                'common ancestor "base". Further notebooks with the same '
+                'ancestor may be given, and are merged in order after "remote".')
 
 
 def main_merge(args):
@@ -28,8 +30,10 @@ def main_merge(args):
     lfn = args.local
     rfn = args.remote
     mfn = args.output
+    # Not set by callers building their own arguments, e.g. the git driver
+    ofns = getattr(args, "others", None) or []
 
-    for fn in (bfn, lfn, rfn):
+    for fn in [bfn, lfn, rfn] + ofns:
         if not os.path.exists(fn):
             nbdime.log.error("Cannot find file '{}'".format(fn))
             return 1
@@ -38,13 +42,38 @@ def main_merge(args):
     l = nbformat.read(lfn, as_version=4)
     r = nbformat.read(rfn, as_version=4)
 
-    merged, decisions = merge_notebooks(b, l, r, args)
+    cache = None
+    if getattr(args, "rerere", False) and ofns:
+        nbdime.log.warning("Not reusing recorded resolutions in a merge of more than two branches.")
+    elif getattr(args, "rerere", False):
+        cache = MergeCache.in_repository()
+        if cache is None:
+            nbdime.log.warning("Not in a git repository, not reusing recorded resolutions.")
+
+    if ofns:
+        others = [nbformat.read(fn, as_version=4) for fn in ofns]
+        merged, decisions, branch_conflicts = merge_notebooks_nway(
+            b, [l, r] + others, args)
+    elif cache is not None:
+        decisions = cache.decide_notebook_merge(b, l, r, args)
+        merged = apply_decisions(b, decisions)
+        branch_conflicts = None
+    else:
+        merged, decisions = merge_notebooks(b, l, r, args)
+        branch_conflicts = None
     conflicted = [d for d in decisions if d.conflict]
+    if branch_conflicts is not None and any(branch_conflicts):
+        conflicted = conflicted or [d for bc in branch_conflicts for d in bc]
 
     returncode = 1 if conflicted else 0
 
     if conflicted:
         nbdime.log.warning("Conflicts occured during merge operation.")
+        if branch_conflicts is not None:
+            for fn, bc in zip([lfn, rfn] + ofns, branch_conflicts):
+                if bc:
+                    nbdime.log.warning("%d conflicted decisions involve %s.",
+                                       len(bc), fn)
     else:
         nbdime.log.debug("Merge completed successfully with no unresolvable conflicts.")
 
@@ -75,6 +104,11 @@ def _build_arg_parser():
     add_diff_args(parser)
     add_merge_args(parser)
     add_filename_args(parser, ["base", "local", "remote"])
+    parser.add_argument(
+        "others",
+        nargs="*",
+        help="Further modified notebook filenames, merged in order "
+             "after remote.")
 
     parser.add_argument(
         '-o', '--output',
@@ -16,6 +16,7 @@ import io
 import nbdime
 from nbdime.patching import patch_notebook
 from nbdime.diff_format import to_diffentry_dicts
+from nbdime.blobs import DirectoryBlobStore
 
 
 _description = "Apply patch from nbdiff to a Jupyter notebook."
@@ -36,7 +37,10 @@ def main_patch(args):
         diff = json.load(patch_file)
     diff = to_diffentry_dicts(diff)
 
-    after = patch_notebook(before, diff)
+    blobs = DirectoryBlobStore(args.blobs) if args.blobs else None
+    # The base notebook is not used after patching,
+    # so the result can share untouched cells with it
+    after = patch_notebook(before, diff, blobs, share=True)
 
     if output_filename:
         nbformat.write(after, output_filename)
@@ -61,6 +65,11 @@ def _build_arg_parser():
         help="if supplied, the patched notebook is written "
              "to this file. Otherwise it is printed to the "
              "terminal.")
+    parser.add_argument(
+        '--blobs',
+        default=None,
+        help="directory with values referenced by the patch, "
+             "as written by nbdiff --blobs.")
     return parser
 
 
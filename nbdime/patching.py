@@ -10,14 +10,37 @@ import copy
 import nbformat
 from nbformat import NotebookNode
 
-from .diff_format import DiffOp, NBDiffFormatError, flatten_list_of_string_diff
+from .diff_format import (
+    DiffOp, NBDiffFormatError, op_add, op_remove, op_replace, op_addrange,
+    op_removerange, op_patch, _overlaps, _combine_ops)
+from .blobs import resolve_blobs
 
 
 
-__all__ = ["patch", "patch_notebook"]
+__all__ = ["patch", "patch_notebook", "compose", "invert", "expand_moves"]
 
 
-def patch_list(obj, diff):
+def _inserted(value, blobs, share):
+    """Prepare a value inserted by a diff entry.
+
+    Resolves blob references, and in share mode converts the value to a
+    NotebookNode copy so that the patched object never aliases the diff.
+    """
+    if blobs is not None:
+        value = resolve_blobs(value, blobs)
+    if share:
+        value = nbformat.from_dict(value)
+    return value
+
+
+def _taken(values, share):
+    "Values taken unchanged from the object being patched."
+    if share:
+        return values
+    return (copy.deepcopy(value) for value in values)
+
+
+def patch_list(obj, diff, blobs=None, share=False):
     # The patched sequence to build and return
     newobj = []
     # Index into obj, the next item to take unless diff says otherwise
@@ -28,30 +51,35 @@ def patch_list(obj, diff):
         assert isinstance(index, int)
 
         # Take values from obj not mentioned in diff, up to not including index
-        newobj.extend(copy.deepcopy(value) for value in obj[take:index])
+        newobj.extend(_taken(obj[take:index], share))
 
         if op == DiffOp.ADDRANGE:
             # Extend with new values directly
-            newobj.extend(e.valuelist)
+            newobj.extend(_inserted(e.valuelist, blobs, share))
             skip = 0
         elif op == DiffOp.REMOVERANGE:
             # Delete a number of values by skipping
             skip = e.length
         elif op == DiffOp.PATCH:
-            newobj.append(patch(obj[index], e.diff))
+            newobj.append(patch(obj[index], e.diff, blobs, share))
             skip = 1
+        elif op == DiffOp.MOVE:
+            # Insert a patched copy of the moved value, whose removal
+            # from its source index is a separate entry
+            newobj.append(patch(obj[e.source], e.diff, blobs, share))
+            skip = 0
         # Note that the operations ADD, REMOVE, REPLACE are not produced by the
         # diff algorithm anymore, keeping these cases just in case we want them back:
         elif op == DiffOp.ADD:
             # Append new value directly
-            newobj.append(e.value)
+            newobj.append(_inserted(e.value, blobs, share))
             skip = 0
         elif op == DiffOp.REMOVE:
             # Delete values obj[index] by incrementing take to skip
             skip = 1
         elif op == DiffOp.REPLACE:
             # Add replacement value and skip old
-            newobj.append(e.value)
+            newobj.append(_inserted(e.value, blobs, share))
             skip = 1
         else:
             raise NBDiffFormatError("Invalid op {}.".format(op))
@@ -62,29 +90,149 @@ def patch_list(obj, diff):
         take = max(take, index + skip)
 
     # Take values at end not mentioned in diff
-    newobj.extend(copy.deepcopy(value) for value in obj[take:len(obj)])
+    newobj.extend(_taken(obj[take:len(obj)], share))
 
     return newobj
 
 
-def patch_string(obj, diff):
-    "Patch a multiline string, assuming diff is line based."
-    # This can possibly be optimized for str if wanted, but
-    # waiting until patch_list has been tested and debugged better
+def _line_offsets(lines):
+    "Character offset of the start of each line, and of the end of the last."
+    offsets = [0]
+    total = 0
+    for line in lines:
+        total += len(line)
+        offsets.append(total)
+    return offsets
+
 
-    # Flatten line-based diff to character based first!
-    diff = flatten_list_of_string_diff(obj, diff)
-    return "".join(patch_list(list(obj), diff))
+def _joined_line_patches(diff):
+    """Join consecutive patches of the same line into a single patch.
+
+    Merge actions such as local_then_remote concatenate the line diffs of
+    both sides, which may patch the same line twice. The character diffs
+    of such patches are combined and sorted like flatten_list_of_string_diff
+    would, so that the line is patched once.
+    """
+    joined = []
+    for e in diff:
+        if (e.op == DiffOp.PATCH and joined and
+                joined[-1].op == DiffOp.PATCH and joined[-1].key == e.key):
+            combined = []
+            for d in joined[-1].diff + e.diff:
+                if _overlaps(combined, d):
+                    combined[-1] = _combine_ops(combined[-1], d)
+                else:
+                    combined.append(d)
+            combined.sort(key=lambda x: x.key)
+            joined[-1] = op_patch(e.key, combined)
+        else:
+            joined.append(e)
+    return joined
+
+
+def patch_string(obj, diff, blobs=None, share=False):
+    """Patch a multiline string, assuming diff is line based.
+
+    Unchanged runs of lines are taken as single slices of obj, and
+    patched lines are patched with patch_singleline_string, so that the
+    result is built from a short list of segments with a single join.
+    """
+    offsets = _line_offsets(obj.splitlines(True))
+    nlines = len(offsets) - 1
+    # Merged diffs are not always sorted, the slices below require it
+    diff = _joined_line_patches(sorted(diff, key=lambda e: e.key))
+
+    # Segments of the patched string to join
+    segments = []
+    # Index into lines, the next line to take unless diff says otherwise
+    take = 0
+    for e in diff:
+        op = e.op
+        index = e.key
+        assert isinstance(index, int)
+
+        # Take lines not mentioned in diff, up to not including index
+        if take < index:
+            segments.append(obj[offsets[take]:offsets[min(index, nlines)]])
+
+        if op == DiffOp.ADDRANGE:
+            # Insert new lines directly (valuelist may also be a string)
+            segments.append("".join(_inserted(e.valuelist, blobs, False)))
+            skip = 0
+        elif op == DiffOp.REMOVERANGE:
+            # Delete a number of lines by skipping
+            skip = e.length
+        elif op == DiffOp.PATCH:
+            # Patch the characters of a single line
+            if index < nlines:
+                line = obj[offsets[index]:offsets[index + 1]]
+            else:
+                line = ""
+            segments.append(patch_singleline_string(line, e.diff))
+            skip = 1
+        # Note that the operations ADD, REMOVE, REPLACE are not produced by the
+        # diff algorithm, but handled here for lines as in patch_list:
+        elif op == DiffOp.ADD:
+            segments.append(_inserted(e.value, blobs, False))
+            skip = 0
+        elif op == DiffOp.REMOVE:
+            skip = 1
+        elif op == DiffOp.REPLACE:
+            segments.append(_inserted(e.value, blobs, False))
+            skip = 1
+        else:
+            raise NBDiffFormatError("Invalid op {}.".format(op))
+
+        # Skip the specified number of lines, but never decrement take.
+        take = max(take, index + skip)
+
+    # Take lines at end not mentioned in diff
+    if take < nlines:
+        segments.append(obj[offsets[take]:])
+
+    return "".join(segments)
 
 
 def patch_singleline_string(obj, diff):
-    "Patch a singleline string, assuming diff is character based."
-    # This can possibly be optimized for str if wanted, but
-    # waiting until patch_list has been tested and debugged better
-    return "".join(patch_list(list(obj), diff))
+    """Patch a singleline string, assuming diff is character based.
+
+    Unchanged characters are taken as slices of obj between diff entries.
+    """
+    segments = []
+    # Index into obj, the next character to take unless diff says otherwise
+    take = 0
+    for e in diff:
+        op = e.op
+        index = e.key
+        assert isinstance(index, int)
+
+        # Take characters not mentioned in diff, up to not including index
+        if take < index:
+            segments.append(obj[take:index])
+
+        if op == DiffOp.ADDRANGE:
+            segments.append("".join(e.valuelist))
+            skip = 0
+        elif op == DiffOp.REMOVERANGE:
+            skip = e.length
+        elif op == DiffOp.ADD:
+            segments.append(e.value)
+            skip = 0
+        elif op == DiffOp.REMOVE:
+            skip = 1
+        elif op == DiffOp.REPLACE:
+            segments.append(e.value)
+            skip = 1
+        else:
+            raise NBDiffFormatError("Invalid op {} for character diff.".format(op))
+
+        take = max(take, index + skip)
+
+    segments.append(obj[take:])
+    return "".join(segments)
 
 
-def patch_dict(obj, diff):
+def patch_dict(obj, diff, blobs=None, share=False):
     newobj = {}
     deleted_keys = set()
 
@@ -96,27 +244,27 @@ def patch_dict(obj, diff):
 
         if op == DiffOp.ADD:
             assert key not in obj
-            newobj[key] = e.value
+            newobj[key] = _inserted(e.value, blobs, share)
         elif op == DiffOp.REMOVE:
             deleted_keys.add(key)
         elif op == DiffOp.REPLACE:
             assert key not in deleted_keys
-            newobj[key] = e.value
+            newobj[key] = _inserted(e.value, blobs, share)
         elif op == DiffOp.PATCH:
             assert key not in deleted_keys
-            newobj[key] = patch(obj[key], e.diff)
+            newobj[key] = patch(obj[key], e.diff, blobs, share)
         else:
             raise NBDiffFormatError("Invalid op {}.".format(op))
 
     # Take items not mentioned in diff
     for key in obj:
         if key not in deleted_keys and key not in newobj:
-            newobj[key] = copy.deepcopy(obj[key])
+            newobj[key] = obj[key] if share else copy.deepcopy(obj[key])
 
     return NotebookNode(newobj)
 
 
-def patch(obj, diff):
+def patch(obj, diff, blobs=None, share=False):
     """Produce a patched version of obj with given hierarchial diff.
 
     A valid input object can be any dict or list of leaf values,
@@ -127,16 +275,376 @@ def patch(obj, diff):
     Leaf values are any non-dict, non-list objects as far as patch
     is concerned, although the intentional use of this library
     is that values are json-serializable.
+
+    If the diff has been written with large values externalized to a
+    blob store (see nbdime.blobs), pass the store as blobs to resolve
+    the references as values are inserted.
+
+    By default the result is fully independent of obj, with all values
+    not touched by the diff deep copied. If share is True, untouched
+    subtrees are instead shared with obj, and only the containers on the
+    paths from the root to changed values are rebuilt. The cost is then
+    proportional to the size of the changes rather than the size of obj,
+    but the caller must not modify obj or the result in place afterwards.
     """
     if isinstance(obj, dict):
-        return patch_dict(obj, diff)
+        return patch_dict(obj, diff, blobs, share)
     elif isinstance(obj, list):
-        return patch_list(obj, diff)
+        return patch_list(obj, diff, blobs, share)
     elif isinstance(obj, string_types):
-        return patch_string(obj, diff)
+        return patch_string(obj, diff, blobs, share)
     else:
         raise ValueError("Invalid object type to patch: {}".format(type(obj).__name__))
 
 
-def patch_notebook(nb, diff):
-    return nbformat.from_dict(patch(nb, diff))
+def patch_notebook(nb, diff, blobs=None, share=False):
+    """Patch a notebook with given diff, returning a NotebookNode.
+
+    See patch for the meaning of blobs and share. With share=True and
+    nb a NotebookNode, as returned by nbformat.read, the final
+    conversion of the whole notebook with nbformat.from_dict is skipped.
+    """
+    newnb = patch(nb, diff, blobs, share)
+    if share and isinstance(nb, NotebookNode):
+        # Untouched subtrees are already NotebookNodes, rebuilt
+        # dicts are created as NotebookNodes by patch_dict and
+        # inserted values are converted as they are inserted
+        return newnb
+    return nbformat.from_dict(newnb)
+
+
+def _patch_item(value, diff):
+    """Patch a sequence item with the diff of a patch entry.
+
+    Items of a line based string diff are lines, patched by character
+    based diffs. These hold no patch entries and only string valuelists,
+    while diffs of full string values are line based.
+    """
+    if isinstance(value, string_types):
+        for e in diff:
+            if e.op == DiffOp.PATCH or (e.op == DiffOp.ADDRANGE and
+                                        not isinstance(e.valuelist, string_types)):
+                return patch(value, diff)
+        return patch_singleline_string(value, diff)
+    return patch(value, diff)
+
+
+def _concat(a, b):
+    "Concatenate two valuelists, which may be lists or strings."
+    if isinstance(a, string_types) and isinstance(b, string_types):
+        return a + b
+    return list(a) + list(b)
+
+
+def _as_range_ops(diff):
+    "Rewrite single item ops in a sequence diff as range ops."
+    newdiff = []
+    for e in diff:
+        op = e.op
+        if op == DiffOp.ADD:
+            newdiff.append(op_addrange(e.key, [e.value]))
+        elif op == DiffOp.REMOVE:
+            newdiff.append(op_removerange(e.key, 1))
+        elif op == DiffOp.REPLACE:
+            newdiff.append(op_addrange(e.key, [e.value]))
+            newdiff.append(op_removerange(e.key, 1))
+        else:
+            newdiff.append(e)
+    return newdiff
+
+
+class _ComposedSequenceDiff(object):
+    """Collects composed sequence diff entries in order of key.
+
+    Consecutive addranges at the same key and adjacent removeranges are
+    merged as they are added.
+    """
+
+    def __init__(self):
+        self.diff = []
+
+    def addrange(self, key, valuelist):
+        if not valuelist:
+            return
+        last = self.diff[-1] if self.diff else None
+        if last is not None and last.op == DiffOp.ADDRANGE and last.key == key:
+            self.diff[-1] = op_addrange(key, _concat(last.valuelist, valuelist))
+        else:
+            self.diff.append(op_addrange(key, valuelist))
+
+    def removerange(self, key, length):
+        last = self.diff[-1] if self.diff else None
+        if (last is not None and last.op == DiffOp.REMOVERANGE and
+                last.key + last.length == key):
+            self.diff[-1] = op_removerange(last.key, last.length + length)
+        else:
+            self.diff.append(op_removerange(key, length))
+
+    def patch(self, key, diff):
+        if diff:
+            self.diff.append(op_patch(key, diff))
+
+
+def _sequence_pieces(diff):
+    """Describe how the items of a sequence diff's target map to its base.
+
+    Yields tuples (kind, a, b, x) in order, where a and b are positions in
+    the base and target sequences and kind is one of
+
+      "keep": x items are unchanged, or an unbounded number at the end
+      "add": the items in valuelist x are inserted before base item a
+      "remove": x base items are removed, taking no place in the target
+      "patch": base item a is patched by diff x into target item b
+    """
+    a = b = 0
+    for e in diff:
+        if e.key > a:
+            yield "keep", a, b, e.key - a
+            b += e.key - a
+            a = e.key
+        if e.op == DiffOp.ADDRANGE:
+            yield "add", a, b, e.valuelist
+            b += len(e.valuelist)
+        elif e.op == DiffOp.REMOVERANGE:
+            yield "remove", a, b, e.length
+            a += e.length
+        elif e.op == DiffOp.PATCH:
+            yield "patch", a, b, e.diff
+            a += 1
+            b += 1
+        else:
+            raise NBDiffFormatError("Invalid op {} in sequence diff.".format(e.op))
+    yield "keep", a, b, None
+
+
+def _compose_sequence(d1, d2):
+    d1 = _as_range_ops(d1)
+    d2 = _as_range_ops(d2)
+    out = _ComposedSequenceDiff()
+
+    # Walk through the target items of d1 piece by piece, applying the
+    # entries of d2 which refer to them by their target position j
+    i2 = 0
+    n2 = len(d2)
+    removing = 0
+    for kind, a, b, x in _sequence_pieces(d1):
+        if kind == "remove":
+            out.removerange(a, x)
+            continue
+        elif kind == "add":
+            end = b + len(x)
+            added = []
+        elif kind == "patch":
+            end = b + 1
+        elif x is None:
+            end = None
+        else:
+            end = b + x
+
+        j = b
+        while end is None or j < end:
+            if removing:
+                # Remove target items covered by a removerange of d2
+                count = removing if end is None else min(removing, end - j)
+                if kind == "keep":
+                    out.removerange(a + j - b, count)
+                elif kind == "patch":
+                    out.removerange(a, 1)
+                # Items added by d1 and removed by d2 are simply dropped
+                removing -= count
+                j += count
+                continue
+
+            e = d2[i2] if i2 < n2 else None
+            if e is not None and e.key == j:
+                i2 += 1
+                if e.op == DiffOp.ADDRANGE:
+                    if kind == "add":
+                        added.append(e.valuelist)
+                    else:
+                        out.addrange(a + j - b, e.valuelist)
+                elif e.op == DiffOp.REMOVERANGE:
+                    removing = e.length
+                elif e.op == DiffOp.PATCH:
+                    if kind == "keep":
+                        out.patch(a + j - b, e.diff)
+                    elif kind == "patch":
+                        out.patch(a, compose(x, e.diff))
+                    else:
+                        added.append([_patch_item(x[j - b], e.diff)])
+                    j += 1
+                else:
+                    raise NBDiffFormatError("Invalid op {} in sequence diff.".format(e.op))
+                continue
+
+            # Items untouched by d2 up to its next entry
+            if e is None and end is None:
+                break
+            stop = end if e is None else e.key if end is None else min(e.key, end)
+            if kind == "add":
+                added.append(x[j - b:stop - b])
+            elif kind == "patch":
+                out.patch(a, x)
+            j = stop
+
+        if kind == "add":
+            valuelist = x[:0]
+            for values in added:
+                valuelist = _concat(valuelist, values)
+            out.addrange(a, valuelist)
+
+    return out.diff
+
+
+def _compose_mapping(d1, d2):
+    entries1 = {e.key: e for e in d1}
+    entries2 = {e.key: e for e in d2}
+    newdiff = []
+    for key in sorted(set(entries1) | set(entries2)):
+        e1 = entries1.get(key)
+        e2 = entries2.get(key)
+        if e2 is None:
+            newdiff.append(e1)
+            continue
+        elif e1 is None:
+            newdiff.append(e2)
+            continue
+
+        op1 = e1.op
+        op2 = e2.op
+        if op1 == DiffOp.ADD and op2 == DiffOp.REMOVE:
+            pass
+        elif op1 == DiffOp.ADD and op2 == DiffOp.REPLACE:
+            newdiff.append(op_add(key, e2.value))
+        elif op1 == DiffOp.ADD and op2 == DiffOp.PATCH:
+            newdiff.append(op_add(key, patch(e1.value, e2.diff)))
+        elif op1 == DiffOp.REMOVE and op2 == DiffOp.ADD:
+            newdiff.append(op_replace(key, e2.value))
+        elif op1 in (DiffOp.REPLACE, DiffOp.PATCH) and op2 == DiffOp.REMOVE:
+            newdiff.append(op_remove(key))
+        elif op1 in (DiffOp.REPLACE, DiffOp.PATCH) and op2 == DiffOp.REPLACE:
+            newdiff.append(op_replace(key, e2.value))
+        elif op1 == DiffOp.REPLACE and op2 == DiffOp.PATCH:
+            newdiff.append(op_replace(key, patch(e1.value, e2.diff)))
+        elif op1 == DiffOp.PATCH and op2 == DiffOp.PATCH:
+            d = compose(e1.diff, e2.diff)
+            if d:
+                newdiff.append(op_patch(key, d))
+        else:
+            raise NBDiffFormatError(
+                "Cannot compose {} and {} on key {}.".format(op1, op2, key))
+    return newdiff
+
+
+def compose(d1, d2):
+    """Compose two diffs into a single diff.
+
+    Given a diff d1 from a to b and a diff d2 from b to c, returns a diff
+    from a to c such that patch(a, compose(d1, d2)) == patch(b, d2).
+    The result is computed from the diff entries alone, without access
+    to a or b, so the cost is proportional to the size of the diffs.
+    Values added by d1 and patched or removed by d2 are patched or
+    dropped, and sequence entries of d2 are offset to positions in a.
+    """
+    if not d1:
+        return list(d2)
+    if not d2:
+        return list(d1)
+    if isinstance(d1[0].key, string_types) or isinstance(d2[0].key, string_types):
+        return _compose_mapping(d1, d2)
+    return _compose_sequence(d1, d2)
+
+
+def _invert_sequence(diff, items, lines):
+    """Invert a sequence diff, where items is the base sequence.
+
+    If lines is True, items are the lines of a string and patch entries
+    hold character based diffs of single lines.
+    """
+    newdiff = []
+    # Offset from positions in the base to positions in the target
+    offset = 0
+    for e in _as_range_ops(diff):
+        op = e.op
+        key = e.key + offset
+        if op == DiffOp.ADDRANGE:
+            newdiff.append(op_removerange(key, len(e.valuelist)))
+            offset += len(e.valuelist)
+        elif op == DiffOp.REMOVERANGE:
+            values = items[e.key:e.key + e.length]
+            if not isinstance(values, string_types):
+                values = copy.deepcopy(values)
+            newdiff.append(op_addrange(key, values))
+            offset -= e.length
+        elif op == DiffOp.PATCH:
+            if lines:
+                line = items[e.key] if e.key < len(items) else ""
+                d = _invert_sequence(e.diff, line, False)
+            else:
+                d = invert(e.diff, items[e.key])
+            newdiff.append(op_patch(key, d))
+        else:
+            raise NBDiffFormatError("Invalid op {} in sequence diff.".format(op))
+    return newdiff
+
+
+def invert(diff, base):
+    """Invert a diff, given the object it applies to.
+
+    Given a diff d from a to b, returns a diff from b to a such that
+    patch(patch(a, d), invert(d, a)) == a. Removed and replaced values
+    are recovered from base, which is only accessed along the paths
+    touched by the diff, so the cost is proportional to the size of the
+    diff and the removed values rather than the size of base.
+    """
+    if isinstance(base, dict):
+        newdiff = []
+        for e in diff:
+            op = e.op
+            key = e.key
+            if op == DiffOp.ADD:
+                newdiff.append(op_remove(key))
+            elif op == DiffOp.REMOVE:
+                newdiff.append(op_add(key, copy.deepcopy(base[key])))
+            elif op == DiffOp.REPLACE:
+                newdiff.append(op_replace(key, copy.deepcopy(base[key])))
+            elif op == DiffOp.PATCH:
+                newdiff.append(op_patch(key, invert(e.diff, base[key])))
+            else:
+                raise NBDiffFormatError("Invalid op {} in mapping diff.".format(op))
+        return newdiff
+    elif isinstance(base, list):
+        return _invert_sequence(diff, base, False)
+    elif isinstance(base, string_types):
+        return _invert_sequence(diff, base.splitlines(True), True)
+    else:
+        raise ValueError("Invalid object type to invert diff for: {}".format(type(base).__name__))
+
+
+def expand_moves(diff, base):
+    """Convert a diff in the extended format to the basic diff format.
+
+    Move entries, produced by diff_notebooks(..., detect_moves=True),
+    are replaced by addrange entries inserting the moved value patched
+    with the nested diff of the move, the same diff as diffing without
+    move detection would give. Like invert, this needs the object the
+    diff applies to, which is only accessed along the paths of the diff.
+    """
+    newdiff = []
+    for e in diff:
+        if e.op == DiffOp.MOVE:
+            value = patch(base[e.source], e.diff)
+            if (newdiff and newdiff[-1].op == DiffOp.ADDRANGE and
+                    newdiff[-1].key == e.key):
+                # Merge with the preceding insertion at the same key
+                newdiff[-1] = op_addrange(e.key, newdiff[-1].valuelist + [value])
+            else:
+                newdiff.append(op_addrange(e.key, [value]))
+        elif e.op == DiffOp.ADDRANGE and newdiff and (
+                newdiff[-1].op == DiffOp.ADDRANGE and newdiff[-1].key == e.key):
+            newdiff[-1] = op_addrange(e.key, newdiff[-1].valuelist + e.valuelist)
+        elif e.op == DiffOp.PATCH and not isinstance(base, string_types):
+            newdiff.append(op_patch(e.key, expand_moves(e.diff, base[e.key])))
+        else:
+            newdiff.append(e)
+    return newdiff
@@ -26,13 +26,18 @@ except ImportError:
 
 from .diff_format import NBDiffFormatError, DiffOp, op_patch
 from .patching import patch, patch_string
-from .utils import star_path, split_path, join_path
+from .diff_index import DiffIndex, as_path_tuple
+from .diffing.diff3 import split_lines, line_changes, merge_text
+from .utils import star_path, split_path, join_path, resolve_path
 from .utils import as_text, as_text_lines
 from .log import warning
 
 # TODO: Make this configurable
 use_git = True
 use_diff = True
+# Render diffs and merges with the external git or diff tools above,
+# instead of in process
+use_external = False
 use_colors = True
 
 # Indentation offset in pretty-print
@@ -70,6 +75,11 @@ ADD      = '{color}+  '.format(color=GREEN)
 INFO     = '{color}## '.format(color=BLUE)
 DIFF_ENTRY_END = '\n'
 
+# Line prefixes of unified diffs, like in the output of git diff
+DIFF_KEEP   = ' '
+DIFF_REMOVE = '{color}-'.format(color=RED)
+DIFF_ADD    = '{color}+'.format(color=GREEN)
+
 
 def external_merge_render(cmd, b, l, r):
     b = as_text(b)
@@ -213,8 +223,81 @@ def diff_render_with_difflib(a, b):
     return "".join(diff.splitlines(True)[2:])
 
 
+def _format_range(start, length):
+    "Format a range of lines for a unified diff hunk header."
+    if length == 1:
+        return "%d" % (start + 1,)
+    if length == 0:
+        return "%d,0" % (start,)
+    return "%d,%d" % (start + 1, length)
+
+
+def _function_line(line):
+    "Return the line shortened for a hunk header if it starts a function, like git."
+    c = line[:1]
+    if c and (c.isalpha() and c < '\x80' or c in '_$'):
+        line = line.encode('utf8')[:80].decode('utf8', 'ignore')
+        return line.rstrip()
+    return None
+
+
+def diff_render_in_process(a, b, context=3):
+    """Render the line diff of a and b as unified diff hunks.
+
+    Lines are aligned and hunks formatted like git diff does, without
+    spawning git.
+    """
+    alines = split_lines(as_text(a))
+    blines = split_lines(as_text(b))
+    changes = line_changes(alines, blines, indent_heuristic=True)
+
+    # Group changes separated by at most twice the context into hunks
+    hunks = []
+    for change in changes:
+        if hunks and change[0] - (hunks[-1][-1][0] + hunks[-1][-1][2]) <= 2 * context:
+            hunks[-1].append(change)
+        else:
+            hunks.append([change])
+
+    out = []
+    function = ''
+    searched = -1
+    for hunk in hunks:
+        i0 = max(hunk[0][0] - context, 0)
+        j0 = max(hunk[0][1] - context, 0)
+        i1, j1, n, m = hunk[-1]
+        i1 = min(i1 + n + context, len(alines))
+        j1 = min(j1 + m + context, len(blines))
+
+        # Name the last function started before the hunk, searching
+        # back to the previous hunk or keeping the function found there
+        for k in range(i0 - 1, searched, -1):
+            line = _function_line(alines[k])
+            if line is not None:
+                function = line
+                break
+        searched = i0 - 1
+
+        out.append("@@ -%s +%s @@%s\n" % (
+            _format_range(i0, i1 - i0), _format_range(j0, j1 - j0),
+            " " + function if function else ""))
+        i = i0
+        for ci, cj, n, m in hunk + [(i1, None, 0, 0)]:
+            for line in alines[i:ci]:
+                out.append("%s%s\n" % (DIFF_KEEP, line.rstrip("\n")))
+            for line in alines[ci:ci + n]:
+                out.append("%s%s%s\n" % (DIFF_REMOVE, line.rstrip("\n"), RESET))
+            if cj is not None:
+                for line in blines[cj:cj + m]:
+                    out.append("%s%s%s\n" % (DIFF_ADD, line.rstrip("\n"), RESET))
+            i = ci + n
+    return "".join(out)
+
+
 def diff_render(a, b):
-    if use_git and which('git'):
+    if not use_external:
+        return diff_render_in_process(a, b)
+    elif use_git and which('git'):
         return diff_render_with_git(a, b)
     elif use_diff and which('diff'):
         return diff_render_with_diff(a, b)
@@ -235,14 +318,36 @@ def merge_render_with_git(b, l, r, strategy=None):
     else:
         warning("Using git merge-file but ignoring strategy %s" % (strategy,))
     merged = external_merge_render(cmd.split(), b, l, r)
+    return _strip_conflict_end(merged)
+
 
+def _strip_conflict_end(merged):
     # Remove trailing newline if ">>>>>>> remote" is the last line
     lines = merged.splitlines(True)
-    if "\n" in lines[-1] and (">"*7) in lines[-1]:
+    if lines and "\n" in lines[-1] and (">"*7) in lines[-1]:
         merged = merged.rstrip()
     return merged
 
 
+def merge_render_in_process(b, l, r, strategy=None):
+    """Render a merge like merge_render_with_git, without spawning git."""
+    favor = None
+    if strategy is None:
+        pass
+    elif strategy == "use-local":
+        favor = "local"
+    elif strategy == "use-remote":
+        favor = "remote"
+    elif strategy == "union":
+        favor = "union"
+    else:
+        warning("Using in process merge render but ignoring strategy %s" % (strategy,))
+    merged = merge_text(as_text(b), as_text(l), as_text(r), favor)
+    # normalize newlines, like the output of external tools
+    merged = merged.replace('\r\n', '\n')
+    return _strip_conflict_end(merged)
+
+
 def merge_render_with_diff3(b, l, r, strategy=None):
     cmd = diff3_print_cmd
     if strategy is None:
@@ -256,7 +361,9 @@ def merge_render_with_diff3(b, l, r, strategy=None):
 def merge_render(b, l, r, strategy=None):
     if strategy == "use-base":
         return b
-    if use_git and which('git'):
+    if not use_external:
+        return merge_render_in_process(b, l, r, strategy)
+    elif use_git and which('git'):
         return merge_render_with_git(b, l, r, strategy)
     elif use_diff and which('diff3'):
         return merge_render_with_diff3(b, l, r, strategy)
@@ -593,6 +700,13 @@ def pretty_print_diff_entry(a, e, path, out=sys.stdout):
         pretty_print_diff_action("deleted", keyrange, out)
         pretty_print_value_at(a[key: key + e.length], path, REMOVE, out)
 
+    elif op == DiffOp.MOVE:
+        sourcepath = "/".join((path, str(e.source)))
+        pretty_print_diff_action("moved %s before" % sourcepath, nextpath, out)
+        if e.diff:
+            pretty_print_diff(a[e.source], e.diff, sourcepath, out)
+            return
+
     elif op == DiffOp.REMOVE:
         pretty_print_diff_action("deleted", nextpath, out)
         pretty_print_value_at(a[key], nextpath, REMOVE, out)
@@ -673,6 +787,30 @@ def pretty_print_diff(a, di, path, out=sys.stdout):
         raise NBDiffFormatError("Invalid type {} for diff presentation.".format(type(a)))
 
 
+def pretty_print_diff_at(a, di, path, out=sys.stdout):
+    """Pretty-print the changes to the value at path in a.
+
+    di is either a diff of a, or a DiffIndex of one. Pass a DiffIndex to
+    print the changes at many paths, e.g. for each cell, without walking
+    the full diff for each path.
+    """
+    if not isinstance(di, DiffIndex):
+        di = DiffIndex(di)
+    path = as_path_tuple(path)
+    if not path:
+        pretty_print_diff(a, di.diff, "", out)
+        return
+    parent = resolve_path(a, path[:-1])
+    if isinstance(parent, string_types):
+        # Diffs on strings are line-based, a path within a string
+        # points to a line of it
+        pretty_print_diff(parent, di.entries_at(path), join_path(path), out)
+        return
+    parentpath = join_path(path[:-1]) if len(path) > 1 else ""
+    for e in di.entries_at(path):
+        pretty_print_diff_entry(parent, e, parentpath, out)
+
+
 notebook_diff_header = """\
 nbdiff {afn} {bfn}
 --- {afn}{atime}
@@ -702,6 +840,19 @@ def pretty_print_notebook_diff(afn, bfn, a, di, out=sys.stdout):
         pretty_print_diff(a, di, path, out)
 
 
+def pretty_print_diff_stat(afn, bfn, stat, out=sys.stdout):
+    """Pretty-print a summary of a notebook diff, as computed by diff_stat."""
+    out.write("nbdiff {} {}\n".format(afn, bfn))
+    out.write(" cells: {cells_added} added, {cells_removed} removed, "
+              "{cells_modified} modified\n".format(**stat))
+    out.write(" source lines: {source_lines_added} added, "
+              "{source_lines_removed} removed\n".format(**stat))
+    out.write(" output lines: {output_lines_added} added, "
+              "{output_lines_removed} removed\n".format(**stat))
+    if stat["metadata_changed"]:
+        out.write(" metadata changed\n")
+
+
 def pretty_print_merge_decision(base, decision, out=sys.stdout):
     prefix = IND
 
@@ -730,26 +881,10 @@ def pretty_print_merge_decision(base, decision, out=sys.stdout):
 
         if diff:
             out.write("%s%s%s:%s\n" % (INFO.replace("##", "---"), dkey, note, RESET))
-            value = base
-            for i, k in enumerate(decision.common_path):
-                if isinstance(value, string_types):
-                    # Example case:
-                    #   common_path = /cells/0/source/3
-                    #   value = nb.cells[0].source
-                    #   k = line number 3
-                    #   k is last item in common_path
-                    assert i == len(decision.common_path) - 1
-
-                    # Diffs on strings are usually line-based, _except_
-                    # when common_path points to a line within a string.
-                    # Wrap character based diff in a patch op with line
-                    # number to normalize.
-                    diff = [op_patch(k, diff)]
-                    break
-                else:
-                    # Either a list or dict, get subvalue
-                    value = value[k]
-            pretty_print_diff(value, diff, path, out)
+            # Print the changes at common_path of the diff from base
+            for k in reversed(decision.common_path):
+                diff = [op_patch(k, diff)]
+            pretty_print_diff_at(base, diff, decision.common_path, out)
 
 
 #def pretty_print_string_diff(string, lineno, diff, out):
@@ -42,6 +42,8 @@ def nocolor(request):
         REMOVE=pp.REMOVE.replace(pp.RED,''),
         INFO=pp.INFO.replace(pp.BLUE,''),
         RESET='',
+        DIFF_REMOVE=pp.DIFF_REMOVE.replace(pp.RED,''),
+        DIFF_ADD=pp.DIFF_ADD.replace(pp.GREEN,''),
         git_diff_print_cmd=pp.git_diff_print_cmd.replace(' --color-words', ''),
     )
     patch.start()
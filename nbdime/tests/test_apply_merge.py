@@ -6,15 +6,21 @@
 from __future__ import unicode_literals
 
 import copy
+import json
 import re
 
-from nbdime import patch
+from nbformat import NotebookNode
+from nbformat.v4 import new_notebook, new_code_cell
+
+from nbdime import patch, decide_merge
 from nbdime.diff_format import op_patch
 from nbdime.merging.decisions import (
-    apply_decisions, ensure_common_path, MergeDecision)
+    apply_decisions, ensure_common_path, merged_diff, MergeDecision)
 
 from nbdime import diff
 
+from .fixtures import matching_nb_triplets
+
 
 def has_merge_conflicts(decisions):
     "Return whether there are conflicting entries or not."
@@ -147,3 +153,49 @@ def test_apply_merge_on_dicts():
 # merge decisions with common path "cells" can modify cells/* indices
 # merge decisions with common path "cells/*" only edit exactly one of the cells/* objects
 # applying cells/* before cells means editing first, no indices modified, then moving things around
+
+
+def test_apply_decisions_copy_on_write(matching_nb_triplets):
+    base, local, remote = matching_nb_triplets
+    snapshot = copy.deepcopy(base)
+    decisions = decide_merge(base, local, remote)
+    merged = apply_decisions(base, decisions)
+    # Base is untouched, and the result is the same as for a plain dict
+    assert base == snapshot
+    assert isinstance(merged, NotebookNode)
+    assert merged == apply_decisions(json.loads(json.dumps(base)), decisions)
+
+
+def test_apply_decisions_shares_unchanged_values():
+    base = new_notebook(cells=[new_code_cell("x = %d\n" % i) for i in range(3)])
+    local = copy.deepcopy(base)
+    local.cells[1].metadata["tags"] = ["changed"]
+    decisions = decide_merge(base, local, base)
+    merged = apply_decisions(base, decisions)
+    assert merged.cells[1].metadata == {"tags": ["changed"]}
+    assert base.cells[1].metadata == {}
+    assert merged.cells[0] is base.cells[0]
+    assert merged.cells[2] is base.cells[2]
+    assert merged.metadata is base.metadata
+
+
+def test_merged_diff(matching_nb_triplets):
+    base, local, remote = matching_nb_triplets
+    decisions = decide_merge(base, local, remote)
+    d = merged_diff(base, decisions)
+    assert patch(base, d) == apply_decisions(base, decisions)
+
+
+def test_merge_decision_sort_key():
+    dec = MergeDecision(common_path=("cells", 3, "source"), action="local",
+                        conflict=False, local_diff=[], remote_diff=None)
+    assert dec.sort_key == (("cells",), ("", -3), ("source",))
+    assert dec.sort_key is dec.sort_key
+    # Changing the path updates the key
+    dec.common_path = ("cells", 10)
+    assert dec.sort_key == (("cells",), ("", -10))
+    # Copies are plain decisions with the same json representation
+    for other in (copy.copy(dec), copy.deepcopy(dec)):
+        assert isinstance(other, MergeDecision)
+        assert other.sort_key == dec.sort_key
+        assert json.dumps(other, sort_keys=True) == json.dumps(dict(dec), sort_keys=True)
@@ -0,0 +1,108 @@
+# coding: utf-8
+
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+from __future__ import unicode_literals
+
+import os
+
+import pytest
+import nbformat
+
+from nbdime import diff_notebooks, patch, patch_notebook
+from nbdime.diff_format import op_add, op_addrange, op_patch, op_replace
+from nbdime.blobs import (
+    MemoryBlobStore, DirectoryBlobStore, encode_blob, externalize_blobs,
+    resolve_blobs, resolve_diff_blobs, is_blob_ref)
+from nbdime import nbdiffapp, nbpatchapp
+
+from .fixtures import filespath, matching_nb_pairs
+
+
+image = "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg==" * 10
+
+
+def test_externalize_blobs_stores_repeated_values_once():
+    store = MemoryBlobStore()
+    d = [
+        op_add("a", {"data": {"image/png": image, "text/plain": "short"}}),
+        op_replace("b", image),
+        op_patch("c", [op_addrange(0, [image, "x"])]),
+        ]
+    ed = externalize_blobs(d, store, threshold=100)
+    assert len(store) == 1
+    assert is_blob_ref(ed[0].value["data"]["image/png"])
+    assert ed[0].value["data"]["text/plain"] == "short"
+    assert is_blob_ref(ed[1].value)
+    assert is_blob_ref(ed[2].diff[0].valuelist[0])
+    assert ed[2].diff[0].valuelist[1] == "x"
+    # Input is not modified
+    assert d[1].value == image
+    # References resolve to the original diff
+    assert resolve_diff_blobs(ed, store) == d
+    assert resolve_blobs(ed[1].value, store) == image
+
+
+def test_patch_resolves_blob_references():
+    store = MemoryBlobStore()
+    base = {"a": [1, 2], "s": "line 1\nline 2\n"}
+    d = [
+        op_patch("a", [op_addrange(1, [image])]),
+        op_add("b", image),
+        op_patch("s", [op_addrange(1, [image + "\n"])]),
+        ]
+    expected = patch(base, d)
+    ed = externalize_blobs(d, store, threshold=100)
+    assert patch(base, ed, blobs=store) == expected
+
+
+def test_memory_blob_store_drops_least_recently_used():
+    values = [image + str(i) for i in range(3)]
+    size = len(encode_blob(values[0]))
+    store = MemoryBlobStore(max_bytes=2 * size)
+    refs = [store.put(v) for v in values[:2]]
+    # Using the first blob keeps it over the second
+    assert store.get(refs[0]) == values[0]
+    refs.append(store.put(values[2]))
+    assert len(store) == 2
+    assert store.get(refs[0]) == values[0]
+    assert store.get(refs[2]) == values[2]
+    with pytest.raises(KeyError):
+        store.get(refs[1])
+
+
+def test_externalize_notebook_diffs(matching_nb_pairs):
+    a, b = matching_nb_pairs
+    d = diff_notebooks(a, b)
+    store = MemoryBlobStore()
+    ed = externalize_blobs(d, store, threshold=20)
+    assert patch_notebook(a, ed, store) == patch_notebook(a, d)
+
+
+def test_directory_blob_store(tmpdir):
+    store = DirectoryBlobStore(str(tmpdir.join("blobs")))
+    ref = store.put(image)
+    assert ref == store.put(image)
+    assert ref["$blob"] in store
+    assert store.get(ref) == image
+    assert store.get(ref["$blob"]) == image
+    with pytest.raises(KeyError):
+        store.get("0" * 64)
+
+
+def test_nbdiff_and_nbpatch_with_blobs(tmpdir):
+    p = filespath()
+    afn = os.path.join(p, "output-conflict--1.ipynb")
+    bfn = os.path.join(p, "output-conflict--2.ipynb")
+    dfn = str(tmpdir.join("diff.json"))
+    mfn = str(tmpdir.join("patched.ipynb"))
+    blobdir = str(tmpdir.join("blobs"))
+
+    assert 0 == nbdiffapp.main([afn, bfn, "-o", dfn, "--blobs", blobdir, "--blob-threshold", "20"])
+    assert os.listdir(blobdir)
+    assert 0 == nbpatchapp.main([afn, dfn, "-o", mfn, "--blobs", blobdir])
+
+    a = nbformat.read(afn, as_version=4)
+    b = nbformat.read(bfn, as_version=4)
+    assert nbformat.read(mfn, as_version=4) == patch_notebook(a, diff_notebooks(a, b))
@@ -73,6 +73,66 @@ def test_nbdiff_app():
     assert nbdime.log.logger.level == logging.WARN
 
 
+def test_nbdiff_app_stat(capsys):
+    p = filespath()
+    afn = os.path.join(p, "foo--1.ipynb")
+    bfn = os.path.join(p, "foo--2.ipynb")
+
+    args = nbdiffapp._build_arg_parser().parse_args([afn, bfn, '--stat'])
+    assert 0 == main_diff(args)
+    out = capsys.readouterr()[0]
+    assert out == (
+        "nbdiff {} {}\n"
+        " cells: 0 added, 0 removed, 2 modified\n"
+        " source lines: 4 added, 4 removed\n"
+        " output lines: 1 added, 1 removed\n").format(afn, bfn)
+
+
+def test_nbdiff_app_quiet(capsys):
+    p = filespath()
+    afn = os.path.join(p, "foo--1.ipynb")
+    bfn = os.path.join(p, "foo--2.ipynb")
+
+    args = nbdiffapp._build_arg_parser().parse_args([afn, bfn, '--quiet'])
+    assert 1 == main_diff(args)
+    args = nbdiffapp._build_arg_parser().parse_args([afn, afn, '--quiet'])
+    assert 0 == main_diff(args)
+    assert capsys.readouterr()[0] == ""
+
+
+def test_nbdiff_app_filters(capsys, nocolor):
+    p = filespath()
+    afn = os.path.join(p, "foo--1.ipynb")
+    bfn = os.path.join(p, "foo--2.ipynb")
+
+    args = nbdiffapp._build_arg_parser().parse_args(
+        [afn, bfn, '--exclude', '/cells/*/outputs'])
+    assert 0 == main_diff(args)
+    out = capsys.readouterr()[0]
+    assert "/cells/0/source" in out
+    assert "/outputs" not in out
+
+    args = nbdiffapp._build_arg_parser().parse_args(
+        [afn, bfn, '--include', '/cells/*/outputs', '--stat'])
+    assert 0 == main_diff(args)
+    out = capsys.readouterr()[0]
+    assert " source lines: 0 added, 0 removed\n" in out
+    assert " output lines: 1 added, 1 removed\n" in out
+
+
+def test_nbdiff_app_cells(capsys, nocolor):
+    p = filespath()
+    afn = os.path.join(p, "foo--1.ipynb")
+    bfn = os.path.join(p, "foo--2.ipynb")
+
+    args = nbdiffapp._build_arg_parser().parse_args([afn, bfn, '--cells', '1:'])
+    assert args.cells == (1, None)
+    assert 0 == main_diff(args)
+    out = capsys.readouterr()[0]
+    assert "/cells/1/source" in out
+    assert "/cells/0/" not in out
+
+
 def test_nbmerge_app(tempfiles, capsys):
     p = tempfiles
     bfn = os.path.join(p, "multilevel-test-base.ipynb")
@@ -124,6 +184,34 @@ def test_nbmerge_app_conflict(tempfiles, capsys):
     assert nb_stdout == nb_file
 
 
+def test_nbmerge_app_nway(tempfiles, capsys, caplog):
+    p = tempfiles
+    bfn = os.path.join(p, "inline-conflict--1.ipynb")
+    lfn = os.path.join(p, "inline-conflict--2.ipynb")
+    rfn = os.path.join(p, "inline-conflict--3.ipynb")
+
+    # Merging base again does not change the result
+    assert 1 == nbmergeapp.main([bfn, lfn, rfn])
+    out2, err = capsys.readouterr()
+    caplog.clear()
+    assert 1 == nbmergeapp.main([bfn, lfn, rfn, bfn])
+    out3, err = capsys.readouterr()
+    assert out3 == out2
+    # Conflicts are reported for the branches involved
+    assert 'involve %s' % lfn in caplog.text
+    assert 'involve %s' % rfn in caplog.text
+    assert 'involve %s' % bfn not in caplog.text
+
+    assert 0 == nbmergeapp.main([bfn, bfn, lfn, bfn])
+    # Conflicts between earlier branches are kept after merging more branches
+    assert 1 == nbmergeapp.main([bfn, lfn, rfn, lfn])
+
+    # Recorded resolutions are only reused when merging two branches
+    caplog.clear()
+    assert 1 == nbmergeapp.main([bfn, lfn, rfn, bfn, '--rerere'])
+    assert 'Not reusing recorded resolutions' in caplog.text
+
+
 def test_nbmerge_app_decisions(tempfiles, capsys, reset_log):
     p = tempfiles
     bfn = os.path.join(p, "inline-conflict--1.ipynb")
@@ -202,6 +290,14 @@ def test_mergedriver_config(git_repo):
     with pytest.raises(CalledProcessError):
         out = get_output('git config --get --local merge.jupyternotebook.driver')
 
+    main(['config', '--enable', '--rerere'])
+    out = get_output('git config --get --local merge.jupyternotebook.driver')
+    assert 'git-nbmergedriver merge --rerere' in out
+
+    main(['config', '--disable', '--rerere'])
+    with pytest.raises(CalledProcessError):
+        out = get_output('git config --get --local merge.jupyternotebook.driver')
+
 
 def test_mergetool_config(git_repo):
     main = nbdime.gitmergetool.main
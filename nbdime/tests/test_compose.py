@@ -0,0 +1,169 @@
+# coding: utf-8
+
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+from __future__ import unicode_literals
+
+import copy
+import random
+
+import pytest
+
+from nbdime import diff, patch, diff_notebooks, patch_notebook
+from nbdime.patching import compose, invert
+from nbdime.diff_format import (
+    op_add, op_remove, op_replace, op_addrange, op_removerange, op_patch,
+    is_valid_diff)
+
+from .fixtures import matching_nb_triplets
+
+
+def check_compose(a, b, c):
+    d1 = diff(a, b)
+    d2 = diff(b, c)
+    d = compose(d1, d2)
+    assert is_valid_diff(d, deep=True)
+    assert patch(a, d) == patch(b, d2) == c
+
+
+def random_edit_list(rng, values):
+    values = list(values)
+    for _ in range(rng.randint(0, 4)):
+        r = rng.random()
+        i = rng.randint(0, len(values))
+        if r < 0.4:
+            values[i:i] = [rng.randint(0, 9) for _ in range(rng.randint(1, 3))]
+        elif values:
+            del values[i:i + rng.randint(1, 3)]
+    return values
+
+
+def random_edit_string(rng, s):
+    lines = s.splitlines(True)
+    for _ in range(rng.randint(0, 4)):
+        r = rng.random()
+        i = rng.randint(0, len(lines))
+        if r < 0.3:
+            lines.insert(i, "new line %d\n" % rng.randint(0, 99))
+        elif r < 0.6 and i < len(lines):
+            del lines[i]
+        elif i < len(lines):
+            # Small change within a line, giving a character based patch
+            line = lines[i]
+            k = rng.randint(0, max(0, len(line) - 1))
+            lines[i] = line[:k] + rng.choice("xyz") + line[k + 1:]
+    return "".join(lines)
+
+
+def random_edit_dict(rng, d):
+    d = copy.deepcopy(d)
+    for key in ["a", "b", "c", "d"]:
+        r = rng.random()
+        if r < 0.2:
+            d.pop(key, None)
+        elif r < 0.4:
+            d[key] = rng.randint(0, 9)
+        elif r < 0.7 and isinstance(d.get(key), list):
+            d[key] = random_edit_list(rng, d[key])
+        elif r < 0.9 and isinstance(d.get(key), str):
+            d[key] = random_edit_string(rng, d[key])
+    return d
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_compose_random_lists(seed):
+    rng = random.Random(seed)
+    a = [rng.randint(0, 9) for _ in range(rng.randint(0, 12))]
+    b = random_edit_list(rng, a)
+    c = random_edit_list(rng, b)
+    check_compose(a, b, c)
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_compose_random_strings(seed):
+    rng = random.Random(seed)
+    a = "".join("line %d of text\n" % i for i in range(rng.randint(0, 8)))
+    b = random_edit_string(rng, a)
+    c = random_edit_string(rng, b)
+    check_compose(a, b, c)
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_compose_random_dicts(seed):
+    rng = random.Random(seed)
+    a = {"a": [1, 2, 3], "b": "first line\nsecond line\n", "c": 7}
+    b = random_edit_dict(rng, a)
+    c = random_edit_dict(rng, b)
+    check_compose(a, b, c)
+
+
+def test_compose_cancels_add_and_remove():
+    assert compose([op_add("x", 1)], [op_remove("x")]) == []
+    assert compose([op_addrange(2, [1, 2])], [op_removerange(2, 2)]) == []
+    assert compose([op_remove("x")], [op_add("x", 2)]) == [op_replace("x", 2)]
+
+
+def test_compose_patches_added_values():
+    d1 = [op_addrange(1, ["ab\n", "cd\n"])]
+    d2 = [op_patch(2, [op_addrange(1, "x")])]
+    assert compose(d1, d2) == [op_addrange(1, ["ab\n", "cxd\n"])]
+    assert patch("0\n1\n", compose(d1, d2)) == "0\nab\ncxd\n1\n"
+
+    d1 = [op_add("x", {"y": [1]})]
+    d2 = [op_patch("x", [op_patch("y", [op_addrange(1, [2])])])]
+    assert compose(d1, d2) == [op_add("x", {"y": [1, 2]})]
+
+
+def test_compose_offsets_sequence_entries():
+    a = list(range(10))
+    d1 = [op_removerange(0, 3), op_addrange(5, ["x", "y"])]
+    d2 = [op_removerange(1, 1), op_addrange(4, ["z"]), op_removerange(6, 1)]
+    b = patch(a, d1)
+    assert patch(a, compose(d1, d2)) == patch(b, d2)
+
+
+def test_compose_notebooks(matching_nb_triplets):
+    base, local, remote = matching_nb_triplets
+    d1 = diff_notebooks(base, local)
+    d2 = diff_notebooks(local, remote)
+    d = compose(d1, d2)
+    assert is_valid_diff(d, deep=True)
+    assert patch_notebook(base, d) == patch_notebook(local, d2) == remote
+
+
+def check_invert(a, b):
+    d = diff(a, b)
+    di = invert(d, a)
+    assert is_valid_diff(di, deep=True)
+    assert patch(b, di) == a
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_invert_random(seed):
+    rng = random.Random(seed)
+    a = [rng.randint(0, 9) for _ in range(rng.randint(0, 12))]
+    check_invert(a, random_edit_list(rng, a))
+    a = "".join("line %d of text\n" % i for i in range(rng.randint(0, 8)))
+    check_invert(a, random_edit_string(rng, a))
+    a = {"a": [1, 2, 3], "b": "first line\nsecond line\n", "c": 7}
+    check_invert(a, random_edit_dict(rng, a))
+
+
+def test_invert_entries():
+    a = {"x": 1, "y": [1, 2, 3], "z": "abc\n"}
+    d = [op_add("w", 0), op_remove("x"),
+         op_patch("y", [op_addrange(0, [0]), op_removerange(0, 2)]),
+         op_patch("z", [op_patch(0, [op_removerange(1, 1)])])]
+    assert invert(d, a) == [
+        op_remove("w"), op_add("x", 1),
+        op_patch("y", [op_removerange(0, 1), op_addrange(1, [1, 2])]),
+        op_patch("z", [op_patch(0, [op_addrange(1, "b")])])]
+    assert patch(patch(a, d), invert(d, a)) == a
+
+
+def test_invert_notebooks(matching_nb_triplets):
+    base, local, remote = matching_nb_triplets
+    for a, b in [(base, local), (base, remote), (local, remote)]:
+        d = diff_notebooks(a, b)
+        assert patch_notebook(b, invert(d, a)) == a
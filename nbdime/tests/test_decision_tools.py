@@ -10,7 +10,8 @@ import pytest
 from nbdime.diff_format import op_remove, op_patch
 from nbdime.merging.decisions import (
     ensure_common_path, resolve_action, MergeDecisionBuilder,
-    MergeDecision, pop_patch_decision, push_patch_decision)
+    MergeDecision, pop_patch_decision, push_patch_decision,
+    DecisionIndex, filter_decisions)
 
 
 # `ensure_common_path` tests:
@@ -118,3 +119,24 @@ def test_pop_patch_multilevel():
     assert dec.common_path == ("a", "b", "c", "d")
     assert dec.local_diff == [op_remove("e")]
     assert dec.remote_diff == [op_remove("f")]
+
+
+def test_decision_index_filter():
+    decisions = [
+        MergeDecision(common_path=("cells", 0, "source"), action="base",
+                      conflict=True, local_diff=[op_remove(0)], remote_diff=[op_remove(1)]),
+        MergeDecision(common_path=("cells", 1), action="local", conflict=False,
+                      local_diff=[op_patch("outputs", [op_remove(0)])], remote_diff=None),
+        MergeDecision(common_path=("metadata",), action="remote", conflict=False,
+                      local_diff=None, remote_diff=[op_remove("x")]),
+        MergeDecision(common_path=("cells", 2, "source"), action="base",
+                      conflict=True, local_diff=[op_remove(0)], remote_diff=[op_remove(1)]),
+        ]
+    index = DecisionIndex(decisions)
+    assert index.filter("/cells/*/source") == [0, 3]
+    assert index.filter("/cells/*/outputs") == [1]
+    assert index.filter("/cells") == [0, 1, 3]
+    assert index.filter("/cells/*", exact=True) == []
+    assert index.filter("/metadata") == [2]
+    assert index.filter("/nbformat") == []
+    assert filter_decisions("/cells/*/source", decisions) == [0, 3]
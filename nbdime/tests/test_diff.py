@@ -8,10 +8,12 @@ from __future__ import print_function
 
 #import pytest
 #import copy
+import difflib
 import operator
 
 from nbdime import diff
 from nbdime.diff_format import op_patch, op_add, op_replace, op_remove
+from nbdime.diffing.generic import compare_strings_approximate, shared_base_matchers
 from nbdime.diffing.snakes import compute_snakes, compute_snakes_multilevel
 
 from .fixtures import check_symmetric_diff_and_patch
@@ -131,3 +133,19 @@ def test_compute_snakes_multilevel():
     assert snakes == [(0,0,1), (2,2,1)]
     snakes = compute_snakes_multilevel(A, B, compares)
     assert snakes == [(0,0,4)]
+
+
+def test_compare_strings_approximate_base_is_second_sequence():
+    # The ratio of difflib is not symmetric, the base string x is always
+    # the second sequence, as preprocessed by SequenceMatcher
+    x, y = "babaabb", "abbbabb"
+    assert difflib.SequenceMatcher(None, x, y, autojunk=False).ratio() > 0.5
+    assert difflib.SequenceMatcher(None, y, x, autojunk=False).ratio() < 0.5
+    assert not compare_strings_approximate(x, y, threshold=0.5)
+    assert compare_strings_approximate(y, x, threshold=0.5)
+    with shared_base_matchers():
+        assert not compare_strings_approximate(x, y, threshold=0.5)
+        assert compare_strings_approximate(y, x, threshold=0.5)
+        # Again with the preprocessing of both kept
+        assert not compare_strings_approximate(x, y, threshold=0.5)
+        assert compare_strings_approximate(y, x, threshold=0.5)
@@ -0,0 +1,72 @@
+# coding: utf-8
+
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+from __future__ import unicode_literals
+
+from nbdime.diffing.diff3 import split_lines, line_changes, merge_text
+
+
+def test_split_lines():
+    assert split_lines("") == []
+    assert split_lines("a") == ["a"]
+    assert split_lines("a\nb\n") == ["a\n", "b\n"]
+    assert split_lines("a\r\n\nb") == ["a\r\n", "\n", "b"]
+
+
+def test_line_changes():
+    a = split_lines("a\nb\nc\nd\n")
+    b = split_lines("a\nc\nd\ne\n")
+    assert line_changes(a, b) == [(1, 1, 1, 0), (4, 3, 0, 1)]
+    assert line_changes(a, a) == []
+    assert line_changes([], b) == [(0, 0, 0, 4)]
+
+
+def test_line_changes_shifts_like_git():
+    # The inserted blank line and closing brace are ambiguous, git
+    # places insertions as far down as possible...
+    a = split_lines("{\n}\n")
+    b = split_lines("{\n}\n{\n}\n")
+    assert line_changes(a, b) == [(2, 2, 0, 2)]
+
+    # ...or where the indentation suggests with the indent heuristic
+    a = split_lines("}\n")
+    b = split_lines("}\n    y\n}\n")
+    assert line_changes(a, b) == [(1, 1, 0, 2)]
+    assert line_changes(a, b, indent_heuristic=True) == [(0, 0, 0, 2)]
+
+
+def test_merge_text():
+    base = "a\nb\nc\nd\ne\nf\ng\n"
+    local = "a\nB\nc\nd\ne\nf\ng\n"
+    remote = "a\nb\nc\nd\ne\nF\ng\n"
+    assert merge_text(base, local, remote) == "a\nB\nc\nd\ne\nF\ng\n"
+    assert merge_text(base, local, base) == local
+    assert merge_text(base, base, remote) == remote
+
+
+def test_merge_text_conflicts():
+    base = "a\nb\nc\n"
+    local = "a\nx\nc\n"
+    remote = "a\ny\nc\n"
+    expected = "a\n<<<<<<< local\nx\n=======\ny\n>>>>>>> remote\nc\n"
+    assert merge_text(base, local, remote) == expected
+    assert merge_text(base, local, remote, favor="local") == local
+    assert merge_text(base, local, remote, favor="remote") == remote
+    assert merge_text(base, local, remote, favor="union") == "a\nx\ny\nc\n"
+
+    # Missing newlines at the end of conflicting lines are added
+    expected = "<<<<<<< local\nx\n=======\ny\n>>>>>>> remote\n"
+    assert merge_text("a", "x", "y") == expected
+
+
+def test_merge_text_refines_conflicts():
+    # Equal lines at the ends of conflicting changes are merged
+    base = "a\n"
+    local = "x\nsame\ny\n"
+    remote = "x\nsame\nz\n"
+    assert merge_text(base, local, remote) == (
+        "x\nsame\n<<<<<<< local\ny\n=======\nz\n>>>>>>> remote\n")
+    # and equal changes are not conflicts
+    assert merge_text(base, local, local) == local
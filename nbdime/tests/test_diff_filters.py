@@ -0,0 +1,76 @@
+# coding: utf-8
+
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+from __future__ import unicode_literals
+
+import pytest
+from nbformat.v4 import new_notebook, new_code_cell, new_markdown_cell, new_output
+
+from nbdime import diff_notebooks, patch
+from nbdime.diff_index import DiffIndex
+from nbdime.diffing.filters import filter_notebook, parse_filters
+
+from .fixtures import matching_nb_pairs
+
+
+def make_notebook(source, text):
+    return new_notebook(cells=[
+        new_markdown_cell("# Title\n"),
+        new_code_cell(source, execution_count=1, outputs=[
+            new_output("stream", name="stdout", text=text)]),
+        ], metadata={"kernelspec": {"name": "python3", "display_name": "Python 3"}})
+
+
+def test_parse_filters():
+    assert parse_filters(["/cells/*/source", "!/cells/*/outputs"]) == (
+        [("cells", "*", "source")], [("cells", "*", "outputs")])
+    with pytest.raises(ValueError):
+        parse_filters(["!/"])
+
+
+def test_filter_notebook():
+    nb = make_notebook("x = 1\n", "1\n")
+
+    f = filter_notebook(nb, ["!/cells/*/outputs", "!/metadata"])
+    assert "metadata" not in f
+    assert "outputs" not in f.cells[1]
+    assert f.cells[1].source == nb.cells[1].source
+    # Unfiltered values are shared, and nb is untouched
+    assert f.cells[1].metadata is nb.cells[1].metadata
+    assert nb.cells[1].outputs
+
+    f = filter_notebook(nb, ["/cells/*/source"])
+    assert list(f) == ["cells"]
+    assert [sorted(c) for c in f.cells] == [["cell_type", "source"]] * 2
+
+
+def test_diff_notebooks_with_filters():
+    a = make_notebook("x = 1\n", "1\n")
+    b = make_notebook("x = 2\n", "2\n")
+    b.metadata.kernelspec.name = "python2"
+
+    index = DiffIndex(diff_notebooks(a, b))
+    assert "/cells/1/source" in index
+    assert "/cells/1/outputs" in index
+    assert "/metadata" in index
+
+    index = DiffIndex(diff_notebooks(a, b, filters=["!/cells/*/outputs"]))
+    assert "/cells/1/source" in index
+    assert "/cells/1/outputs" not in index
+    assert "/metadata" in index
+
+    index = DiffIndex(diff_notebooks(a, b, filters=["/cells/*/source"]))
+    assert "/cells/1/source" in index
+    assert "/cells/1/outputs" not in index
+    assert "/metadata" not in index
+
+
+def test_filtered_diff_patches_selected_parts(matching_nb_pairs):
+    a, b = matching_nb_pairs
+    for filters in (["!/cells/*/outputs"], ["/cells/*/source"]):
+        fa = filter_notebook(a, filters)
+        fb = filter_notebook(b, filters)
+        d = diff_notebooks(a, b, filters=filters)
+        assert patch(fa, d) == fb
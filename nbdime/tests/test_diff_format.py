@@ -5,7 +5,9 @@ import io
 import os
 from jsonschema import ValidationError
 from jsonschema import Draft4Validator as Validator
-from nbdime import diff, diff_notebooks
+from nbdime import diff, diff_notebooks, patch
+from nbdime.diff_format import (
+    flatten_list_of_string_diff, offset_op, op_addrange, op_patch)
 from .fixtures import matching_nb_pairs
 
 
@@ -50,3 +52,21 @@ def test_validate_matching_notebook_diff(matching_nb_pairs, validator):
     d = diff_notebooks(a, b)
 
     validator.validate(d)
+
+
+def test_flatten_list_of_string_diff_leaves_input_unchanged():
+    a = ["abc\n", "def\n", "ghi\n"]
+    b = ["abc\n", "xyz\n", "dxf\n", "ghi\n"]
+    d = diff(a, b)
+    before = json.dumps(d)
+    flat = flatten_list_of_string_diff(a, d)
+    assert json.dumps(d) == before
+    # The flattened diff is character based on the joined string
+    assert patch(list("".join(a)), flat) == list("".join(b))
+
+
+def test_offset_op_shares_values():
+    e = op_patch(2, [op_addrange(0, ["x"])])
+    o = offset_op(e, 3)
+    assert o.key == 5 and e.key == 2
+    assert o.diff is e.diff
@@ -0,0 +1,105 @@
+# coding: utf-8
+
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+from __future__ import unicode_literals
+
+import io
+
+from nbdime import diff, diff_notebooks, patch
+from nbdime.diff_format import (
+    DiffOp, op_patch, op_replace, op_addrange, op_removerange)
+from nbdime.diff_index import DiffIndex
+from nbdime.prettyprint import pretty_print_diff_at
+
+from .fixtures import matching_nb_pairs
+
+
+def walk(d, path=()):
+    "Reference traversal of all entries in a diff."
+    for e in d:
+        p = path + (e.key,)
+        yield p, e
+        if e.op == DiffOp.PATCH:
+            for item in walk(e.diff, p):
+                yield item
+
+
+def test_diff_index_lookup():
+    a = {"cells": [{"source": "a\nb\n", "outputs": [1]}, {"source": "c\n"}],
+         "metadata": {"x": 1}}
+    b = {"cells": [{"source": "a\nB\n", "outputs": []}, {"source": "c\n"}, {}],
+         "metadata": {"x": 2}}
+    d = [
+        op_patch("cells", [
+            op_patch(0, [
+                op_patch("outputs", [op_removerange(0, 1)]),
+                op_patch("source", diff("a\nb\n", "a\nB\n")),
+                ]),
+            op_addrange(2, [{}]),
+            ]),
+        op_patch("metadata", [op_replace("x", 2)]),
+        ]
+    index = DiffIndex(d)
+
+    assert patch(a, d) == b
+    assert index.diff_at("") is d
+    assert patch(a["cells"][0], index.diff_at("/cells/0")) == b["cells"][0]
+    assert index.diff_at(("cells", 0, "outputs")) == [op_removerange(0, 1)]
+    assert index.diff_at("/cells/1") == []
+    assert [e.op for e in index.entries_at("/metadata/x")] == [DiffOp.REPLACE]
+    assert [e.op for e in index.entries_at("/cells/2")] == [DiffOp.ADDRANGE]
+    assert "/cells/0/source" in index
+    assert "/cells/1" not in index
+
+    paths = [p for p, e in index.iter_entries("/cells/*/source")]
+    assert paths and all(p[:3] == ("cells", 0, "source") for p in paths)
+    assert [p for p, e in index.iter_entries("/cells/*/outputs")] == [
+        ("cells", 0, "outputs"), ("cells", 0, "outputs", 0)]
+    assert list(index.iter_entries("/nothing/here")) == []
+
+
+def test_diff_index_iterates_like_full_walk(matching_nb_pairs):
+    a, b = matching_nb_pairs
+    d = diff_notebooks(a, b)
+    index = DiffIndex(d)
+    everything = list(walk(d))
+    assert list(index.iter_entries()) == everything
+
+    for pattern in ["/cells", "/cells/*", "/cells/*/source", "/cells/*/outputs", "/metadata"]:
+        parts = pattern.strip("/").split("/")
+        expected = [
+            (p, e) for p, e in everything
+            if len(p) >= len(parts) and
+            all(k == "*" or k == pk for k, pk in zip(parts, p))]
+        assert list(index.iter_entries(pattern)) == expected
+
+
+def test_pretty_print_diff_at(matching_nb_pairs):
+    a, b = matching_nb_pairs
+    d = diff_notebooks(a, b)
+    index = DiffIndex(d)
+    for path, e in index.iter_entries("/cells/*"):
+        if len(path) != 2 or e.op != DiffOp.PATCH:
+            continue
+        out = io.StringIO()
+        pretty_print_diff_at(a, index, path, out)
+        text = out.getvalue()
+        assert text
+        # Only changes to this cell are printed
+        assert "/cells/%d/" % path[1] in text or "/cells/%d\n" % path[1] in text
+        for other in range(len(a.cells)):
+            if other != path[1]:
+                assert "/cells/%d/" % other not in text
+
+
+def test_pretty_print_diff_at_line():
+    a = {"cells": [{"source": "x = 1\nprint(x)\n"}]}
+    d = [op_patch("cells", [op_patch(0, [op_patch("source", [
+        op_patch(1, [op_addrange(7, " + 1")])])])])]
+    out = io.StringIO()
+    pretty_print_diff_at(a, d, "/cells/0/source/1", out)
+    text = out.getvalue()
+    assert "modified /cells/0/source/1" in text
+    assert "print(x + 1)" in text
@@ -9,11 +9,13 @@ from six.moves import xrange as range
 
 import pytest
 
-from nbdime import patch
-from nbdime.diff_format import is_valid_diff
+from nbdime import patch, diff
+from nbdime.diff_format import is_valid_diff, DiffOp, op_addrange, op_removerange
+from nbdime.patching import patch_singleline_string
 
 import nbdime.diffing.sequences
-from nbdime.diffing.sequences import diff_sequence
+from nbdime.diffing.sequences import (
+    diff_sequence, diff_strings_by_token, diff_strings_by_char)
 
 
 def check_diff_sequence_and_patch(a, b):
@@ -58,3 +60,41 @@ def test_diff_sequence(algorithm):
                 for l in range(len(a)+1):
                     b = a[i:j] + a[k:l]
                     check_diff_sequence_and_patch(a, b)
+
+
+def test_diff_strings_by_token():
+    a = "x = foo(bar, 123) + baz;"
+    b = "x = foo(bar, 1234) - baz;"
+    d = diff_strings_by_token(a, b)
+    assert is_valid_diff(d)
+    assert patch_singleline_string(a, d) == b
+    # Whole tokens are replaced
+    assert d == [op_addrange(13, "1234"), op_removerange(13, 3),
+                 op_addrange(18, "-"), op_removerange(18, 1)]
+    assert diff_strings_by_token(a, a) == []
+
+
+def test_diff_strings_by_token_limit():
+    a = "a b c d"
+    b = "a b x d"
+    d = diff_strings_by_token(a, b, token_limit=3)
+    assert d == [op_addrange(0, b), op_removerange(0, len(a))]
+    assert patch_singleline_string(a, d) == b
+
+
+def test_diff_long_lines_by_token(monkeypatch):
+    monkeypatch.setattr(nbdime.diffing.sequences, "intraline_char_limit", 20)
+    line = "var result = compute(alpha, beta, gamma, delta);\n"
+    a = "first\n" + line + "last\n"
+    b = "first\n" + line.replace("gamma", "epsilon") + "last\n"
+    assert len(diff_strings_by_char(line, line.replace("gamma", "g"))) == 2
+    d = diff(a, b)
+    assert patch(a, d) == b
+    assert [e.op for e in d] == [DiffOp.PATCH]
+    assert d[0].diff == [op_addrange(34, "epsilon"), op_removerange(34, 5)]
+
+    # Lines with too many tokens are replaced
+    monkeypatch.setattr(nbdime.diffing.sequences, "intraline_token_limit", 10)
+    d = diff(a, b)
+    assert patch(a, d) == b
+    assert [e.op for e in d] == [DiffOp.ADDRANGE, DiffOp.REMOVERANGE]
@@ -0,0 +1,57 @@
+# coding: utf-8
+
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+from __future__ import unicode_literals
+
+import copy
+
+from nbformat.v4 import new_notebook, new_code_cell, new_markdown_cell, new_output
+
+from nbdime import diff_notebooks
+from nbdime.diffing.summary import notebooks_differ, diff_stat
+
+from .fixtures import matching_nb_pairs
+
+
+def test_notebooks_differ_agrees_with_diff(matching_nb_pairs):
+    a, b = matching_nb_pairs
+    assert notebooks_differ(a, b) == bool(diff_notebooks(a, b))
+    assert not notebooks_differ(a, copy.deepcopy(a))
+
+
+def test_diff_stat():
+    a = new_notebook(cells=[
+        new_markdown_cell("# Title\n"),
+        new_code_cell("x = 1\ny = 2\n", outputs=[
+            new_output("stream", name="stdout", text="1\n2\n")]),
+        new_code_cell("print(x)\n"),
+        ])
+    b = copy.deepcopy(a)
+    b.cells[1].source = "x = 1\ny = 3\nz = 4\n"
+    b.cells[1].outputs[0].text = "1\n3\n"
+    del b.cells[2]
+    b.cells.append(new_markdown_cell("Some\nnotes\n"))
+    b.cells.append(new_markdown_cell("More notes\n"))
+
+    assert diff_stat(a, a) == {
+        "cells_added": 0,
+        "cells_removed": 0,
+        "cells_modified": 0,
+        "source_lines_added": 0,
+        "source_lines_removed": 0,
+        "output_lines_added": 0,
+        "output_lines_removed": 0,
+        "metadata_changed": False,
+        }
+    assert diff_stat(a, b) == {
+        "cells_added": 1,
+        "cells_removed": 0,
+        "cells_modified": 2,
+        "source_lines_added": 2 + 2 + 1,
+        "source_lines_removed": 1 + 1,
+        "output_lines_added": 1,
+        "output_lines_removed": 1,
+        "metadata_changed": False,
+        }
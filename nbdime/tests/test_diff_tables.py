@@ -0,0 +1,153 @@
+# coding: utf-8
+
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+from __future__ import unicode_literals
+
+import random
+
+import pytest
+from nbformat.v4 import new_notebook, new_code_cell, new_output
+
+from nbdime import patch, diff_notebooks, patch_notebook
+from nbdime.diff_format import DiffOp, is_valid_diff
+from nbdime.diffing.tables import (
+    diff_mime_table, compare_mime_tables, align_rows, split_text_rows)
+
+
+def html_table(rows):
+    lines = [
+        '<div>\n',
+        '<table border="1" class="dataframe">\n',
+        '  <thead>\n',
+        '    <tr style="text-align: right;">\n',
+        '      <th></th>\n',
+        '      <th>a</th>\n',
+        '      <th>b</th>\n',
+        '    </tr>\n',
+        '  </thead>\n',
+        '  <tbody>\n',
+        ]
+    for index, a, b in rows:
+        lines.extend([
+            '    <tr>\n',
+            '      <th>%s</th>\n' % index,
+            '      <td>%s</td>\n' % a,
+            '      <td>%s</td>\n' % b,
+            '    </tr>\n',
+            ])
+    lines.extend(['  </tbody>\n', '</table>\n', '</div>'])
+    return "".join(lines)
+
+
+def text_table(rows):
+    lines = ["       a      b\n"]
+    lines.extend("%-4s %6s %6s\n" % row for row in rows)
+    return "".join(lines)
+
+
+def make_rows(n, seed=0):
+    rng = random.Random(seed)
+    return [(i, rng.randint(0, 999), rng.randint(0, 999)) for i in range(n)]
+
+
+def edit_rows(rows):
+    rows = list(rows)
+    del rows[3]                          # Delete a row
+    rows.insert(10, (100, 1, 2))         # Insert a row
+    rows[20] = (rows[20][0], 5, rows[20][2])   # Change a value
+    return rows
+
+
+@pytest.mark.parametrize("mimetype,make_table", [
+    ("text/html", html_table),
+    ("text/plain", text_table),
+    ])
+def test_diff_mime_table_rows(mimetype, make_table):
+    arows = make_rows(30)
+    brows = edit_rows(arows)
+    a = make_table(arows)
+    b = make_table(brows)
+    path = "/cells/*/outputs/*/data/" + mimetype
+    d = diff_mime_table(a, b, path=path)
+    assert is_valid_diff(d)
+    assert patch(a, d) == b
+
+    # One removed row, one added row and one patched row
+    ops = [e.op for e in d]
+    assert ops.count(DiffOp.REMOVERANGE) == 1
+    assert ops.count(DiffOp.ADDRANGE) == 1
+    assert ops.count(DiffOp.PATCH) >= 1
+    lines_per_row = 5 if mimetype == "text/html" else 1
+    removed = [e for e in d if e.op == DiffOp.REMOVERANGE][0]
+    added = [e for e in d if e.op == DiffOp.ADDRANGE][0]
+    assert removed.length == lines_per_row
+    assert len(added.valuelist) == lines_per_row
+
+
+def test_diff_mime_table_reordered_rows():
+    arows = make_rows(20)
+    brows = arows[10:] + arows[:10]
+    a = text_table(arows)
+    b = text_table(brows)
+    d = diff_mime_table(a, b, path="/cells/*/outputs/*/data/text/plain")
+    assert patch(a, d) == b
+    # The larger half is kept in place
+    removed = sum(e.length for e in d if e.op == DiffOp.REMOVERANGE)
+    assert removed == 10
+
+
+def test_diff_mime_table_rows_inserted_before_changed_row():
+    arows = make_rows(10)
+    brows = arows[:5] + [(100, 1, 2), (101, 3, 4)] + arows[5:]
+    a = html_table(arows)
+    # The first line of the changed row differs, such that its diff
+    # starts with lines added where the new rows go in
+    b = html_table(brows).replace(
+        '    <tr>\n      <th>5</th>',
+        '    <tr style="color: red; background-color: yellow;">\n      <th>5</th>')
+    d = diff_mime_table(a, b, path="/cells/*/outputs/*/data/text/html")
+    assert is_valid_diff(d)
+    assert patch(a, d) == b
+
+
+def test_diff_mime_table_falls_back_for_other_text():
+    a = "some text\nover a few lines\n"
+    b = "some text\nover a couple of lines\n"
+    assert split_text_rows(a.splitlines(True)) is None
+    d = diff_mime_table(a, b, path="/cells/*/outputs/*/data/text/plain")
+    assert patch(a, d) == b
+
+
+def test_align_rows_anchors_on_unique_keys():
+    a = text_table([(0, 1, 1), (1, 2, 2), (2, 3, 3)])
+    b = text_table([(0, 1, 1), (1, 7, 2), (2, 3, 3)])
+    arows = split_text_rows(a.splitlines(True))
+    brows = split_text_rows(b.splitlines(True))
+    assert align_rows(arows, brows) == [(0, 0), (1, 1), (2, 2), (3, 3)]
+
+
+def test_compare_mime_tables():
+    arows = make_rows(30)
+    a = text_table(arows)
+    assert compare_mime_tables("text/plain", a, text_table(edit_rows(arows)), 0.7)
+    assert not compare_mime_tables("text/plain", a, text_table(make_rows(30, seed=1)), 0.7)
+    assert compare_mime_tables("text/html", html_table(arows), "not a table", 0.7) is None
+
+
+def test_diff_notebooks_with_table_outputs():
+    arows = make_rows(30)
+    brows = edit_rows(arows)
+
+    def nb(rows):
+        output = new_output("execute_result", data={
+            "text/html": html_table(rows),
+            "text/plain": text_table(rows),
+            }, execution_count=1)
+        return new_notebook(cells=[new_code_cell("df", outputs=[output], execution_count=1)])
+
+    a = nb(arows)
+    b = nb(brows)
+    d = diff_notebooks(a, b)
+    assert patch_notebook(a, d) == b
@@ -0,0 +1,72 @@
+# coding: utf-8
+
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+from __future__ import unicode_literals
+
+import io
+import json
+import os
+
+import pytest
+import nbformat
+
+from nbdime import diff_notebooks
+from nbdime.nbdiffapp import main_diff, _build_arg_parser
+from nbdime.jsonstream import iter_json, dump_json
+
+from .fixtures import filespath, matching_nb_pairs
+
+
+def test_iter_json_values():
+    values = [
+        {}, [], "", 0, 1.5, None, True, False,
+        {"a": 1, "b": [1, 2, {"c": "æøå"}]},
+        [[], {}, [[]], {"x": {}}],
+        {1: "int key", None: "none key"},
+        ("tuple", "as", "list"),
+        ]
+    for v in values:
+        assert "".join(iter_json(v)) == json.dumps(v)
+        assert "".join(iter_json(v, indent=2)) == json.dumps(v, indent=2)
+        assert ("".join(iter_json(v, indent=1, separators=(",", ":"))) ==
+                json.dumps(v, indent=1, separators=(",", ":")))
+
+
+def test_iter_json_rejects_unknown_types():
+    with pytest.raises(TypeError):
+        "".join(iter_json({"a": object()}))
+
+
+@pytest.mark.parametrize("chunk_size", [1, 100, 10000])
+def test_iter_json_notebook_diff(matching_nb_pairs, chunk_size):
+    a, b = matching_nb_pairs
+    d = diff_notebooks(a, b)
+    data = {"base": a, "diff": d}
+    chunks = list(iter_json(data, indent=2, separators=(",", ": "),
+                            chunk_size=chunk_size))
+    assert "".join(chunks) == json.dumps(data, indent=2, separators=(",", ": "))
+    # All chunks but the last should be at least chunk_size long
+    assert all(len(c) >= chunk_size for c in chunks[:-1])
+
+
+def test_dump_json():
+    out = io.StringIO()
+    dump_json({"cells": ["x" * 50] * 10}, out, chunk_size=16)
+    assert json.loads(out.getvalue()) == {"cells": ["x" * 50] * 10}
+
+
+def test_nbdiff_app_output_file(tmpdir):
+    p = filespath()
+    afn = os.path.join(p, "multilevel-test-base.ipynb")
+    bfn = os.path.join(p, "multilevel-test-local.ipynb")
+    dfn = str(tmpdir.join("diff.json"))
+
+    args = _build_arg_parser().parse_args([afn, bfn, "-o", dfn])
+    assert 0 == main_diff(args)
+    with io.open(dfn, encoding="utf8") as f:
+        written = json.load(f)
+    a = nbformat.read(afn, as_version=4)
+    b = nbformat.read(bfn, as_version=4)
+    assert written == json.loads(json.dumps(diff_notebooks(a, b)))
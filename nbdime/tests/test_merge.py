@@ -11,6 +11,7 @@ import copy
 import pytest
 
 from nbdime import decide_merge, apply_decisions, diff
+from nbdime.merging.generic import decide_merge_with_diff
 from nbdime.diff_format import (
     op_patch, op_add, op_remove, op_replace, op_addrange, op_removerange)
 
@@ -246,6 +247,17 @@ def test_deep_merge_onesided_inner_list_insert_no_conflict():
     assert not any([d.conflict for d in decisions])
 
 
+def test_merge_lists_inserts_and_onesided_patch():
+    # Both sides insert before an item, which only local patches
+    b = [[1], [2]]
+    ld = [op_addrange(0, [[0]]), op_patch(0, [op_addrange(1, [5])])]
+    rd = [op_addrange(0, [[3]])]
+    decisions = decide_merge_with_diff(b, None, None, ld, rd)
+    patched = [md for md in decisions if md.common_path == (0,)]
+    assert [(md.action, md.conflict) for md in patched] == [("local", False)]
+    assert apply_decisions(b, decisions)[-2:] == [[1, 5], [2]]
+
+
 def test_deep_merge_twosided_inserts_conflicted():
     # local and remote adds an entry each in a new sublist
     b = []
@@ -7,6 +7,7 @@ from __future__ import unicode_literals
 
 import pytest
 import copy
+import random
 from six import string_types
 import nbformat
 
@@ -17,8 +18,14 @@ from nbdime.merging.autoresolve import (
     make_inline_source_value, autoresolve)
 from nbdime.nbmergeapp import _build_arg_parser
 from nbdime import merge_notebooks, apply_decisions
+from nbdime.merging import merge_notebooks_nway
+from nbdime.merging.session import MergeSession
 from nbdime.diffing.notebooks import diff_notebooks
 from nbdime.merging.notebooks import decide_merge_with_diff, Strategies
+from nbdime.merging.generic import _split_addrange
+import nbdime.merging.notebooks
+import nbdime.diffing.generic
+import nbdime.merging.autoresolve
 
 # FIXME: Extend tests to more merge situations!
 
@@ -35,6 +42,120 @@ def test_merge_matching_notebooks(matching_nb_triplets):
     # We can't really automate a generic merge test, at least passing through code here...
 
 
+def test_diff_base_notebooks_matches_separate_diffs(matching_nb_triplets, monkeypatch):
+    import multiprocessing
+    base, local, remote = matching_nb_triplets
+    expected = diff_notebooks(base, local), diff_notebooks(base, remote)
+    # In one process, sharing the base preprocessing between the diffs
+    monkeypatch.setattr(nbdime.merging.notebooks, "parallel_diff_min_cells", None)
+    assert nbdime.merging.notebooks.diff_base_notebooks(base, local, remote) == expected
+    # In two processes, even on a single processor
+    monkeypatch.setattr(nbdime.merging.notebooks, "parallel_diff_min_cells", 0)
+    monkeypatch.setattr(multiprocessing, "cpu_count", lambda: 2)
+    assert nbdime.merging.notebooks.diff_base_notebooks(base, local, remote) == expected
+    # Keeping the preprocessing of few base strings
+    monkeypatch.setattr(nbdime.merging.notebooks, "parallel_diff_min_cells", None)
+    monkeypatch.setattr(nbdime.diffing.generic, "max_base_matchers", 2)
+    assert nbdime.merging.notebooks.diff_base_notebooks(base, local, remote) == expected
+
+
+def test_diff_base_notebooks_reuses_worker_pool(matching_nb_triplets, monkeypatch):
+    import multiprocessing
+    base, local, remote = matching_nb_triplets
+    monkeypatch.setattr(nbdime.merging.notebooks, "parallel_diff_min_cells", 0)
+    monkeypatch.setattr(multiprocessing, "cpu_count", lambda: 2)
+    expected = nbdime.merging.notebooks.diff_base_notebooks(base, local, remote)
+    pool = nbdime.merging.notebooks._diff_pool
+    assert pool is not None
+    assert nbdime.merging.notebooks.diff_base_notebooks(base, local, remote) == expected
+    assert nbdime.merging.notebooks._diff_pool is pool
+    nbdime.merging.notebooks._close_diff_pool()
+    assert nbdime.merging.notebooks._diff_pool is None
+
+
+def test_parallel_autoresolve_matches_sequential(matching_nb_triplets, monkeypatch):
+    import multiprocessing
+    base, local, remote = matching_nb_triplets
+    inline_args = builder.parse_args(["", "", "", "--output-strategy", "remove"])
+    for a in (args, inline_args):
+        monkeypatch.setattr(nbdime.merging.autoresolve, "parallel_autoresolve_min_cells", None)
+        expected = nbdime.merging.notebooks.decide_notebook_merge(base, local, remote, a)
+        # In a pool of worker processes, even on a single processor
+        monkeypatch.setattr(nbdime.merging.autoresolve, "parallel_autoresolve_min_cells", 0)
+        monkeypatch.setattr(multiprocessing, "cpu_count", lambda: 2)
+        assert nbdime.merging.notebooks.decide_notebook_merge(base, local, remote, a) == expected
+
+
+def test_cell_change_regions():
+    base = sources_to_notebook([["cell %d\n" % i] for i in range(10)])
+    local = copy.deepcopy(base)
+    remote = copy.deepcopy(base)
+    local.cells[1].source = "local 1\n"
+    del local.cells[6]
+    remote.cells.insert(3, nbformat.v4.new_code_cell("remote new\n"))
+    remote.cells[7].source = "remote 6\n"
+    regions = nbdime.merging.notebooks.cell_change_regions(
+        base.cells, local.cells, remote.cells)
+    assert regions == [
+        (1, 2, (1, 2, 1, 2), None),
+        (3, 3, None, (3, 3, 3, 4)),
+        (6, 7, (6, 7, 6, 6), (6, 7, 7, 8)),
+        ]
+
+
+def test_merge_decides_onesided_cells_directly():
+    base = sources_to_notebook([["cell %d\n" % i] for i in range(10)])
+    local = copy.deepcopy(base)
+    remote = copy.deepcopy(base)
+    local.cells[1].source = "local 1\n"
+    local.cells[6].source = "local 6\n"
+    remote.cells.insert(3, nbformat.v4.new_code_cell("remote new\n"))
+    remote.cells[7].source = "remote 6\n"
+    merged, decisions = merge_notebooks(base, local, remote, args)
+
+    assert [c.source for c in merged.cells] == (
+        ["cell 0\n", "local 1\n", "cell 2\n", "remote new\n"] +
+        ["cell %d\n" % i for i in range(3, 6)] +
+        [merged.cells[7].source] + ["cell %d\n" % i for i in range(7, 10)])
+    assert [d.common_path for d in decisions if d.conflict] == [("cells", 6, "source")]
+    assert not any(d.conflict for d in decisions
+                   if d.common_path[:2] in (("cells", 1), ("cells",)))
+
+
+def cells_without_ids(sources):
+    nb = nbformat.v4.new_notebook()
+    for source in sources:
+        cell = nbformat.v4.new_code_cell(source)
+        cell.pop("id", None)
+        nb.cells.append(cell)
+    return nb
+
+
+def test_merge_orders_cells_of_separate_regions():
+    base = cells_without_ids(["alpha\nx = 1\n", "beta\nprint(x)\nalpha\nprint(x)\n"])
+    local = cells_without_ids(["gamma\nalpha\n", "alpha\nx = 1\n"])
+    remote = cells_without_ids(["alpha\nx = 1\n", "print(x)\n"])
+    merged, decisions = merge_notebooks(base, local, remote, args)
+    assert not any(d.conflict for d in decisions)
+    assert [c.source for c in merged.cells] == [
+        "gamma\nalpha\n", "alpha\nx = 1\n", "print(x)\n"]
+
+
+def test_split_concurrent_cell_inserts():
+    shared = [nbformat.v4.new_code_cell("shared_%d = %d\n" % (i, i)) for i in range(300)]
+    local = shared[:150] + [nbformat.v4.new_code_cell("local_value = 1\n")] + shared[150:]
+    remote = (shared[:150] + [nbformat.v4.new_markdown_cell("# Remote heading\n")] +
+              shared[150:] + [nbformat.v4.new_code_cell("remote_value = 2\n")])
+    decisions = _split_addrange(0, local, remote, ("cells",))
+    assert [(d.action, d.conflict) for d in decisions] == [
+        ("either", False), ("base", True), ("either", False), ("remote", False)]
+    assert decisions[0].local_diff[0].valuelist == shared[:150]
+    assert decisions[1].local_diff[0].valuelist == [local[150]]
+    assert decisions[1].remote_diff[0].valuelist == [remote[150]]
+    assert decisions[2].local_diff[0].valuelist == shared[150:]
+    assert decisions[3].remote_diff[0].valuelist == [remote[-1]]
+
+
 def test_autoresolve_notebook_ec():
     # We need a source here otherwise the cells are not aligned
     source = "def foo(x, y):\n    return x**y"
@@ -874,3 +995,199 @@ def test_autoresolve_empty_strategies():
     partial = apply_decisions(base, decisions)
 
     _check(partial, expected_partial, decisions, expected_conflicts)
+
+
+def test_merge_notebooks_nway_two_branches(matching_nb_triplets):
+    base, local, remote = matching_nb_triplets
+    merged, decisions = merge_notebooks(base, local, remote)
+    nmerged, ndecisions, conflicts = merge_notebooks_nway(base, [local, remote])
+    assert nmerged == merged
+    assert len(conflicts) == 2
+    assert any(conflicts) == any(d.conflict for d in decisions)
+
+
+def test_merge_notebooks_nway_without_conflicts():
+    base = sources_to_notebook([["cell %d\n" % i] for i in range(12)])
+    branches = []
+    for k, cells in enumerate([(1, 5), (3, 9), (7, 11)]):
+        nb = copy.deepcopy(base)
+        for i in cells:
+            nb.cells[i].source = "cell %d in branch %d\n" % (i, k)
+        branches.append(nb)
+    branches[2].cells.insert(4, nbformat.v4.new_code_cell("new\n"))
+    expected = [c.source for c in branches[2].cells]
+    for k, cells in enumerate([(1, 5), (3, 9)]):
+        for i in cells:
+            expected[i + (i >= 4)] = "cell %d in branch %d\n" % (i, k)
+
+    merged, decisions, conflicts = merge_notebooks_nway(base, branches)
+    assert [c.source for c in merged.cells] == expected
+    assert conflicts == [[], [], []]
+
+
+def test_merge_notebooks_nway_conflicts_per_branch():
+    base = sources_to_notebook([["cell %d\n" % i] for i in range(6)])
+    branches = [copy.deepcopy(base) for k in range(4)]
+    # Branches 0 and 2 both change cell 1, branch 1 changes cell 4
+    branches[0].cells[1].source = "cell 1 in branch 0\n"
+    branches[2].cells[1].source = "cell 1 in branch 2\n"
+    branches[1].cells[4].source = "cell 4 in branch 1\n"
+    merged, decisions, conflicts = merge_notebooks_nway(base, branches, args)
+    assert [len(c) for c in conflicts] == [1, 0, 1, 0]
+    assert conflicts[0][0] is conflicts[2][0]
+    assert conflicts[0][0].common_path[0] == "cells"
+    assert merged.cells[4].source == "cell 4 in branch 1\n"
+
+
+def test_merge_notebooks_nway_keeps_earlier_conflicts():
+    base = sources_to_notebook([["cell %d\n" % i] for i in range(3)])
+    branches = [copy.deepcopy(base) for k in range(3)]
+    branches[0].cells[1].source = "cell 1 in branch 0\n"
+    branches[1].cells[1].source = "cell 1 in branch 1\n"
+    branches[0].metadata["x"] = 0
+    branches[1].metadata["x"] = 1
+    branches[2].metadata["y"] = 2
+    merged, decisions, conflicts = merge_notebooks_nway(base, branches, args)
+    assert any(d.conflict and d.common_path[:1] == ("cells",) for d in decisions)
+    assert [bool(c) for c in conflicts] == [True, True, False]
+    # The conflict record is kept, along with the later changes
+    assert merged.metadata["y"] == 2
+    assert "x" not in merged.metadata
+    assert "x" in str(merged.metadata["nbdime-conflicts"])
+
+    # Later changes to conflicted values conflict with them as well
+    branches[2].cells[1].source = "cell 1 in branch 2\n"
+    merged, decisions, conflicts = merge_notebooks_nway(base, branches, args)
+    assert [bool(c) for c in conflicts] == [True, True, True]
+    assert merged.cells[1].source == "cell 1\n"
+
+
+def test_merge_notebooks_nway_empty_base():
+    empty = cells_without_ids([])
+    merged, decisions, conflicts = merge_notebooks_nway(empty, [empty, empty])
+    assert merged.cells == []
+    assert conflicts == [[], []]
+
+    added = cells_without_ids(["x = 1\n"])
+    merged, decisions, conflicts = merge_notebooks_nway(empty, [empty, added, added])
+    assert [c.source for c in merged.cells] == ["x = 1\n"]
+    assert conflicts == [[], [], []]
+
+
+def test_merge_notebooks_nway_orders_cells_of_separate_regions():
+    base = cells_without_ids(["alpha\nx = 1\n", "beta\nprint(x)\nalpha\nprint(x)\n"])
+    local = cells_without_ids(["gamma\nalpha\n", "alpha\nx = 1\n"])
+    remote = cells_without_ids(["alpha\nx = 1\n", "print(x)\n"])
+    merged, decisions, conflicts = merge_notebooks_nway(base, [local, remote], args)
+    assert conflicts == [[], []]
+    assert [c.source for c in merged.cells] == [
+        "gamma\nalpha\n", "alpha\nx = 1\n", "print(x)\n"]
+
+
+def test_merge_notebooks_nway_insert_and_patch_after_insert():
+    # The cells merged from the first branches insert before and patch
+    # a cell the next branch only inserts before
+    base = cells_without_ids(["beta\n", "beta\nbeta\n"])
+    branches = [cells_without_ids(sources) for sources in [
+        ["alpha\nalpha\nbeta\nprint(x)\n", "beta\ngamma\nalpha\n", "gamma\n", "x = 1\ngamma\n"],
+        ["gamma\nbeta\n", "print(x)\nalpha\ngamma\n", "beta\n", "x = 1\nalpha\nalpha\nx = 1\n"],
+        ["gamma\n", "x = 1\ngamma\nbeta\nbeta\n", "print(x)\nbeta\nprint(x)\nprint(x)\n"],
+        ["x = 1\nbeta\n"],
+        ]]
+    merged, decisions, conflicts = merge_notebooks_nway(base, branches, args)
+    assert len(conflicts) == 4
+
+
+def test_merge_notebooks_nway_random():
+    rnd = random.Random(1)
+    lines = ["alpha\n", "beta\n", "gamma\n", "x = 1\n", "print(x)\n"]
+
+    def random_notebook():
+        return cells_without_ids([
+            "".join(rnd.choice(lines) for i in range(rnd.randint(1, 4)))
+            for j in range(rnd.randint(0, 4))])
+
+    for i in range(300):
+        base = random_notebook()
+        branches = [random_notebook() for k in range(rnd.randint(2, 4))]
+        merged, decisions, conflicts = merge_notebooks_nway(base, branches, args)
+        assert len(conflicts) == len(branches)
+        if len(branches) == 2:
+            expected, decisions = merge_notebooks(base, branches[0], branches[1], args)
+            if not any(conflicts) and not any(d.conflict for d in decisions):
+                assert merged == expected
+
+
+def test_merge_session_matches_merge(matching_nb_triplets):
+    base, local, remote = matching_nb_triplets
+    session = MergeSession(base, local, remote, args)
+    # Agreed changes may be split by region into more decisions
+    decisions = nbdime.merging.notebooks.decide_notebook_merge(base, local, remote, args)
+    assert session.merged() == apply_decisions(base, decisions)
+    assert sum(md.conflict for md in session.decisions()) == sum(
+        md.conflict for md in decisions)
+
+
+def test_merge_session_orders_cells_of_separate_regions():
+    base = cells_without_ids(["alpha\nx = 1\n", "beta\nprint(x)\nalpha\nprint(x)\n"])
+    local = cells_without_ids(["gamma\nalpha\n", "alpha\nx = 1\n"])
+    remote = cells_without_ids(["alpha\nx = 1\n", "print(x)\n"])
+    session = MergeSession(base, local, remote, args)
+    assert [c.source for c in session.merged().cells] == [
+        "gamma\nalpha\n", "alpha\nx = 1\n", "print(x)\n"]
+
+
+def test_merge_session_matches_merge_random():
+    rnd = random.Random(2)
+    lines = ["alpha\n", "beta\n", "gamma\n", "x = 1\n", "print(x)\n"]
+
+    def random_notebook():
+        return cells_without_ids([
+            "".join(rnd.choice(lines) for i in range(rnd.randint(1, 4)))
+            for j in range(rnd.randint(0, 4))])
+
+    for i in range(200):
+        base, local, remote = [random_notebook() for k in range(3)]
+        decisions = nbdime.merging.notebooks.decide_notebook_merge(base, local, remote, args)
+        session = MergeSession(base, local, remote, args)
+        assert session.merged() == apply_decisions(base, decisions)
+
+
+def test_merge_session_updates_cells():
+    base = sources_to_notebook([["cell %d\n" % i] for i in range(8)])
+    local = copy.deepcopy(base)
+    remote = copy.deepcopy(base)
+    local.cells[1].source = "local 1\n"
+    remote.cells[1].source = "remote 1\n"
+    remote.cells[5].source = "remote 5\n"
+    session = MergeSession(base, local, remote, args)
+    ids = session.ids()
+    conflicted = [i for i in ids if session.decision(i).conflict]
+
+    # Picks update the decisions in place
+    delta = session.pick(conflicted, "remote")
+    assert [i for i, md in delta["updated"]] == conflicted
+    assert session.merged().cells[1].source == "remote 1\n"
+
+    # Editing a cell only decides its region again
+    cell = copy.deepcopy(local.cells[5])
+    cell.source = "local 5\n"
+    delta = session.update_cells("local", 5, 6, [cell])
+    assert not set(delta["removed"]) & set(conflicted)
+    assert delta["added"]
+    assert set(session.ids()) == set(ids) - set(delta["removed"]) | set(
+        i for i, md in delta["added"])
+    assert session.merged().cells[1].source == "remote 1\n"
+    expected = nbdime.merging.notebooks.decide_notebook_merge(
+        base, session.local, session.remote, args)
+    assert [md for md in session.decisions() if md.common_path[:2] != ("cells", 1)] == [
+        md for md in expected if md.common_path[:2] != ("cells", 1)]
+
+    # Inserting and removing cells
+    session.update_cells("remote", 0, 0, [nbformat.v4.new_code_cell("new\n")])
+    session.update_cells("local", 7, 8, [])
+    merged = apply_decisions(base, nbdime.merging.notebooks.decide_notebook_merge(
+        base, session.local, session.remote, args))
+    merged.cells[2].source = "remote 1\n"
+    assert session.merged() == merged
+    assert local.cells[5].source == "cell 5\n"
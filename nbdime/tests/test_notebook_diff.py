@@ -10,10 +10,15 @@ from __future__ import print_function
 
 import pytest
 import copy
+import io
 import nbformat
+from nbformat.v4 import new_notebook, new_code_cell, new_output
 
 from nbdime import patch, patch_notebook, diff_notebooks
-from nbdime.diffing.notebooks import diff_cells
+from nbdime.diff_format import DiffOp, is_valid_diff
+from nbdime.diffing.notebooks import diff_cells, diff_cell_range
+from nbdime.patching import expand_moves
+from nbdime.prettyprint import pretty_print_diff
 
 # pytest conf.py stuff is tricky to use robustly, this works with no magic
 from .fixtures import db, any_nb, any_nb_pair, matching_nb_pairs, assert_is_valid_notebook, check_diff_and_patch
@@ -61,3 +66,77 @@ def test_diff_and_patch_notebooks(any_nb_pair):
     "Test diff/patch on any pair of notebooks in the test suite."
     a, b = any_nb_pair
     assert patch_notebook(a, diff_notebooks(a, b)) == nbformat.from_dict(b)
+
+
+def test_diff_and_patch_notebooks_with_moves(matching_nb_pairs):
+    "Test that move detection gives a diff equivalent to the basic diff."
+    a, b = matching_nb_pairs
+    d = diff_notebooks(a, b, detect_moves=True)
+    assert is_valid_diff(d, deep=True)
+    assert patch_notebook(a, d) == nbformat.from_dict(b)
+    assert expand_moves(d, a) == diff_notebooks(a, b)
+
+
+def test_diff_notebooks_detects_moved_cells():
+    def cell(i):
+        output = new_output("stream", name="stdout", text="output %d\n" % i)
+        source = "".join("%s = %d\n" % ("abcdef"[i] * 20, k) for k in range(3))
+        return new_code_cell(source, outputs=[output])
+
+    a = new_notebook(cells=[cell(i) for i in range(6)])
+    b = copy.deepcopy(a)
+    # Move two cells to the end, changing the source of one of them
+    b.cells = b.cells[:1] + b.cells[3:] + b.cells[1:3]
+    b.cells[-1].source += "x\n"
+
+    d = diff_notebooks(a, b, detect_moves=True)
+    assert patch_notebook(a, d) == b
+    cells_diff = [e for e in d if e.key == "cells"][0].diff
+    moves = [e for e in cells_diff if e.op == DiffOp.MOVE]
+    assert [e.source for e in moves] == [1, 2]
+    assert moves[0].diff == []
+    assert moves[1].diff
+    assert not any(e.op == DiffOp.ADDRANGE for e in cells_diff)
+
+    # Down-converting gives the basic diff
+    assert expand_moves(d, a) == diff_notebooks(a, b)
+
+    out = io.StringIO()
+    pretty_print_diff(a, d, "", out)
+    assert "moved /cells/1 before /cells/6" in out.getvalue()
+
+
+@pytest.mark.parametrize("window", [1, 2, 3])
+def test_diff_cell_range_windows_cover_notebook(matching_nb_pairs, window):
+    "Test that the diffs of consecutive cell ranges together give the other notebook."
+    a, b = matching_nb_pairs
+    n = len(a.cells)
+    bounds = list(range(0, n, window)) + [n]
+    cells = []
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        d = diff_cell_range(a, b, start, stop)
+        assert all(e.key == "cells" for e in d)
+        patched = patch_notebook(a, d).cells
+        # Cells outside the range are unchanged
+        assert patched[:start] == a.cells[:start]
+        assert patched[len(patched) - (n - stop):] == a.cells[stop:]
+        cells.extend(patched[start:len(patched) - (n - stop)])
+    assert cells == b.cells
+
+
+def test_diff_cell_range_matches_full_diff():
+    def cell(i):
+        return new_code_cell("%s = %d\n" % ("abcdefgh"[i] * 10, i))
+
+    a = new_notebook(cells=[cell(i) for i in range(8)])
+    b = copy.deepcopy(a)
+    b.cells[5].source += "y = 1\n"
+    del b.cells[2]
+
+    full = diff_notebooks(a, b)
+    assert [e.key for e in full] == ["cells"]
+    assert diff_cell_range(a, b, 4, 8)[0].diff == [
+        e for e in full[0].diff if e.key >= 4]
+    assert diff_cell_range(a, b, 0, 4)[0].diff == [
+        e for e in full[0].diff if e.key < 4]
+    assert diff_cell_range(a, b, 6, 8) == []
@@ -5,9 +5,15 @@
 
 from __future__ import unicode_literals
 
-from nbdime import patch
+import copy
+
+from nbformat import NotebookNode
+
+from nbdime import patch, patch_notebook, diff, diff_notebooks
 from nbdime.diff_format import op_patch, op_add, op_remove, op_replace, op_addrange, op_removerange
 
+from .fixtures import matching_nb_pairs
+
 
 # TODO: Add tests for invalid input and error handling
 # TODO: Add more corner cases (combinations of delete-then-add etc.)
@@ -91,3 +97,90 @@ def test_patch_dict():
     # Test !, item patch
     subdiff = [op_patch(0, [op_patch(0, [op_replace(0, "H")])]), op_patch(1, [op_patch(0, [op_remove(0), op_add(0, "W")])])]
     assert patch({"a": ["hello", "world"], "b": 3}, [op_patch("a", subdiff)]) == {"a": ["Hello", "World"], "b": 3}
+
+
+def test_patch_share():
+    base = {"a": [{"x": 1}, {"y": 2}, {"z": [3]}], "b": {"c": "text\n"}, "d": [4]}
+    d = [op_patch("a", [op_patch(1, [op_replace("y", 5)]), op_addrange(3, [{"w": 6}])])]
+
+    copied = patch(base, d)
+    shared = patch(base, d, share=True)
+    assert shared == copied == {
+        "a": [{"x": 1}, {"y": 5}, {"z": [3]}, {"w": 6}], "b": {"c": "text\n"}, "d": [4]}
+
+    # Untouched subtrees are shared with base only in share mode
+    assert shared["b"] is base["b"]
+    assert shared["d"] is base["d"]
+    assert shared["a"][0] is base["a"][0]
+    assert shared["a"][2] is base["a"][2]
+    assert copied["b"] is not base["b"]
+    assert copied["a"][0] is not base["a"][0]
+
+    # Containers on the path to changes are rebuilt, leaving base intact
+    assert shared is not base
+    assert shared["a"] is not base["a"]
+    assert base["a"][1] == {"y": 2}
+
+    # Inserted values are not shared with the diff
+    assert shared["a"][3] == d[0].diff[1].valuelist[0]
+    assert shared["a"][3] is not d[0].diff[1].valuelist[0]
+
+
+def test_patch_notebook_share(matching_nb_pairs):
+    a, b = matching_nb_pairs
+    d = diff_notebooks(a, b)
+    expected = patch_notebook(a, d)
+    before = copy.deepcopy(a)
+    shared = patch_notebook(a, d, share=True)
+    assert shared == expected
+    assert a == before
+    # The result is a NotebookNode tree with attribute access
+    assert all(isinstance(cell, NotebookNode) for cell in shared.cells)
+
+
+def test_patch_multiline_string():
+    # Line based ops on multiline strings
+    s = "first\nsecond\nthird"
+    assert patch(s, [op_addrange(1, ["new\n"])]) == "first\nnew\nsecond\nthird"
+    assert patch(s, [op_removerange(0, 2)]) == "third"
+    assert patch(s, [op_removerange(1, 2)]) == "first\n"
+    assert patch(s, [op_addrange(3, ["\nfourth"])]) == s + "\nfourth"
+    assert patch(s, [op_patch(1, [op_replace(0, "S")]), op_patch(2, [op_addrange(5, "!")])]) == "first\nSecond\nthird!"
+    assert patch(s, [op_addrange(1, ["x\n"]), op_removerange(1, 1)]) == "first\nx\nthird"
+    assert patch(s, [op_replace(1, "2nd\n"), op_remove(2)]) == "first\n2nd\n"
+
+
+def test_patch_multiline_string_same_line_twice():
+    # Merge actions like local_then_remote concatenate diffs patching the same line
+    s = "x = 1\nprint(x * y)"
+    d = [
+        op_patch(1, [op_addrange(11, " / z")]),
+        op_patch(1, [op_addrange(8, "+"), op_removerange(8, 1)]),
+        ]
+    assert patch(s, d) == "x = 1\nprint(x + y / z)"
+    assert patch(s + "\n", d) == "x = 1\nprint(x + y / z)\n"
+
+
+def test_patch_multiline_string_unsorted():
+    # Merge actions concatenate diffs of both sides, which need not be sorted
+    s = "a\nb\nc\nd\n"
+    d = [op_addrange(3, ["x\n"]), op_patch(1, [op_replace(0, "B")])]
+    assert patch(s, d) == "a\nB\nc\nx\nd\n"
+    d = [op_removerange(1, 2), op_patch(0, [op_replace(0, "A")])]
+    assert patch(s, d) == "A\nd\n"
+    d = [op_patch(2, [op_addrange(1, "!")]), op_patch(0, [op_replace(0, "A")]),
+         op_patch(2, [op_replace(0, "C")])]
+    assert patch(s, d) == "A\nb\nC!\nd\n"
+
+
+def test_patch_string_roundtrip():
+    strings = [
+        "", "\n", "a", "a\n", "a\nb", "a\nb\n", "a\r\nb\r\n", "\n\n\n",
+        "def f(x):\n    return x\n",
+        "def f(x, y):\n    # comment\n    return x + y\n\nprint(f(1, 2))",
+        "some text\nwith\nlines that change a bit\n",
+        "some text\nwith\nlines that changed a bit\nand more",
+        ]
+    for a in strings:
+        for b in strings:
+            assert patch(a, diff(a, b)) == b
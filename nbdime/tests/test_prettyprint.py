@@ -15,6 +15,10 @@ except ImportError:
 import os
 from six import StringIO
 from pprint import pformat
+try:
+    from shutil import which
+except ImportError:
+    from backports.shutil_which import which
 try:
     from unittest import mock
 except ImportError:
@@ -22,6 +26,7 @@ except ImportError:
 
 import hashlib
 
+import pytest
 from nbformat import v4
 
 from nbdime import prettyprint as pp
@@ -321,7 +326,7 @@ def test_pretty_print_string_diff(nocolor):
     path = '/a/b'
     di = diff(a, b, path=path)
 
-    with mock.patch('nbdime.prettyprint.which', lambda cmd: None):
+    with mock.patch.multiple('nbdime.prettyprint', which=lambda cmd: None, use_external=True):
         io = StringIO()
         pp.pretty_print_diff(a, di, path, io)
         text = io.getvalue()
@@ -352,3 +357,38 @@ def test_pretty_print_string_diff_b64(nocolor):
         '+  %s...<snip base64, md5=%s...>' % (b[:8], hb[:16]),
         '',
     ]
+
+
+render_cases = [
+    ('', 'a\n', 'b\n'),
+    ('a\nb\nc\n', 'a\nB\nc\n', 'a\nb\nC\n'),
+    ('a\nb\nc\n', 'a\nB\nc\n', 'a\nb2\nc\n'),
+    ('def f():\n    return 1\n', 'def f():\n    return 2\n', 'def f():\n    return 3'),
+    ('x = 1\n\ny = 2\n', 'x = 1\n\n\ny = 2\nz = 3\n', 'x = 0\n\ny = 2\nz = 3\n'),
+    ('\n'.join('line %d' % i for i in range(20)),
+     '\n'.join('line %d' % (i if i != 3 else 33) for i in range(20)),
+     '\n'.join('line %d' % (i if i not in (3, 17) else -i) for i in range(20))),
+    ]
+
+
+@pytest.mark.skipif(not which('git'), reason="Missing git.")
+@pytest.mark.parametrize("b,l,r", render_cases)
+@pytest.mark.parametrize("strategy", [None, "use-local", "use-remote", "union"])
+def test_merge_render_in_process_like_git(b, l, r, strategy):
+    assert pp.merge_render_in_process(b, l, r, strategy) == pp.merge_render_with_git(b, l, r, strategy)
+
+
+@pytest.mark.skipif(not which('git'), reason="Missing git.")
+@pytest.mark.parametrize("b,l,r", render_cases)
+def test_diff_render_in_process_like_git(b, l, r, nocolor):
+    for x, y in [(b, l), (l, r), (r, b)]:
+        assert pp.diff_render_in_process(x, y) == pp.diff_render_with_git(x, y)
+
+
+def test_renders_spawn_no_processes():
+    b, l, r = render_cases[2]
+    with mock.patch('nbdime.prettyprint.Popen', side_effect=AssertionError):
+        merged = pp.merge_render(b, l, r)
+        diff = pp.diff_render(b, l)
+    assert merged == 'a\n<<<<<<< local\nB\n=======\nb2\n>>>>>>> remote\nc\n'
+    assert diff.startswith('@@ -1,3 +1,3 @@\n a\n')
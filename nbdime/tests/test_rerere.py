@@ -0,0 +1,149 @@
+# coding: utf-8
+
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+from __future__ import unicode_literals
+
+import copy
+import os
+import time
+
+import nbformat
+
+from nbdime import apply_decisions
+from nbdime.merging.notebooks import decide_notebook_merge
+from nbdime.merging.rerere import MergeCache
+from nbdime import gitmergedriver
+from nbdime.nbmergeapp import _build_arg_parser
+
+from .fixtures import sources_to_notebook, matching_nb_triplets
+
+
+builder = _build_arg_parser()
+args = builder.parse_args(["", "", ""])
+# The web mergetool leaves conflicts to the user
+tool_args = builder.parse_args(["", "", ""])
+tool_args.merge_strategy = "mergetool"
+
+
+def conflicting_notebooks():
+    base = sources_to_notebook([["cell %d\n" % i] for i in range(6)])
+    local = copy.deepcopy(base)
+    remote = copy.deepcopy(base)
+    local.cells[2].source = "local 2\n"
+    remote.cells[2].source = "remote 2\n"
+    remote.cells[4].source = "remote 4\n"
+    return base, local, remote
+
+
+def resolve_as(decisions, action):
+    resolved = []
+    for md in decisions:
+        if md.conflict:
+            md = copy.copy(md)
+            md.action = action
+            md.conflict = False
+        resolved.append(md)
+    return resolved
+
+
+def test_rerere_reuses_decisions(tmpdir, matching_nb_triplets):
+    base, local, remote = matching_nb_triplets
+    cache = MergeCache(str(tmpdir))
+    expected = apply_decisions(base, decide_notebook_merge(base, local, remote, args))
+    for i in range(2):
+        decisions = cache.decide_notebook_merge(base, local, remote, args)
+        assert apply_decisions(base, decisions) == expected
+    assert os.listdir(str(tmpdir)) == ["decisions"]
+
+
+def test_rerere_replays_resolution(tmpdir):
+    base, local, remote = conflicting_notebooks()
+    cache = MergeCache(str(tmpdir))
+    decisions = cache.decide_notebook_merge(base, local, remote, tool_args)
+    assert any(md.conflict for md in decisions)
+
+    # Nothing is recorded for conflicts left unresolved
+    merged = apply_decisions(base, resolve_as(decisions, "local"))
+    unresolved = [md.common_path for md in decisions if md.conflict]
+    assert cache.record_resolutions(base, decisions, merged, unresolved) == 0
+
+    merged.cells[2].source = "resolved 2\n"
+    assert cache.record_resolutions(base, decisions, merged) == 1
+
+    # Replayed with either strategy
+    for a in (args, tool_args):
+        decisions = cache.decide_notebook_merge(base, local, remote, a)
+        assert not any(md.conflict for md in decisions)
+        assert apply_decisions(base, decisions) == merged
+
+
+def test_rerere_replays_resolution_in_moved_cell(tmpdir):
+    base, local, remote = conflicting_notebooks()
+    cache = MergeCache(str(tmpdir))
+    decisions = cache.decide_notebook_merge(base, local, remote, tool_args)
+    merged = apply_decisions(base, resolve_as(decisions, "remote"))
+    merged.cells[2].source = "local 2\nremote 2\n"
+    assert cache.record_resolutions(base, decisions, merged) == 1
+
+    # The same conflict after new cells are added on both sides,
+    # as when rebasing the branches on a later base
+    first = nbformat.v4.new_code_cell("first\n")
+    later = nbformat.v4.new_code_cell("later\n")
+    for nb in (base, local, remote):
+        nb.cells.insert(0, copy.deepcopy(first))
+        nb.cells.insert(5, copy.deepcopy(later))
+    decisions = cache.decide_notebook_merge(base, local, remote, args)
+    assert not any(md.conflict for md in decisions)
+    merged = apply_decisions(base, decisions)
+    assert [c.source for c in merged.cells] == [
+        "first\n", "cell 0\n", "cell 1\n", "local 2\nremote 2\n",
+        "cell 3\n", "later\n", "remote 4\n", "cell 5\n"]
+
+
+def set_mtimes(path, mtime):
+    for root, dirs, files in os.walk(path):
+        for fn in files:
+            os.utime(os.path.join(root, fn), (mtime, mtime))
+
+
+def records(path):
+    return [fn for root, dirs, files in os.walk(path) for fn in files]
+
+
+def test_rerere_gc(tmpdir):
+    base, local, remote = conflicting_notebooks()
+    cache = MergeCache(str(tmpdir))
+    decisions = cache.decide_notebook_merge(base, local, remote, tool_args)
+    merged = apply_decisions(base, resolve_as(decisions, "local"))
+    assert cache.record_resolutions(base, decisions, merged) == 1
+    assert cache.gc() == 0
+
+    # Decisions expire before resolutions
+    day = 24 * 60 * 60
+    set_mtimes(str(tmpdir), time.time() - 30 * day)
+    assert cache.gc() == 1
+    assert records(str(tmpdir.join("decisions"))) == []
+    assert len(records(str(tmpdir.join("resolutions")))) == 1
+
+    # Using a record keeps it
+    set_mtimes(str(tmpdir), time.time() - 90 * day)
+    cache.resolve_known_conflicts(base, decisions)
+    assert cache.gc() == 0
+    assert cache.gc(now=time.time() + 90 * day) == 1
+    assert records(str(tmpdir)) == []
+
+
+def test_rerere_gc_command(git_repo, monkeypatch):
+    cache = MergeCache.in_repository(git_repo)
+    base, local, remote = conflicting_notebooks()
+    cache.decide_notebook_merge(base, local, remote, args)
+    monkeypatch.chdir(git_repo)
+    assert gitmergedriver.main(["rerere-gc"]) == 0
+    assert len(records(cache.path)) == 1
+
+
+def test_rerere_cache_in_repository(git_repo):
+    cache = MergeCache.in_repository(git_repo)
+    assert cache.path == os.path.join(git_repo, ".git", "nbdime", "rerere")
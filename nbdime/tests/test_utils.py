@@ -3,7 +3,7 @@ import os
 import shutil
 import tempfile
 
-from nbdime.utils import strings_to_lists, revert_strings_to_lists, is_in_repo
+from nbdime.utils import strings_to_lists, revert_strings_to_lists, is_in_repo, Strategies
 
 def test_string_to_lists():
     obj = {"c": [{"s": "ting\ntang", "o": [{"ot": "stream"}]}]}
@@ -11,6 +11,18 @@ def test_string_to_lists():
     obj3 = revert_strings_to_lists(obj2)
     assert obj3 == obj
 
+def test_strategies_lookup():
+    strategies = Strategies({"/cells/*/source": "inline-source", "/metadata": "use-base"})
+    assert strategies.get("/cells/3/source") == "inline-source"
+    assert strategies.get(("cells", 3, "source")) == "inline-source"
+    assert strategies.get("/cells/3") is None
+    assert strategies.get("/cells/3/outputs", "default") == "default"
+    # Lookups follow changes to the strategies
+    strategies.update({"/cells/*/outputs": "clear-all"})
+    strategies["/metadata"] = "use-local"
+    assert strategies.get(("cells", 0, "outputs")) == "clear-all"
+    assert strategies.get("/metadata") == "use-local"
+
 def test_is_repo():
     try:
         tmpdir = tempfile.mkdtemp(prefix='nbdime-test')
@@ -70,18 +70,21 @@ def join_path(*args):
 
 r_is_int = re.compile(r"^[-+]?\d+$")
 
+
+def star_key(key):
+    """Replace an integer or integer-string path key with * """
+    if isinstance(key, int):
+        return '*'
+    if not isinstance(key, text_type):
+        key = key.decode()
+    if r_is_int.match(key):
+        return '*'
+    return key
+
+
 def star_path(path):
     """Replace integers and integer-strings in a path with * """
-    path = list(path)
-    for i, p in enumerate(path):
-        if isinstance(p, int):
-            path[i] = '*'
-        else:
-            if not isinstance(p, text_type):
-                p = p.decode()
-            if r_is_int.match(p):
-                path[i] = '*'
-    return join_path(path)
+    return join_path([star_key(p) for p in path])
 
 
 def resolve_path(obj, path):
@@ -93,16 +96,78 @@ def resolve_path(obj, path):
 class Strategies(dict):
     """Simple dict wrapper for strategies to allow for wildcard matching of
     list indices + transients collection.
+
+    Strategies are looked up in a trie of the path keys of the strategy
+    paths, compiled on the first lookup after the strategies change, such
+    that a lookup walks the path once without building strings.
     """
     def __init__(self, *args, **kwargs):
         self.transients = kwargs.pop("transients", [])
         self.fall_back = kwargs.pop("fall_back", None)
+        self._trie = None
         super(Strategies, self).__init__(*args, **kwargs)
 
+    def _compiled(self):
+        if self._trie is None:
+            # Nodes map path keys to child nodes, and None to the strategy
+            trie = {}
+            for path, strategy in self.items():
+                keys = split_path(path)
+                if join_path(keys) != path:
+                    # Paths not on the starred form are never matched
+                    continue
+                node = trie
+                for key in keys:
+                    node = node.setdefault(key, {})
+                node[None] = strategy
+            self._trie = trie
+        return self._trie
+
     def get(self, k, d=None):
-        parts = split_path(k)
-        key = star_path(parts)
-        return super(Strategies, self).get(key, d)
+        """Get the strategy for path k, with list indices matching *.
+
+        The path is either a string like '/cells/0/source' or a sequence
+        of keys like ('cells', 0, 'source').
+        """
+        node = self._compiled()
+        if isinstance(k, string_types):
+            k = split_path(k)
+        for key in k:
+            node = node.get(star_key(key))
+            if node is None:
+                return d
+        return node.get(None, d)
+
+    def _changed(self):
+        self._trie = None
+
+    def __setitem__(self, key, value):
+        self._changed()
+        super(Strategies, self).__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self._changed()
+        super(Strategies, self).__delitem__(key)
+
+    def update(self, *args, **kwargs):
+        self._changed()
+        super(Strategies, self).update(*args, **kwargs)
+
+    def setdefault(self, key, default=None):
+        self._changed()
+        return super(Strategies, self).setdefault(key, default)
+
+    def pop(self, *args):
+        self._changed()
+        return super(Strategies, self).pop(*args)
+
+    def popitem(self):
+        self._changed()
+        return super(Strategies, self).popitem()
+
+    def clear(self):
+        self._changed()
+        super(Strategies, self).clear()
 
 
 def is_in_repo(pkg_path):
@@ -152,6 +217,21 @@ def locate_gitattributes(global_=False):
     return gitattributes
 
 
+def locate_gitdir(path=None):
+    """Locate the .git directory of the repository containing path
+
+    path defaults to the current directory. Returns None if path is not
+    in a git repository.
+    """
+    path = os.path.abspath(path or '.')
+    try:
+        with open(os.devnull, 'w') as devnull:
+            gitdir = check_output(['git', 'rev-parse', '--git-dir'],
+                                  cwd=path, stderr=devnull)
+    except (CalledProcessError, OSError):
+        return None
+    return os.path.join(path, gitdir.decode('utf8', 'replace').strip())
+
 
 def is_prefix_array(parent, child):
     if parent == child:
@@ -9,15 +9,25 @@ import json
 import logging
 import os
 import sys
+import uuid
 from argparse import ArgumentParser
+from collections import OrderedDict
 
 import requests
 from six import string_types
-from tornado import ioloop, web, escape, netutil, httpserver
+from tornado import ioloop, web, escape, netutil, httpserver, gen
 import nbformat
 
 import nbdime
 from nbdime.merging.notebooks import decide_notebook_merge
+from nbdime.merging.rerere import MergeCache
+from nbdime.merging.session import MergeSession
+from nbdime.diffing.notebooks import diff_cell_range
+from nbdime.jsonstream import iter_json
+from nbdime.blobs import MemoryBlobStore, externalize_blobs
+from nbdime.diff_index import DiffIndex, as_path_tuple
+from nbdime.diff_format import to_diffentry_dicts
+from nbdime.utils import resolve_path
 from nbdime.nbmergeapp import _build_arg_parser as build_merge_parser
 
 from nbdime.args import add_generic_args, add_web_args
@@ -33,6 +43,17 @@ from nbdime.args import add_generic_args, add_web_args
 _logger = logging.getLogger(__name__)
 
 
+# Number of merge sessions kept by the server, the oldest are dropped
+max_merge_sessions = 8
+
+# Bytes of large diff values kept for clients to fetch from /api/blob,
+# the least recently used are dropped
+max_blob_bytes = 256 * 1024 * 1024
+
+# Number of indexed diffs kept for requests of the diff at a path
+max_diff_indices = 8
+
+
 here = os.path.abspath(os.path.dirname(__file__))
 static_path = os.path.join(here, "static")
 template_path = os.path.join(here, "templates")
@@ -58,6 +79,25 @@ class NbdimeApiHandler(web.RequestHandler):
             "savable": fn is not None
         }
 
+    def merge_args(self):
+        merge_args = self.settings.get('merge_args')
+        if merge_args is None:
+            merge_args = build_merge_parser().parse_args(["", "", ""])
+            merge_args.merge_strategy = 'mergetool'
+            self.settings['merge_args'] = merge_args
+        return merge_args
+
+    def merge_cache(self):
+        "The cache of recorded merges, if the server was run with rerere enabled."
+        if not self.params.get("rerere", False):
+            return None
+        return MergeCache.in_repository(self.params["cwd"])
+
+    def get_json_argument(self, argname, default=None):
+        # Assuming a request on the form "{'argname':arg}"
+        body = json.loads(escape.to_unicode(self.request.body))
+        return body.get(argname, default)
+
     def get_notebook_argument(self, argname):
         # Assuming a request on the form "{'argname':arg}"
         body = json.loads(escape.to_unicode(self.request.body))
@@ -86,6 +126,19 @@ class NbdimeApiHandler(web.RequestHandler):
 
         return nb
 
+    @gen.coroutine
+    def finish_json(self, data):
+        """Write data as JSON in chunks, flushing each to the client.
+
+        Avoids building the full response string for large notebooks
+        and diffs, as `self.finish(data)` would do.
+        """
+        self.set_header("Content-Type", "application/json; charset=UTF-8")
+        for chunk in iter_json(data):
+            self.write(chunk)
+            yield self.flush()
+        self.finish()
+
 
 class MainHandler(NbdimeApiHandler):
     def get(self):
@@ -141,37 +194,124 @@ class MainMergetoolHandler(NbdimeApiHandler):
 
 
 class ApiDiffHandler(NbdimeApiHandler):
-    def post(self):
-        base_nb = self.get_notebook_argument("base")
-        remote_nb = self.get_notebook_argument("remote")
+    def diff_key(self):
+        """A key identifying the diff asked for, None if it can not be cached.
+
+        Diffs of notebook files are identified by the arguments of the
+        request and the modification times of the files.
+        """
+        body = json.loads(escape.to_unicode(self.request.body))
+        key = [[k, body[k]] for k in sorted(body) if k not in ("path", "blobs")]
+        for argname in ("base", "remote"):
+            arg = body.get(argname)
+            if not isinstance(arg, string_types):
+                return None
+            path = os.path.join(self.params["cwd"], arg)
+            if not os.path.exists(path):
+                return None
+            key.append(os.path.getmtime(path))
+        return json.dumps(key)
+
+    def diff(self, base_nb, remote_nb):
+        # Moved cells are only sent as move entries to clients asking for them
+        detect_moves = self.get_json_argument("moves", False)
+        # Paths to include or exclude (prefixed with '!') from the diff
+        filters = self.get_json_argument("filters", None)
+        if filters is not None and not (
+                isinstance(filters, list) and
+                all(isinstance(f, string_types) for f in filters)):
+            raise web.HTTPError(400, "Invalid filters: expected a list of paths")
+        # Range [start, stop) of base cells to diff, null for open ends
+        cells = self.get_json_argument("cells", None)
+        if cells is not None and not (
+                isinstance(cells, list) and len(cells) == 2 and
+                all(c is None or isinstance(c, int) for c in cells)):
+            raise web.HTTPError(400, "Invalid cells: expected [start, stop]")
 
         try:
-            thediff = nbdime.diff_notebooks(base_nb, remote_nb)
+            if cells is not None:
+                return diff_cell_range(base_nb, remote_nb, cells[0], cells[1],
+                                       filters=filters)
+            else:
+                return nbdime.diff_notebooks(base_nb, remote_nb, detect_moves=detect_moves,
+                                             filters=filters)
         except Exception:
             nbdime.log.exception("Error diffing documents:")
             raise web.HTTPError(500, "Error while attempting to diff documents")
 
+    def indexed_diff(self):
+        """Return the base notebook and a DiffIndex of the diff asked for.
+
+        Clients asking for the diffs at several paths of the same notebooks
+        reuse the diff and its index, which are kept for the last diffs.
+        """
+        indices = self.application.diff_indices
+        key = self.diff_key()
+        if key in indices:
+            # Move to the end, the oldest are dropped first
+            indices[key] = indices.pop(key)
+            return indices[key]
+        base_nb = self.get_notebook_argument("base")
+        remote_nb = self.get_notebook_argument("remote")
+        indexed = base_nb, DiffIndex(self.diff(base_nb, remote_nb))
+        if key is not None:
+            indices[key] = indexed
+            while len(indices) > max_diff_indices:
+                indices.popitem(last=False)
+        return indexed
+
+    @gen.coroutine
+    def post(self):
+        path = self.get_json_argument("path")
+        if path:
+            # Send only the value at path, e.g. "/cells/3", and its diff
+            base_nb, index = self.indexed_diff()
+            try:
+                base_value = resolve_path(base_nb, as_path_tuple(path))
+            except (KeyError, IndexError, TypeError):
+                raise web.HTTPError(400, "Invalid path: %s" % path)
+            thediff = index.diff_at(path)
+        else:
+            base_value = self.get_notebook_argument("base")
+            remote_nb = self.get_notebook_argument("remote")
+            thediff = self.diff(base_value, remote_nb)
+
+        if self.get_json_argument("blobs", False):
+            # Send large values once, for the client to fetch from /api/blob
+            thediff = externalize_blobs(thediff, self.application.blob_store)
+
         data = {
-            "base": base_nb,
+            "base": base_value,
             "diff": thediff,
             }
-        self.finish(data)
+        if path:
+            data["path"] = path
+        yield self.finish_json(data)
 
 
 class ApiMergeHandler(NbdimeApiHandler):
+    @gen.coroutine
     def post(self):
         base_nb = self.get_notebook_argument("base")
         local_nb = self.get_notebook_argument("local")
         remote_nb = self.get_notebook_argument("remote")
-        merge_args = self.settings.get('merge_args')
-        if merge_args is None:
-            merge_args = build_merge_parser().parse_args(["", "", ""])
-            merge_args.merge_strategy = 'mergetool'
-            self.settings['merge_args'] = merge_args
+        merge_args = self.merge_args()
+        cache = self.merge_cache()
+        # Keep the merge on the server for incremental updates, see
+        # ApiMergeSessionHandler
+        use_session = self.get_json_argument("session", False)
 
         try:
-            decisions = decide_notebook_merge(base_nb, local_nb, remote_nb,
-                                              args=merge_args)
+            if use_session:
+                session = MergeSession(base_nb, local_nb, remote_nb,
+                                       args=merge_args, cache=cache)
+                decisions = session.decisions()
+            elif cache is not None:
+                decisions = cache.decide_notebook_merge(
+                    base_nb, local_nb, remote_nb, args=merge_args)
+            else:
+                decisions = decide_notebook_merge(base_nb, local_nb, remote_nb,
+                                                  args=merge_args)
         except Exception:
             nbdime.log.exception("Error merging documents:")
             raise web.HTTPError(500, "Error while attempting to merge documents")
@@ -180,7 +320,72 @@ class ApiMergeHandler(NbdimeApiHandler):
             "base": base_nb,
             "merge_decisions": decisions
             }
-        self.finish(data)
+        if use_session:
+            sessions = self.application.merge_sessions
+            key = uuid.uuid4().hex
+            sessions[key] = session
+            while len(sessions) > max_merge_sessions:
+                sessions.popitem(last=False)
+            data["session"] = key
+            data["decision_ids"] = session.ids()
+        yield self.finish_json(data)
+
+
+class ApiMergeSessionHandler(NbdimeApiHandler):
+    """Incremental updates of a merge session started by ApiMergeHandler.
+
+    Requests on the form {"pick": {"ids": [...], "action": ...}} pick the
+    action of decisions, with a "custom_diff" for custom actions, and
+    requests on the form {"cells": {"side": ..., "start": ..., "stop": ...,
+    "cells": [...]}} replace the cells [start, stop) of the local or remote
+    notebook. Responses hold the changes to the decisions, see MergeSession.
+    """
+
+    def get_session(self, key):
+        try:
+            return self.application.merge_sessions[key]
+        except KeyError:
+            raise web.HTTPError(404, "Unknown merge session %s" % key)
+
+    @gen.coroutine
+    def post(self, key):
+        session = self.get_session(key)
+        pick = self.get_json_argument("pick")
+        cells = self.get_json_argument("cells")
+        if pick is None and cells is None:
+            raise web.HTTPError(400, "Expecting a pick or cells to update.")
+
+        try:
+            if pick is not None:
+                custom_diff = pick.get("custom_diff")
+                if custom_diff is not None:
+                    custom_diff = to_diffentry_dicts(custom_diff)
+                delta = session.pick(pick["ids"], pick["action"], custom_diff)
+            else:
+                delta = session.update_cells(
+                    cells["side"], cells["start"], cells["stop"],
+                    [nbformat.from_dict(c) for c in cells["cells"]])
+        except (KeyError, TypeError, ValueError) as e:
+            raise web.HTTPError(400, "Invalid merge session update: %s" % e)
+        except Exception:
+            nbdime.log.exception("Error merging documents:")
+            raise web.HTTPError(500, "Error while attempting to merge documents")
+        yield self.finish_json(delta)
+
+    def delete(self, key):
+        self.get_session(key)
+        del self.application.merge_sessions[key]
+        self.finish()
+
+
+class ApiBlobHandler(NbdimeApiHandler):
+    @gen.coroutine
+    def get(self, key):
+        try:
+            value = self.application.blob_store.get(key)
+        except KeyError:
+            raise web.HTTPError(404, "Unknown blob %s" % key)
+        yield self.finish_json(value)
 
 
 class ApiMergeStoreHandler(NbdimeApiHandler):
@@ -204,6 +409,18 @@ class ApiMergeStoreHandler(NbdimeApiHandler):
 
         with io.open(path, "w", encoding="utf8") as f:
             nbformat.write(merged_nb, f)
+
+        cache = self.merge_cache()
+        if cache is not None and "mergetool_args" in self.params:
+            # Record the resolutions of the conflicts of the merge for reuse
+            notebooks = [
+                nbformat.read(os.path.join(self.params["cwd"], self.params["mergetool_args"][name]),
+                              as_version=4)
+                for name in ("base", "local", "remote")]
+            decisions = cache.decide_notebook_merge(*notebooks, args=self.merge_args())
+            unresolved = [md["common_path"] for md in body.get("conflicts", ())]
+            recorded = cache.record_resolutions(notebooks[0], decisions, merged_nb, unresolved)
+            nbdime.log.info("Recorded %d conflict resolutions.", recorded)
         self.finish()
 
 
@@ -231,6 +448,8 @@ def make_app(**params):
         (r"/mergetool", MainMergetoolHandler, params),
         (r"/api/diff", ApiDiffHandler, params),
         (r"/api/merge", ApiMergeHandler, params),
+        (r"/api/merge/session/([0-9a-f]{32})", ApiMergeSessionHandler, params),
+        (r"/api/blob/([0-9a-f]{64})", ApiBlobHandler, params),
         (r"/api/store", ApiMergeStoreHandler, params),
         (r"/api/closetool", ApiCloseHandler, params),
         (r"/static", web.StaticFileHandler, {"path": static_path}),
@@ -252,6 +471,9 @@ def make_app(**params):
 
     app = web.Application(handlers, **settings)
     app.exit_code = 0
+    app.blob_store = MemoryBlobStore(max_bytes=max_blob_bytes)
+    app.merge_sessions = OrderedDict()
+    app.diff_indices = OrderedDict()
     return app
 
 
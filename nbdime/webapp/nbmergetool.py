@@ -76,6 +76,7 @@ def main_parsed(opts):
                       closable=True,
                       mergetool_args=dict(base=base, local=local, remote=remote),
                       outputfilename=merged,
+                      rerere=opts.rerere,
                       on_port=lambda port: browse(port, browsername))
 
 